@@ -0,0 +1,175 @@
+"""
+自适应检测步长调度
+
+推理跟不上视频源时，逐帧 cap.read() 会让视频文件越处理越落后、摄像头画面延迟越来越大。
+调度器根据实测的推理耗时和视频源帧率决定每隔几帧检测一次（步长）以及推理输入尺寸，
+使端到端延迟保持在目标值附近；检测到火灾/烟雾后在一段时间内恢复逐帧检测。
+被跳过的帧只 grab 不解码，开销很小。
+"""
+import math
+import threading
+import time
+
+from config import PredictionConfig
+
+
+class AdaptiveScheduler:
+    """按负载调整检测步长和输入尺寸
+
+    参数:
+        source_fps: 视频源帧率，可在打开视频源后通过 set_source_fps 更新
+        target_latency_ms: 目标端到端延迟（采集到后处理完成）
+        min_stride: 最小步长，即 vid_stride，1表示逐帧
+        max_stride: 最大步长
+        imgsz_levels: 可选的推理输入尺寸，从大到小；步长达到上限仍跟不上时降低尺寸
+        boost_seconds: 检测到目标后恢复逐帧检测的时长
+        boost_classes: 触发恢复逐帧检测的类别名
+        boost_conf: 触发所需的最低置信度
+        interval: 调整周期（秒）
+        smoothing: 耗时指数滑动平均系数
+    """
+
+    def __init__(self, source_fps=25.0, target_latency_ms=200, min_stride=1, max_stride=8,
+                 imgsz_levels=(640,), boost_seconds=5.0, boost_classes=('fire', 'smoke'),
+                 boost_conf=0.25, interval=0.5, smoothing=0.2):
+        self.source_fps = source_fps
+        self.target_latency = target_latency_ms / 1000
+        self.min_stride = max(1, int(min_stride))
+        self.max_stride = max(self.min_stride, int(max_stride))
+        self.imgsz_levels = tuple(imgsz_levels)
+        self.boost_seconds = boost_seconds
+        self.boost_classes = set(boost_classes)
+        self.boost_conf = boost_conf
+        self.interval = interval
+        self.smoothing = smoothing
+
+        self.stride = self.min_stride
+        self.level = 0  # 当前输入尺寸在 imgsz_levels 中的索引
+        self.inference_time = 0.0  # 推理耗时的滑动平均（秒）
+        self.latency = 0.0  # 端到端延迟的滑动平均（秒）
+        self.boost_until = 0.0
+        self.boosts = 0
+        self.skipped = 0
+        self._level_times = {}  # 各输入尺寸下的推理耗时，用于判断能否升回大尺寸
+        self._last_adjust = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @property
+    def imgsz(self):
+        return self.imgsz_levels[self.level]
+
+    @property
+    def boosting(self):
+        return time.perf_counter() < self.boost_until
+
+    @property
+    def current_stride(self):
+        """当前实际使用的检测步长（加速期间逐帧检测）"""
+        return 1 if self.boosting else self.stride
+
+    def set_source_fps(self, fps):
+        """视频源帧率，无法获取（0或NaN）时保持默认值"""
+        if fps and fps > 0 and not math.isnan(fps):
+            self.source_fps = fps
+
+    def should_detect(self, frame_index):
+        """采集阶段调用：当前帧是否需要解码并检测，其余帧只 grab 跳过"""
+        if frame_index % self.current_stride == 0:
+            return True
+        self.skipped += 1
+        return False
+
+    def _ema(self, old, new):
+        return new if old == 0.0 else old + self.smoothing * (new - old)
+
+    def record_inference(self, seconds, imgsz=None):
+        """推理阶段调用：记录一次推理耗时"""
+        with self._lock:
+            self.inference_time = self._ema(self.inference_time, seconds)
+            size = imgsz or self.imgsz
+            self._level_times[size] = self._ema(self._level_times.get(size, 0.0), seconds)
+
+    def record_latency(self, seconds):
+        """后处理阶段调用：记录一帧的端到端延迟并按周期调整"""
+        with self._lock:
+            self.latency = self._ema(self.latency, seconds)
+            now = time.perf_counter()
+            if now - self._last_adjust >= self.interval:
+                self._last_adjust = now
+                self._adjust()
+
+    def observe(self, results):
+        """检测到火灾/烟雾时进入逐帧检测模式"""
+        for result in results or []:
+            boxes = result.boxes
+            if boxes is None or len(boxes) == 0:
+                continue
+            data = boxes.data.cpu().numpy() if hasattr(boxes.data, 'cpu') else boxes.data
+            for conf, cls_id in zip(data[:, -2], data[:, -1]):
+                if conf >= self.boost_conf and result.names.get(int(cls_id)) in self.boost_classes:
+                    if not self.boosting:
+                        self.boosts += 1
+                    self.boost_until = time.perf_counter() + self.boost_seconds
+                    return True
+        return False
+
+    def _required_stride(self, inference_time):
+        """推理吞吐能跟上视频源所需的最小步长"""
+        return max(self.min_stride, math.ceil(inference_time * self.source_fps))
+
+    def _adjust(self):
+        current = self._level_times.get(self.imgsz) or self.inference_time
+        if not current:
+            return
+
+        required = self._required_stride(current)
+        if self.latency > self.target_latency:
+            # 延迟超标：至少加大到能跟上的步长，仍超标则继续加大
+            stride = max(required, self.stride + 1)
+        elif self.latency < self.target_latency * 0.5:
+            # 延迟宽裕：逐步减小步长，但不低于能跟上的步长
+            stride = max(required, self.stride - 1)
+        else:
+            stride = max(required, self.stride)
+
+        if stride > self.max_stride and self.level + 1 < len(self.imgsz_levels):
+            # 最大步长也跟不上，降低输入尺寸
+            self.level += 1
+            stride = self.max_stride
+        elif self.level > 0 and self.latency < self.target_latency * 0.5:
+            # 上一级尺寸的耗时未知时按像素数估算
+            larger = self.imgsz_levels[self.level - 1]
+            estimate = self._level_times.get(larger) or current * (larger / self.imgsz) ** 2
+            if self._required_stride(estimate) <= max(self.min_stride, self.max_stride // 2):
+                self.level -= 1
+
+        self.stride = min(self.max_stride, stride)
+
+    def stats(self):
+        return {
+            'stride': self.current_stride,
+            'imgsz': self.imgsz,
+            'boosting': self.boosting,
+            'boosts': self.boosts,
+            'skipped': self.skipped,
+            'inference_ms': self.inference_time * 1000,
+            'latency_ms': self.latency * 1000,
+            'source_fps': self.source_fps,
+        }
+
+
+def create_scheduler(fixed_imgsz=False, min_stride=None):
+    """按 PredictionConfig 中的自适应调度配置创建调度器
+
+    fixed_imgsz=True 时只调整步长，用于输入尺寸固定的模型（如OpenVINO导出模型）；
+    min_stride 默认取 PredictionConfig.vid_stride。
+    """
+    levels = (PredictionConfig.imgsz,) if fixed_imgsz else PredictionConfig.adaptive_imgsz_levels
+    return AdaptiveScheduler(
+        target_latency_ms=PredictionConfig.target_latency_ms,
+        min_stride=min_stride or PredictionConfig.vid_stride,
+        max_stride=PredictionConfig.max_stride,
+        imgsz_levels=levels,
+        boost_seconds=PredictionConfig.boost_seconds,
+        boost_conf=PredictionConfig.conf_threshold,
+    )
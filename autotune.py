@@ -0,0 +1,568 @@
+"""
+批量大小与线程数自动调优
+
+按本机硬件探测并选择训练和批量推理的参数，结果和探测耗时保存在 <profile_dir>/<主机名>.json，
+之后在同一台机器上直接使用；CPU核数、内存或GPU变化后自动重新探测。
+
+训练（train.py --autotune）:
+    - batch_size: 用随机输入做前向+反向+优化器更新，批量逐步翻倍，选择显存峰值不超过
+      memory_fraction 的最大批量（CPU上选择吞吐不再提升前的最大批量），多GPU时为单卡批量 × GPU数
+    - workers: 以所选批量下模型每秒消耗的图片数为目标，测量训练集（含数据增强）在不同workers下
+      DataLoader的吞吐，选择能跟上模型的最少workers
+推理（firedetect batch/serve --autotune）:
+    - threads: CPU后端（ONNX Runtime、PyTorch CPU）的算子内线程数
+    - batch_size: 吞吐不再明显提升前的最小批量
+    - decode_workers: 按单线程解码速度计算跟上推理所需的解码线程数
+
+用法:
+    python autotune.py train --config configs/improved_exp.yaml
+    python autotune.py infer --model weights/best.pt --backend onnx --images data/val/images
+    python autotune.py show
+"""
+import argparse
+import json
+import math
+import os
+import socket
+import sys
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+import inference_backend
+from config import AutotuneConfig, PredictionConfig
+
+SECTION_TRAIN = 'train'
+SECTION_INFERENCE = 'inference'
+
+
+def total_memory():
+    """物理内存（字节），无法获取时返回None"""
+    try:
+        import psutil
+        return psutil.virtual_memory().total
+    except ImportError:
+        pass
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def available_memory():
+    """当前可用内存（字节），无法获取时返回None"""
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def gpu_info():
+    try:
+        import torch
+    except ImportError:
+        return []
+    if not torch.cuda.is_available():
+        return []
+    return [{'name': torch.cuda.get_device_name(i),
+             'memory_mb': torch.cuda.get_device_properties(i).total_memory // 2 ** 20}
+            for i in range(torch.cuda.device_count())]
+
+
+def machine_info():
+    """用于判断调优结果是否仍然适用的硬件信息"""
+    memory = total_memory()
+    return {
+        'host': socket.gethostname(),
+        'cpu_count': inference_backend.default_cpu_threads(),
+        'memory_mb': memory // 2 ** 20 if memory else None,
+        'gpus': gpu_info(),
+    }
+
+
+class TuningProfile:
+    """本机的调优结果，保存在 <profile_dir>/<主机名>.json；硬件变化后旧结果作废"""
+
+    def __init__(self, profile_dir=AutotuneConfig.profile_dir):
+        self.path = os.path.join(profile_dir, f"{socket.gethostname()}.json")
+        self.machine = machine_info()
+        self.data = {'machine': self.machine, SECTION_TRAIN: {}, SECTION_INFERENCE: {}}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('machine') == self.machine:
+                self.data = saved
+
+    def get(self, section, key):
+        return self.data[section].get(key)
+
+    def put(self, section, key, entry):
+        entry['tuned_at'] = datetime.now().isoformat(timespec='seconds')
+        self.data[section][key] = entry
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+        return entry
+
+
+def doubling(low, high):
+    values = []
+    value = low
+    while value <= high:
+        values.append(value)
+        value *= 2
+    return values
+
+
+def saturated(rates, gain=AutotuneConfig.plateau_gain):
+    """最近一次的吞吐相比之前的最好值提升不足 gain"""
+    return len(rates) > 1 and rates[-1] < max(rates[:-1]) * (1 + gain)
+
+
+def smallest_near_best(probes, value_key, rate_key, gain=AutotuneConfig.plateau_gain):
+    """吞吐在最好值 gain 以内的最小取值：更小的批量延迟更低，更少的线程留给解码"""
+    valid = [p for p in probes if p.get(rate_key)]
+    best = max(p[rate_key] for p in valid)
+    return min(p[value_key] for p in valid if p[rate_key] >= best / (1 + gain))
+
+
+def _is_oom(error):
+    return 'out of memory' in str(error).lower()
+
+
+# ---------------------------------------------------------------- 训练
+
+def torch_device(device):
+    """训练设备字符串中的第一个设备（单卡探测，多GPU时各卡相同）"""
+    import torch
+
+    if device == 'cpu' or (not device and not torch.cuda.is_available()):
+        return torch.device('cpu')
+    return torch.device(f"cuda:{device.split(',')[0] if device else 0}")
+
+
+def build_train_model(model_type, nc):
+    """探测用的检测模型：已有权重文件直接加载，官方名称按对应的yaml构建（不下载权重）"""
+    from ultralytics import YOLO
+    from ultralytics.nn.tasks import DetectionModel
+
+    if os.path.exists(model_type):
+        return YOLO(model_type).model
+    return DetectionModel(model_type.replace('.pt', '.yaml'), nc=nc, verbose=False)
+
+
+def probe_train_steps(net, device, imgsz, batches, amp, memory_fraction, steps, log=print):
+    """按批量依次做 steps 步前向+反向+优化器更新，返回每个批量的单步耗时和显存峰值
+
+    显存不足或峰值超过 memory_fraction 时停止；CPU上吞吐不再提升或可用内存低于 min_free_mb 时停止。
+    """
+    import torch
+
+    net = net.to(device).float().train()
+    for param in net.parameters():
+        param.requires_grad_(True)
+    optimizer = torch.optim.SGD(net.parameters(), lr=1e-4, momentum=0.9)
+    cuda = device.type == 'cuda'
+    use_amp = amp and cuda
+    scaler = torch.cuda.amp.GradScaler(enabled=use_amp)
+    budget = torch.cuda.get_device_properties(device).total_memory * memory_fraction if cuda else None
+
+    probes = []
+    for batch in batches:
+        x = preds = loss = None
+        probe = {'batch': batch, 'step_ms': None, 'peak_mb': None, 'ok': False}
+        free = None if cuda else available_memory()
+        if free is not None and free < AutotuneConfig.min_free_mb * 2 ** 20:
+            log(f"  batch={batch}: 可用内存仅剩 {free / 2 ** 20:.0f} MB，停止")
+            break
+        try:
+            if cuda:
+                torch.cuda.empty_cache()
+                torch.cuda.reset_peak_memory_stats(device)
+            x = torch.rand(batch, 3, imgsz, imgsz, device=device)
+            times = []
+            for step in range(steps + 1):
+                start = time.perf_counter()
+                with torch.autocast(device.type, enabled=use_amp):
+                    preds = net(x)
+                    loss = sum(p.float().mean() for p in preds)
+                optimizer.zero_grad(set_to_none=True)
+                scaler.scale(loss).backward()
+                scaler.step(optimizer)
+                scaler.update()
+                if cuda:
+                    torch.cuda.synchronize(device)
+                if step:  # 第一步包含cuDNN算法选择等初始化，不计入
+                    times.append(time.perf_counter() - start)
+            probe['step_ms'] = float(np.median(times)) * 1000
+            probe['images_per_second'] = batch / float(np.median(times))
+            if cuda:
+                peak = torch.cuda.max_memory_reserved(device)
+                probe['peak_mb'] = peak / 2 ** 20
+                probe['ok'] = peak <= budget
+            else:
+                probe['ok'] = True
+        except RuntimeError as e:
+            if not _is_oom(e):
+                raise
+        finally:
+            del x, preds, loss
+            optimizer.zero_grad(set_to_none=True)
+            if cuda:
+                torch.cuda.empty_cache()
+
+        probes.append(probe)
+        peak = f"，显存峰值 {probe['peak_mb']:.0f} MB" if probe['peak_mb'] else ''
+        log(f"  batch={batch}: " + (f"{probe['step_ms']:.1f} ms/步{peak}" if probe['step_ms'] else "显存不足"))
+        if not probe['ok']:
+            break
+        if not cuda and saturated([p['images_per_second'] for p in probes]):
+            break
+    return probes
+
+
+def choose_train_batch(net, device, imgsz, amp, log=print):
+    """翻倍找到上界后在最后一个可行批量和第一个不可行批量之间二分（步长8）"""
+    cfg = AutotuneConfig
+    probes = probe_train_steps(net, device, imgsz, doubling(cfg.train_min_batch, cfg.train_max_batch), amp,
+                               cfg.memory_fraction, cfg.train_probe_steps, log)
+    good = [p for p in probes if p['ok']]
+    if not good:
+        raise RuntimeError(f"batch={cfg.train_min_batch} 也无法在 {device} 上训练")
+    if device.type != 'cuda':
+        # CPU：吞吐饱和前的最大批量
+        rates = [p['images_per_second'] for p in good]
+        best = max(rates)
+        return max(p['batch'] for p in good if p['images_per_second'] >= best / (1 + cfg.plateau_gain)), probes
+
+    low = good[-1]['batch']
+    high = probes[-1]['batch'] if not probes[-1]['ok'] else None
+    while high is not None and high - low > 8:
+        mid = (low + high) // 2 // 8 * 8
+        if mid <= low:
+            break
+        probe = probe_train_steps(net, device, imgsz, [mid], amp, cfg.memory_fraction, cfg.train_probe_steps, log)[0]
+        probes.append(probe)
+        if probe['ok']:
+            low = mid
+        else:
+            high = mid
+    return low, probes
+
+
+def build_train_dataset(cfg, batch):
+    """与训练相同的训练集（含数据增强），配置了 image_store 时从存储读取"""
+    import yaml
+    from ultralytics.cfg import get_cfg
+    from ultralytics.data import YOLODataset
+
+    import dataset_store
+
+    with open(cfg['data_yaml'], 'r', encoding='utf-8') as f:
+        data = yaml.safe_load(f)
+    image_dir = dataset_store.resolve_split_dir(cfg['data_yaml'], 'train')
+    hyp = get_cfg(overrides={k: cfg[k] for k in ('imgsz', 'mosaic', 'mixup', 'copy_paste')})
+    common = dict(img_path=image_dir, imgsz=cfg['imgsz'], batch_size=batch, augment=True, hyp=hyp, data=data)
+    store = dataset_store.ImageStore.find(cfg['image_store'], image_dir, cfg['imgsz']) if cfg.get('image_store') else None
+    if store is not None:
+        dataset_store.make_store_trainer(cfg['image_store'])
+        return dataset_store.StoreDataset(store=store, **common)
+    return YOLODataset(**common)
+
+
+def probe_dataloader(dataset, batch, candidates, required, batches, log=print):
+    """测量不同workers下DataLoader的吞吐（张/秒），达到 required 后停止"""
+    from torch.utils.data import DataLoader
+
+    probes = []
+    for workers in candidates:
+        loader = DataLoader(dataset, batch_size=batch, shuffle=True, num_workers=workers,
+                            collate_fn=getattr(dataset, 'collate_fn', None))
+        iterator = iter(loader)
+        next(iterator)  # 启动worker进程，不计入
+        start = time.perf_counter()
+        count = 0
+        for _ in range(batches):
+            try:
+                count += len(next(iterator)['img'])
+            except StopIteration:
+                break
+        rate = count / (time.perf_counter() - start)
+        del iterator, loader
+        probes.append({'workers': workers, 'images_per_second': rate})
+        log(f"  workers={workers}: {rate:.0f} 张/秒（模型需要 {required:.0f} 张/秒）")
+        if rate >= required or saturated([p['images_per_second'] for p in probes]):
+            break
+    return probes
+
+
+def tune_training(cfg, log=print):
+    """探测训练批量和workers，cfg为 train.load_config 解析后的配置"""
+    import yaml
+    from train import device_count, normalize_device
+
+    device_text = normalize_device(cfg['device'])
+    gpus = max(1, device_count(device_text))
+    device = torch_device(device_text)
+    with open(cfg['data_yaml'], 'r', encoding='utf-8') as f:
+        nc = len(yaml.safe_load(f)['names'])
+
+    start = time.perf_counter()
+    log(f"探测训练批量（{cfg['model_type']}，imgsz={cfg['imgsz']}，{device}）...")
+    net = build_train_model(cfg['model_type'], nc)
+    per_device, batch_probes = choose_train_batch(net, device, cfg['imgsz'], cfg['amp'], log)
+    del net
+    step_ms = next(p['step_ms'] for p in reversed(batch_probes) if p['batch'] == per_device)
+    required = per_device / (step_ms / 1000) * AutotuneConfig.loader_margin
+
+    # ultralytics 每个进程最多使用 CPU核数/GPU数 个workers；CPU训练时计算本身也要占用核心
+    cores = inference_backend.default_cpu_threads()
+    max_workers = max(1, cores // gpus if device.type == 'cuda' else cores // 2)
+    candidates = sorted({w for w in (1, 2, 4, 6, 8, 12, 16, 24, 32) if w < max_workers} | {max_workers})
+    log(f"探测数据加载（单卡批量 {per_device}，每步 {step_ms:.0f} ms）...")
+    loader_probes = probe_dataloader(build_train_dataset(cfg, per_device), per_device, candidates, required,
+                                     AutotuneConfig.loader_batches, log)
+    fast_enough = [p['workers'] for p in loader_probes if p['images_per_second'] >= required]
+    workers = min(fast_enough) if fast_enough else max(loader_probes, key=lambda p: p['images_per_second'])['workers']
+
+    return {
+        'batch_size': per_device * gpus,
+        'workers': workers,
+        'per_device_batch': per_device,
+        'step_ms': step_ms,
+        'required_images_per_second': required,
+        'loader_bound': not fast_enough,
+        'probe_seconds': time.perf_counter() - start,
+        'probes': {'batch': batch_probes, 'workers': loader_probes},
+    }
+
+
+def train_key(cfg):
+    from train import normalize_device
+
+    source = 'store' if cfg.get('image_store') else 'images'
+    return (f"{cfg['model_type']}|imgsz={cfg['imgsz']}|device={normalize_device(cfg['device']) or 'auto'}"
+            f"|amp={cfg['amp']}|{source}|{cfg['data_yaml']}")
+
+
+def tuned_training(cfg, profile=None, force=False, log=print):
+    """返回本机的训练调优结果（含batch_size和workers），没有保存过时先探测"""
+    profile = profile or TuningProfile()
+    key = train_key(cfg)
+    entry = None if force else profile.get(SECTION_TRAIN, key)
+    if entry is None:
+        if int(os.environ.get('WORLD_SIZE', 1)) > 1:
+            # torchrun 的每个进程都会执行到这里，各自探测会得到不同的结果
+            raise RuntimeError(f"没有 {key} 的调优结果，请先运行 python autotune.py train 再用torchrun启动")
+        entry = profile.put(SECTION_TRAIN, key, tune_training(cfg, log))
+        log(f"调优结果已保存: {profile.path}")
+    log(f"自动调优: batch_size={entry['batch_size']}，workers={entry['workers']}"
+        + ("（数据加载跟不上模型）" if entry.get('loader_bound') else ''))
+    return entry
+
+
+# ---------------------------------------------------------------- 推理
+
+def load_probe_frames(paths, count):
+    """探测使用的帧：优先使用待处理的图片，没有时使用随机的720p帧"""
+    frames = [cv2.imread(p) for p in paths[:count]]
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 255, size=(720, 1280, 3), dtype=np.uint8) for _ in range(count)]
+    return frames
+
+
+def decode_rate(paths, count):
+    """单线程解码速度（张/秒），没有图片时返回None"""
+    paths = paths[:count]
+    if not paths:
+        return None
+    start = time.perf_counter()
+    for path in paths:
+        cv2.imread(path)
+    return len(paths) / (time.perf_counter() - start)
+
+
+def measure_throughput(model, frames, batch, kwargs):
+    """按批量处理全部帧（至少两批）的吞吐（张/秒）"""
+    frames = frames * max(1, math.ceil(2 * batch / len(frames)))
+    model.predict(frames[:batch], verbose=False, **kwargs)  # 预热
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch):
+        model.predict(frames[i:i + batch], verbose=False, **kwargs)
+    return len(frames) / (time.perf_counter() - start)
+
+
+def cpu_inference(backend, device):
+    return (backend in (inference_backend.BACKEND_ONNX, inference_backend.BACKEND_OPENVINO)
+            or (backend == inference_backend.BACKEND_TORCH and device == 'cpu'))
+
+
+def apply_inference_threads(threads, backend):
+    """在加载模型前调用：把调优得到的线程数应用到本进程"""
+    if not threads:
+        return
+    if backend in (inference_backend.BACKEND_ONNX, inference_backend.BACKEND_OPENVINO):
+        PredictionConfig.onnx_threads = threads
+    elif backend == inference_backend.BACKEND_TORCH:
+        import torch
+        torch.set_num_threads(threads)
+
+
+def tune_inference(model_path, backend, imgsz, device, paths=(), log=print):
+    cfg = AutotuneConfig
+    backend = inference_backend.resolve_backend(model_path, backend)
+    frames = load_probe_frames(list(paths), cfg.infer_probe_frames)
+    kwargs = {'device': device} if backend == inference_backend.BACKEND_TORCH and device else {}
+    cores = inference_backend.default_cpu_threads()
+    start = time.perf_counter()
+
+    threads = None
+    thread_probes = []
+    if cpu_inference(backend, device):
+        log(f"探测推理线程数（{backend}）...")
+        for count in sorted(set(doubling(1, cores)) | {cores}):
+            apply_inference_threads(count, backend)
+            model = inference_backend.load_backend(model_path, backend, imgsz, PredictionConfig.onnx_opset, count)
+            rate = measure_throughput(model, frames[:16], 1, kwargs)
+            thread_probes.append({'threads': count, 'images_per_second': rate})
+            log(f"  threads={count}: {rate:.1f} 张/秒")
+            if saturated([p['images_per_second'] for p in thread_probes]):
+                break
+        threads = smallest_near_best(thread_probes, 'threads', 'images_per_second')
+        apply_inference_threads(threads, backend)
+
+    log("探测推理批量...")
+    model = inference_backend.load_backend(model_path, backend, imgsz, PredictionConfig.onnx_opset, threads)
+    batch_probes = []
+    for batch in doubling(1, cfg.infer_max_batch):
+        try:
+            rate = measure_throughput(model, frames, batch, kwargs)
+        except RuntimeError as e:
+            if not _is_oom(e):
+                raise
+            log(f"  batch={batch}: 显存不足")
+            break
+        batch_probes.append({'batch': batch, 'images_per_second': rate})
+        log(f"  batch={batch}: {rate:.1f} 张/秒")
+        if saturated([p['images_per_second'] for p in batch_probes]):
+            break
+    if not batch_probes:
+        raise RuntimeError(f"batch=1 也无法在 {device} 上推理（显存不足）")
+    batch_size = smallest_near_best(batch_probes, 'batch', 'images_per_second')
+    throughput = next(p['images_per_second'] for p in batch_probes if p['batch'] == batch_size)
+
+    # 解码线程数：跟上推理吞吐，且不超过推理线程以外剩余的核心
+    per_thread = decode_rate(list(paths), cfg.infer_probe_frames)
+    if per_thread:
+        needed = math.ceil(throughput / per_thread * cfg.loader_margin)
+        spare = cores - threads if threads and threads < cores else cores
+        decode_workers = max(1, min(needed, spare))
+    else:
+        decode_workers = PredictionConfig.batch_workers
+
+    return {
+        'batch_size': batch_size,
+        'threads': threads,
+        'decode_workers': decode_workers,
+        'images_per_second': throughput,
+        'decode_per_thread': per_thread,
+        'probe_seconds': time.perf_counter() - start,
+        'probes': {'threads': thread_probes, 'batch': batch_probes},
+    }
+
+
+def inference_key(model_path, backend, imgsz, device):
+    from result_cache import model_hash
+
+    name = os.path.basename(os.path.normpath(str(model_path)))
+    return f"{name}:{model_hash(model_path)[:12]}|{backend}|imgsz={imgsz}|device={device or 'auto'}"
+
+
+def tuned_inference(model_path, backend=PredictionConfig.backend, imgsz=PredictionConfig.imgsz,
+                    device=PredictionConfig.device, paths=(), profile=None, force=False, log=print):
+    """返回本机批量推理的调优结果（batch_size、threads、decode_workers），没有保存过时先探测"""
+    profile = profile or TuningProfile()
+    key = inference_key(model_path, backend, imgsz, device)
+    entry = None if force else profile.get(SECTION_INFERENCE, key)
+    if entry is None:
+        entry = profile.put(SECTION_INFERENCE, key, tune_inference(model_path, backend, imgsz, device, paths, log))
+        log(f"调优结果已保存: {profile.path}")
+    log(f"自动调优: batch_size={entry['batch_size']}，threads={entry['threads'] or '默认'}，"
+        f"decode_workers={entry['decode_workers']}（{entry['images_per_second']:.1f} 张/秒）")
+    return entry
+
+
+# ---------------------------------------------------------------- 命令行
+
+def run_train(args):
+    from train import load_config
+
+    cfg = load_config(args.config, args.overrides)
+    tuned_training(cfg, force=args.force)
+    return 0
+
+
+def run_infer(args):
+    from batch_predict import collect_images
+
+    paths = collect_images([args.images]) if args.images else []
+    tuned_inference(args.model, args.backend, args.imgsz, args.device, paths, force=args.force)
+    return 0
+
+
+def run_show(args):
+    profile = TuningProfile()
+    if not os.path.exists(profile.path):
+        print(f"本机还没有调优结果: {profile.path}")
+        return 0
+    print(f"调优结果: {profile.path}")
+    for section in (SECTION_TRAIN, SECTION_INFERENCE):
+        for key, entry in profile.data[section].items():
+            values = ', '.join(f"{k}={entry[k]}" for k in ('batch_size', 'workers', 'threads', 'decode_workers')
+                               if k in entry)
+            print(f"  [{section}] {key}\n      {values}（{entry['tuned_at']}，探测 {entry['probe_seconds']:.0f}s）")
+    return 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='训练与推理的批量大小/线程数自动调优')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = subparsers.add_parser('train', help='调优训练的batch_size和workers')
+    train_parser.add_argument('--config', default=None, help='训练配置YAML（同 train.py --config）')
+    train_parser.add_argument('--set', dest='overrides', action='append', default=[], metavar='KEY=VALUE')
+    train_parser.add_argument('--force', action='store_true', help='忽略已保存的结果重新探测')
+    train_parser.set_defaults(func=run_train)
+
+    infer_parser = subparsers.add_parser('infer', help='调优批量推理的batch_size、线程数和解码线程数')
+    infer_parser.add_argument('--model', required=True, help='模型路径')
+    infer_parser.add_argument('--backend', choices=list(inference_backend.BACKENDS), default=PredictionConfig.backend)
+    infer_parser.add_argument('--imgsz', type=int, default=PredictionConfig.imgsz)
+    infer_parser.add_argument('--device', default=PredictionConfig.device)
+    infer_parser.add_argument('--images', default=None, help='探测使用的图片目录，默认使用随机帧')
+    infer_parser.add_argument('--force', action='store_true', help='忽略已保存的结果重新探测')
+    infer_parser.set_defaults(func=run_infer)
+
+    show_parser = subparsers.add_parser('show', help='显示本机已保存的调优结果')
+    show_parser.set_defaults(func=run_show)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    sys.exit(args.func(args))
@@ -0,0 +1,250 @@
+"""
+目录/数据集批量检测
+
+对目录（递归）、通配符或图片列表中的大量图片做检测，适合归档图片的离线处理：
+    - 解码在线程池中并行进行（cv2.imread 会释放GIL），并提前解码若干批，推理时不等待磁盘
+    - 每批多张图片一次 predict，显存不足时自动减半批量重试
+    - 结果逐批追加写入JSON Lines或CSV并立即刷新，中断后再次运行会跳过已处理的图片
+"""
+import concurrent.futures
+import csv
+import glob
+import json
+import os
+import time
+
+import cv2
+
+import utils
+from config import PredictionConfig
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+CSV_FIELDS = ['path', 'width', 'height', 'class_id', 'class', 'conf', 'x1', 'y1', 'x2', 'y2']
+
+
+def collect_images(inputs):
+    """展开目录（递归）、通配符和文件列表，返回去重后排好序的图片路径"""
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                paths.extend(os.path.join(root, f) for f in files if f.lower().endswith(IMAGE_EXTENSIONS))
+        elif any(ch in item for ch in '*?['):
+            paths.extend(p for p in glob.glob(item, recursive=True) if p.lower().endswith(IMAGE_EXTENSIONS))
+        elif os.path.isfile(item):
+            paths.append(item)
+    return sorted({os.path.normpath(p) for p in paths})
+
+
+def _is_out_of_memory(error):
+    return 'out of memory' in str(error).lower()
+
+
+class BatchResultWriter:
+    """逐批写出检测结果，支持断点续跑
+
+    resume=True 且输出文件已存在时读取已处理的图片路径并以追加方式打开；
+    中断时可能残留的半行会先被截掉，CSV中一张图片对应多行，最后一张图片的行也会删掉重新检测。
+    每张图片至少写一行（无目标或读取失败的图片也会记录），这样续跑时能准确跳过。
+    """
+
+    def __init__(self, output, fmt='jsonl', resume=True):
+        self.output = output
+        self.fmt = fmt
+        self.processed = set()
+        self.images = 0
+        self.detections = 0
+        self.failed = 0
+
+        exists = resume and os.path.exists(output) and os.path.getsize(output) > 0
+        if exists:
+            self._truncate_partial_line()
+            if fmt == 'csv':
+                self._truncate_last_image()
+            self.processed = self._load_processed()
+        elif os.path.dirname(output):
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+        self._file = open(output, 'a' if exists else 'w', newline='', encoding='utf-8')
+        self._csv = csv.writer(self._file) if fmt == 'csv' else None
+        if self._csv and not exists:
+            self._csv.writerow(CSV_FIELDS)
+
+    def _truncate_partial_line(self):
+        with open(self.output, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                f.truncate(end)
+
+    def _truncate_last_image(self):
+        # 中断可能发生在某张图片的多行写到一半时，该图片不能算作已处理
+        def row_path(line):
+            return next(csv.reader([line.decode('utf-8')]), [''])[0]
+
+        with open(self.output, 'rb+') as f:
+            lines = f.readlines()
+            if len(lines) <= 1:
+                return
+            last_path = row_path(lines[-1])
+            end = sum(len(line) for line in lines)
+            for line in reversed(lines[1:]):
+                if row_path(line) != last_path:
+                    break
+                end -= len(line)
+            f.truncate(end)
+
+    def _load_processed(self):
+        processed = set()
+        with open(self.output, 'r', newline='', encoding='utf-8') as f:
+            if self.fmt == 'csv':
+                for row in csv.DictReader(f):
+                    processed.add(row['path'])
+            else:
+                for line in f:
+                    if line.strip():
+                        processed.add(json.loads(line)['path'])
+        return processed
+
+    def write(self, path, frame, result):
+        """写出一张图片的检测结果，frame为None表示读取失败"""
+        self.images += 1
+        if frame is None:
+            self.failed += 1
+            if self._csv:
+                self._csv.writerow([path] + [''] * (len(CSV_FIELDS) - 1))
+            else:
+                self._file.write(json.dumps({'path': path, 'error': '无法读取图片'}, ensure_ascii=False) + '\n')
+            return
+
+        height, width = frame.shape[:2]
+        detections = utils.result_to_detections(result)
+        self.detections += len(detections)
+        if self._csv:
+            if not detections:
+                self._csv.writerow([path, width, height] + [''] * 7)
+            for det in detections:
+                self._csv.writerow([path, width, height, det['class_id'], det['class'], det['conf'], *det['xyxy']])
+        else:
+            record = {'path': path, 'width': width, 'height': height, 'detections': detections}
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class BatchPredictor:
+    """并行解码 + 批量推理
+
+    参数:
+        model: 已加载的模型（YOLO、inference_backend 中的后端或 TiledPredictor）
+        conf: 置信度阈值
+        batch_size: 每次 predict 的图片数，显存不足时自动减半
+        workers: 解码线程数
+        prefetch: 提前解码的批数
+        imgsz: 推理输入尺寸，None表示使用模型默认值
+    """
+
+    def __init__(self, model, conf=0.25, batch_size=16, workers=4, prefetch=2, imgsz=None):
+        self.model = model
+        self.conf = conf
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.prefetch = max(1, prefetch)
+        self.imgsz = imgsz
+
+        self.images = 0
+        self.batches = 0
+        self.decode_time = 0.0  # 推理线程等待解码的时间
+        self.predict_time = 0.0
+        self.elapsed = 0.0
+
+    def _decoded_batches(self, paths, executor):
+        """按批提交解码任务，始终保持 prefetch 批在解码中，按原顺序产出 [(path, frame)]"""
+        pending = []
+        position = 0
+        while position < len(paths) or pending:
+            while position < len(paths) and len(pending) < self.prefetch + 1:
+                chunk = paths[position:position + self.batch_size]
+                pending.append((chunk, [executor.submit(cv2.imread, p) for p in chunk]))
+                position += len(chunk)
+            chunk, futures = pending.pop(0)
+            start = time.perf_counter()
+            frames = [future.result() for future in futures]
+            self.decode_time += time.perf_counter() - start
+            yield list(zip(chunk, frames))
+
+    def predict_frames(self, frames):
+        """批量推理，显存不足时把批次拆成两半分别推理，并减小后续批量"""
+        kwargs = {'imgsz': self.imgsz} if self.imgsz else {}
+        try:
+            return self.model.predict(frames, conf=self.conf, verbose=False, **kwargs)
+        except RuntimeError as e:
+            if not _is_out_of_memory(e) or len(frames) == 1:
+                raise
+            import torch
+            torch.cuda.empty_cache()
+            half = len(frames) // 2
+            self.batch_size = max(1, half)
+            return self.predict_frames(frames[:half]) + self.predict_frames(frames[half:])
+
+    def run(self, paths, writer=None, on_batch=None, should_stop=None):
+        """处理所有图片
+
+        writer: BatchResultWriter，逐批写出并刷新
+        on_batch: 每批完成后调用 on_batch(items, results, done, total)，items为[(path, frame)]
+        should_stop: 返回True时在当前批次结束后停止
+        """
+        if writer is not None and writer.processed:
+            paths = [p for p in paths if p not in writer.processed]
+        total = len(paths)
+        done = 0
+        start = time.perf_counter()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch-decode") as executor:
+            for items in self._decoded_batches(paths, executor):
+                valid = [frame for _, frame in items if frame is not None]
+                predict_start = time.perf_counter()
+                results = iter(self.predict_frames(valid) if valid else [])
+                self.predict_time += time.perf_counter() - predict_start
+                batch_results = [next(results) if frame is not None else None for _, frame in items]
+
+                if writer is not None:
+                    for (path, frame), result in zip(items, batch_results):
+                        writer.write(path, frame, result)
+                    writer.flush()
+                done += len(items)
+                self.images += len(items)
+                self.batches += 1
+                if on_batch:
+                    on_batch(items, batch_results, done, total)
+                if should_stop and should_stop():
+                    break
+
+        self.elapsed += time.perf_counter() - start
+        return done
+
+    def stats(self):
+        return {
+            'images': self.images,
+            'batches': self.batches,
+            'batch_size': self.batch_size,
+            'images_per_second': self.images / self.elapsed if self.elapsed else 0.0,
+            'decode_wait_ms': self.decode_time / self.batches * 1000 if self.batches else 0.0,
+            'predict_ms': self.predict_time / self.batches * 1000 if self.batches else 0.0,
+        }
+
+
+def create_batch_predictor(model, conf=None):
+    """按 PredictionConfig 中的批量检测配置创建"""
+    return BatchPredictor(
+        model,
+        conf=PredictionConfig.conf_threshold if conf is None else conf,
+        batch_size=PredictionConfig.batch_size,
+        workers=PredictionConfig.batch_workers,
+        prefetch=PredictionConfig.batch_prefetch,
+    )
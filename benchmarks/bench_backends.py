@@ -0,0 +1,90 @@
+"""
+推理后端基准：PyTorch CPU vs ONNX Runtime（不同线程数）vs OpenVINO
+
+对同一批图片逐帧推理，统计平均/中位/P95延迟和FPS（包含前处理和后处理）。
+
+用法:
+    python benchmarks/bench_backends.py --model weights/best.pt --images data/val/images
+    python benchmarks/bench_backends.py --model weights/best.pt --threads 1 2 4 8 --openvino
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import inference_backend
+from inference_backend import BACKEND_TORCH, BACKEND_ONNX, BACKEND_OPENVINO
+
+
+def load_frames(images, limit, imgsz):
+    paths = sorted(glob.glob(os.path.join(images, '*'))) if images else []
+    frames = [cv2.imread(p) for p in paths[:limit]]
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        # 没有提供图片时使用随机帧
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 255, size=(imgsz, imgsz, 3), dtype=np.uint8) for _ in range(limit)]
+    return frames
+
+
+def measure(model, frames, conf, warmup, **kwargs):
+    for frame in frames[:warmup]:
+        model.predict(frame, conf=conf, verbose=False, **kwargs)
+
+    latencies = []
+    for frame in frames:
+        start = time.perf_counter()
+        model.predict(frame, conf=conf, verbose=False, **kwargs)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies = np.asarray(latencies)
+    return {
+        'mean': latencies.mean(),
+        'p50': np.percentile(latencies, 50),
+        'p95': np.percentile(latencies, 95),
+        'fps': 1000 / latencies.mean(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='推理后端基准')
+    parser.add_argument('--model', required=True, help='.pt 模型路径')
+    parser.add_argument('--images', default=None, help='测试图片目录，默认使用随机帧')
+    parser.add_argument('--limit', type=int, default=100, help='测试帧数')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--opset', type=int, default=12)
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--threads', type=int, nargs='*', default=None,
+                        help='ONNX Runtime线程数列表，默认只测可用CPU核数')
+    parser.add_argument('--openvino', action='store_true', help='同时测试OpenVINO')
+    parser.add_argument('--warmup', type=int, default=5)
+    args = parser.parse_args()
+
+    frames = load_frames(args.images, args.limit, args.imgsz)
+    rows = []
+
+    model = inference_backend.load_backend(args.model, BACKEND_TORCH)
+    rows.append(('PyTorch CPU', measure(model, frames, args.conf, args.warmup, device='cpu')))
+
+    for threads in args.threads or [inference_backend.default_cpu_threads()]:
+        model = inference_backend.load_backend(args.model, BACKEND_ONNX, args.imgsz, args.opset, threads)
+        rows.append((f'ONNX Runtime ({threads} 线程)', measure(model, frames, args.conf, args.warmup)))
+
+    if args.openvino:
+        model = inference_backend.load_backend(args.model, BACKEND_OPENVINO, args.imgsz)
+        rows.append(('OpenVINO', measure(model, frames, args.conf, args.warmup)))
+
+    base_fps = rows[0][1]['fps']
+    print(f"{len(frames)} 帧，imgsz={args.imgsz}")
+    print(f"{'后端':<24} {'平均(ms)':>10} {'P50(ms)':>10} {'P95(ms)':>10} {'FPS':>8} {'相对PyTorch':>12}")
+    for name, stats in rows:
+        print(f"{name:<24} {stats['mean']:>10.2f} {stats['p50']:>10.2f} {stats['p95']:>10.2f} "
+              f"{stats['fps']:>8.1f} {stats['fps'] / base_fps:>11.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+批量检测吞吐基准：逐张处理 vs BatchPredictor
+
+逐张处理与界面"图片文件"模式相同：读取一张、推理一张；
+批量模式使用线程池并行解码并按批推理。输出各批量下的吞吐（张/秒）和相对逐张处理的加速比。
+
+用法:
+    python benchmarks/bench_batch_predict.py --model weights/best.pt --images data/test/images
+    python benchmarks/bench_batch_predict.py --model weights/best.pt --images data/test/images --batch 8 16 32 --backend onnx
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import model_cache
+from batch_predict import BatchPredictor, collect_images
+from inference_backend import BACKENDS
+
+
+def one_at_a_time(model, paths, conf):
+    start = time.perf_counter()
+    for path in paths:
+        frame = cv2.imread(path)
+        if frame is not None:
+            model.predict(frame, conf=conf, verbose=False)
+    return len(paths) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量检测吞吐基准')
+    parser.add_argument('--model', required=True, help='模型路径')
+    parser.add_argument('--images', required=True, help='测试图片目录')
+    parser.add_argument('--backend', choices=list(BACKENDS), default='torch')
+    parser.add_argument('--limit', type=int, default=500, help='测试图片数')
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--batch', type=int, nargs='+', default=[1, 8, 16, 32], help='批量列表')
+    parser.add_argument('--workers', type=int, default=4, help='解码线程数')
+    args = parser.parse_args()
+
+    paths = collect_images(args.images)[:args.limit]
+    if not paths:
+        print(f"没有找到图片: {args.images}")
+        return 1
+    model = model_cache.get_model(args.model, backend=args.backend)
+
+    # 预热文件缓存，避免第一轮测试吃亏
+    for path in paths:
+        cv2.imread(path)
+
+    baseline = one_at_a_time(model, paths, args.conf)
+    print(f"{'方式':<24}{'吞吐 (张/秒)':>14}{'加速比':>10}")
+    print(f"{'逐张读取+推理':<24}{baseline:>14.1f}{1.0:>10.2f}")
+    for batch_size in args.batch:
+        predictor = BatchPredictor(model, args.conf, batch_size, args.workers)
+        predictor.run(paths)
+        fps = predictor.stats()['images_per_second']
+        print(f"{f'批量 {batch_size}（{args.workers} 解码线程）':<24}{fps:>14.1f}{fps / baseline:>10.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
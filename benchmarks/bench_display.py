@@ -0,0 +1,90 @@
+"""
+显示路径基准：原 update_display 路径 vs DisplayConverter
+
+原路径：result.plot() → cvtColor转RGB → QImage → QPixmap.fromImage → 平滑缩放到标签大小
+新路径：缩放到标签大小 → 小图上原地绘制 → BGR888包装为QImage → QPixmap.fromImage
+
+用法:
+    python benchmarks/bench_display.py [--width 1920 --height 1080 --label 960x540 --boxes 10]
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import cv2
+import numpy as np
+import torch
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtWidgets import QApplication
+from ultralytics.engine.results import Results
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import utils
+
+
+def legacy_path(result, label_w, label_h, counter):
+    """原 update_display + display_image 的处理步骤，同时统计整帧拷贝"""
+    processed_img = result.plot()
+    counter['bytes'] += processed_img.nbytes
+    img_rgb = cv2.cvtColor(processed_img, cv2.COLOR_BGR2RGB)
+    counter['bytes'] += img_rgb.nbytes
+    h, w, ch = img_rgb.shape
+    q_img = QImage(img_rgb.data, w, h, ch * w, QImage.Format_RGB888)
+    pixmap = QPixmap.fromImage(q_img)
+    counter['bytes'] += img_rgb.nbytes
+    scaled = pixmap.scaled(label_w, label_h, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    counter['bytes'] += scaled.width() * scaled.height() * 4
+    counter['copies'] += 4
+    counter['frames'] += 1
+    return scaled
+
+
+def main():
+    parser = argparse.ArgumentParser(description='显示路径基准')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--label', default='960x540', help='显示标签大小 WxH')
+    parser.add_argument('--boxes', type=int, default=10)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication([])
+    label_w, label_h = map(int, args.label.lower().split('x'))
+
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 255, size=(args.height, args.width, 3), dtype=np.uint8)
+    xy = rng.uniform(0, [args.width - 100, args.height - 100], size=(args.boxes, 2))
+    data = np.hstack([xy, xy + 80, rng.uniform(0.25, 1, (args.boxes, 1)),
+                      rng.integers(0, 2, (args.boxes, 1))]).astype(np.float32)
+    result = Results(image, path='bench.jpg', names={0: 'smoke', 1: 'fire'}, boxes=torch.from_numpy(data))
+
+    counter = {'frames': 0, 'copies': 0, 'bytes': 0}
+    legacy_path(result, label_w, label_h, counter)
+    counter = {'frames': 0, 'copies': 0, 'bytes': 0}
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        legacy_path(result, label_w, label_h, counter)
+    legacy_ms = (time.perf_counter() - start) / args.iterations * 1000
+
+    converter = utils.DisplayConverter()
+    converter.to_pixmap(image, result, label_w, label_h)
+    converter = utils.DisplayConverter()
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        converter.to_pixmap(image, result, label_w, label_h)
+    new_ms = (time.perf_counter() - start) / args.iterations * 1000
+    stats = converter.stats()
+
+    print(f"帧 {args.width}x{args.height} → 标签 {label_w}x{label_h}，{args.boxes} 个检测框")
+    print(f"{'路径':<10} {'耗时(ms/帧)':>12} {'拷贝次数/帧':>12} {'拷贝量(KB/帧)':>14}")
+    print(f"{'原路径':<10} {legacy_ms:>12.3f} {counter['copies'] / counter['frames']:>12.1f} "
+          f"{counter['bytes'] / counter['frames'] / 1024:>14.0f}")
+    print(f"{'新路径':<10} {new_ms:>12.3f} {stats['copies_per_frame']:>12.1f} {stats['kb_per_frame']:>14.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+检测结果绘制微基准：逐框拷贝的旧实现 vs DetectionRenderer
+
+分别测量 0、10、300（max_det）个检测框时每帧的绘制耗时。
+
+用法:
+    python benchmarks/bench_renderer.py [--width 1920 --height 1080 --iterations 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import utils
+
+NAMES = {0: 'smoke', 1: 'fire'}
+
+
+def plot_per_box(result, line_width=2):
+    """旧实现：每个框分别做三次设备到主机的拷贝，并拷贝整帧"""
+    annotated_frame = result.orig_img.copy()
+    if hasattr(result, 'boxes') and len(result.boxes) > 0:
+        for box in result.boxes:
+            x1, y1, x2, y2 = map(int, box.xyxy.cpu().numpy()[0])
+            cls_id = int(box.cls.cpu().numpy()[0])
+            cls_name = result.names[cls_id]
+            conf = float(box.conf.cpu().numpy()[0])
+            color = utils.get_color_for_class(cls_id, cls_name)
+            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), color, line_width)
+            label = f"{cls_name} {conf:.2f}"
+            text_size, _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 1)
+            cv2.rectangle(annotated_frame, (x1, y1 - 20), (x1 + text_size[0], y1), color, -1)
+            cv2.putText(annotated_frame, label, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
+    return annotated_frame
+
+
+def make_result(image, num_boxes, device, rng):
+    """构造带随机检测框的结果"""
+    h, w = image.shape[:2]
+    xy = rng.uniform(0, [w - 100, h - 100], size=(num_boxes, 2))
+    wh = rng.uniform(20, 100, size=(num_boxes, 2))
+    conf = rng.uniform(0.25, 1.0, size=(num_boxes, 1))
+    cls = rng.integers(0, 2, size=(num_boxes, 1))
+    data = np.hstack([xy, xy + wh, conf, cls]).astype(np.float32)
+    return Results(image, path='bench.jpg', names=NAMES, boxes=torch.from_numpy(data).to(device))
+
+
+def time_per_frame(fn, iterations):
+    fn()  # 预热
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='检测结果绘制微基准')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 255, size=(args.height, args.width, 3), dtype=np.uint8)
+    renderer = utils.DetectionRenderer()
+
+    print(f"分辨率 {args.width}x{args.height}，设备 {args.device}，每项 {args.iterations} 次")
+    print(f"{'框数':>6} {'逐框拷贝(ms)':>14} {'Renderer(ms)':>14} {'加速比':>8}")
+    for num_boxes in (0, 10, 300):
+        result = make_result(image, num_boxes, args.device, rng)
+        legacy_ms = time_per_frame(lambda: plot_per_box(result), args.iterations)
+        renderer_ms = time_per_frame(lambda: renderer.render(result), args.iterations)
+        print(f"{num_boxes:>6} {legacy_ms:>14.3f} {renderer_ms:>14.3f} {legacy_ms / renderer_ms:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
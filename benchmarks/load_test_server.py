@@ -0,0 +1,125 @@
+"""
+推理服务压测：对本机运行的 firedetect serve 发起并发请求
+
+HTTP模式下每个并发客户端循环发送 POST /detect；WebSocket模式下每个客户端一条连接、
+同时最多 --inflight 帧在途。统计单帧延迟的P50/P99和总吞吐，并读取服务端的平均批量。
+
+用法:
+    python -m firedetect serve --model weights/best.pt &
+    python benchmarks/load_test_server.py --images data/val/images --concurrency 1 4 16
+    python benchmarks/load_test_server.py --mode ws --concurrency 4 --inflight 4
+"""
+import argparse
+import asyncio
+import glob
+import os
+import time
+
+import aiohttp
+import cv2
+import numpy as np
+
+
+def load_payloads(images, limit, imgsz):
+    """读取测试图片并编码为JPEG字节，没有提供图片时使用随机帧"""
+    paths = sorted(glob.glob(os.path.join(images, '*'))) if images else []
+    frames = [cv2.imread(p) for p in paths[:limit]]
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 255, size=(imgsz, imgsz, 3), dtype=np.uint8) for _ in range(limit)]
+    return [cv2.imencode('.jpg', frame)[1].tobytes() for frame in frames]
+
+
+async def http_client(session, url, payloads, count, latencies, errors):
+    for i in range(count):
+        start = time.perf_counter()
+        async with session.post(f"{url}/detect", data=payloads[i % len(payloads)],
+                                headers={'Content-Type': 'image/jpeg'}) as response:
+            await response.read()
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def ws_client(session, url, payloads, count, inflight, latencies, errors):
+    ws_url = url.replace('http', 'ws', 1) + '/ws'
+    async with session.ws_connect(ws_url, max_msg_size=0) as ws:
+        sent_times = []
+
+        async def receiver():
+            for index in range(count):
+                msg = await ws.receive_json()
+                if 'error' in msg:
+                    errors.append(msg['error'])
+                else:
+                    latencies.append(time.perf_counter() - sent_times[index])
+                window.release()
+
+        window = asyncio.Semaphore(inflight)
+        receive_task = asyncio.ensure_future(receiver())
+        for i in range(count):
+            await window.acquire()
+            sent_times.append(time.perf_counter())
+            await ws.send_bytes(payloads[i % len(payloads)])
+        await receive_task
+
+
+async def run_level(url, payloads, mode, concurrency, requests, inflight):
+    latencies, errors = [], []
+    per_client = max(1, requests // concurrency)
+    async with aiohttp.ClientSession() as session:
+        before = await (await session.get(f"{url}/stats")).json()
+        start = time.perf_counter()
+        if mode == 'http':
+            clients = [http_client(session, url, payloads, per_client, latencies, errors) for _ in range(concurrency)]
+        else:
+            clients = [ws_client(session, url, payloads, per_client, inflight, latencies, errors)
+                       for _ in range(concurrency)]
+        await asyncio.gather(*clients)
+        elapsed = time.perf_counter() - start
+        after = await (await session.get(f"{url}/stats")).json()
+
+    batches = after['batches'] - before['batches']
+    served = after['requests'] - before['requests']
+    latencies = np.asarray(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'p50': np.percentile(latencies, 50) if len(latencies) else 0.0,
+        'p99': np.percentile(latencies, 99) if len(latencies) else 0.0,
+        'throughput': len(latencies) / elapsed,
+        'avg_batch': served / batches if batches else 0.0,
+    }
+
+
+async def main_async(args):
+    payloads = load_payloads(args.images, args.limit, args.imgsz)
+    # 预热：触发模型首次推理和连接建立
+    await run_level(args.url, payloads, 'http', 1, args.warmup, 1)
+
+    print(f"{'并发':>6}{'请求数':>8}{'错误':>6}{'P50 (ms)':>12}{'P99 (ms)':>12}{'吞吐 (帧/秒)':>14}{'平均批量':>10}")
+    for concurrency in args.concurrency:
+        row = await run_level(args.url, payloads, args.mode, concurrency, args.requests, args.inflight)
+        print(f"{concurrency:>6}{row['requests']:>8}{row['errors']:>6}{row['p50']:>12.1f}{row['p99']:>12.1f}"
+              f"{row['throughput']:>14.1f}{row['avg_batch']:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='推理服务压测')
+    parser.add_argument('--url', default='http://127.0.0.1:8765', help='服务地址')
+    parser.add_argument('--mode', choices=['http', 'ws'], default='http', help='请求方式')
+    parser.add_argument('--images', default=None, help='测试图片目录，默认使用随机帧')
+    parser.add_argument('--limit', type=int, default=50, help='使用的图片数')
+    parser.add_argument('--imgsz', type=int, default=640, help='随机帧尺寸')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16], help='并发客户端数列表')
+    parser.add_argument('--requests', type=int, default=400, help='每个并发级别的总请求数')
+    parser.add_argument('--inflight', type=int, default=4, help='WebSocket模式下每条连接的在途帧数')
+    parser.add_argument('--warmup', type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""
+运动门控灵敏度验证：在验证集上检查门控是否会漏掉目标的出现
+
+验证集是单张图片而不是视频，因此对每张带标注的图片构造一对帧：
+    参考帧：用图像修复（inpaint）抹去标注框内的目标，模拟目标出现之前的静止画面
+    当前帧：按不同不透明度把目标混合回参考帧，模拟淡烟/小火刚出现时的画面
+门控在当前帧上触发推理才算"召回"。同时对参考帧叠加传感器噪声和JPEG重压缩，
+统计纯噪声下的误触发率（误触发越多，能跳过的帧越少）。
+
+用法:
+    python benchmarks/validate_motion_gate.py --images data/val/images
+    python benchmarks/validate_motion_gate.py --thresholds 0.0005 0.001 0.002 0.005 --pixel-delta 8 12 16
+"""
+import argparse
+import glob
+import os
+import sys
+
+import cv2
+import numpy as np
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import PredictionConfig
+from motion_gate import MotionGate
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def label_path(image_path):
+    """YOLO格式标注：.../images/xxx.jpg -> .../labels/xxx.txt"""
+    head, name = os.path.split(image_path)
+    labels_dir = os.path.join(os.path.dirname(head), 'labels')
+    return os.path.join(labels_dir, os.path.splitext(name)[0] + '.txt')
+
+
+def load_boxes(image_path, width, height):
+    """读取标注框，返回 [(类别, x1, y1, x2, y2), ...]（像素坐标）"""
+    path = label_path(image_path)
+    if not os.path.exists(path):
+        return []
+    boxes = []
+    with open(path, 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            cls_id = int(parts[0])
+            cx, cy, w, h = (float(v) for v in parts[1:5])
+            x1 = max(0, int((cx - w / 2) * width))
+            y1 = max(0, int((cy - h / 2) * height))
+            x2 = min(width, int(np.ceil((cx + w / 2) * width)))
+            y2 = min(height, int(np.ceil((cy + h / 2) * height)))
+            if x2 > x1 and y2 > y1:
+                boxes.append((cls_id, x1, y1, x2, y2))
+    return boxes
+
+
+def make_background(image, boxes):
+    """抹去标注框内的目标，得到参考帧和目标区域掩码"""
+    mask = np.zeros(image.shape[:2], dtype=np.uint8)
+    for _, x1, y1, x2, y2 in boxes:
+        mask[y1:y2, x1:x2] = 255
+    # 较大的图先缩小再修复，速度快很多，对门控的小图差分没有影响
+    scale = min(1.0, 640 / max(image.shape[:2]))
+    small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    small_mask = cv2.resize(mask, (small.shape[1], small.shape[0]), interpolation=cv2.INTER_NEAREST)
+    background = cv2.inpaint(small, small_mask, 5, cv2.INPAINT_TELEA)
+    background = cv2.resize(background, (image.shape[1], image.shape[0]), interpolation=cv2.INTER_LINEAR)
+    # 框外保持原图，保证参考帧与当前帧只在目标区域不同
+    background = np.where(mask[:, :, None] > 0, background, image)
+    return background, mask
+
+
+def add_noise(image, rng, sigma=3.0, jpeg_quality=85):
+    """模拟静止画面中的传感器噪声和编码失真"""
+    noisy = image.astype(np.float32) + rng.normal(0, sigma, image.shape)
+    noisy = np.clip(noisy, 0, 255).astype(np.uint8)
+    ok, encoded = cv2.imencode('.jpg', noisy, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+    return cv2.imdecode(encoded, cv2.IMREAD_COLOR) if ok else noisy
+
+
+def resolve_images(images, data_yaml):
+    if images and os.path.isdir(images):
+        return images
+    with open(data_yaml, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f)['val']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='运动门控灵敏度验证')
+    parser.add_argument('--images', default='data/val/images', help='验证集图片目录')
+    parser.add_argument('--data-yaml', default='data.yaml', help='图片目录不存在时从中读取val路径和类别名')
+    parser.add_argument('--limit', type=int, default=500, help='最多使用的图片数')
+    parser.add_argument('--thresholds', type=float, nargs='+',
+                        default=[0.0005, 0.001, 0.002, 0.005, 0.01, 0.02])
+    parser.add_argument('--pixel-delta', type=int, nargs='+', default=[PredictionConfig.motion_pixel_delta])
+    parser.add_argument('--alphas', type=float, nargs='+', default=[1.0, 0.5, 0.25],
+                        help='目标混合回参考帧的不透明度，越小越接近刚出现的淡烟')
+    parser.add_argument('--width', type=int, default=PredictionConfig.motion_width)
+    parser.add_argument('--target-recall', type=float, default=0.99, help='推荐阈值时要求的最低召回')
+    args = parser.parse_args()
+
+    with open(args.data_yaml, 'r', encoding='utf-8') as f:
+        names = yaml.safe_load(f).get('names', {})
+
+    image_dir = resolve_images(args.images, args.data_yaml)
+    paths = sorted(p for p in glob.glob(os.path.join(image_dir, '*')) if p.lower().endswith(IMAGE_EXTS))
+    rng = np.random.default_rng(0)
+
+    # ratios[(pixel_delta, alpha)] = [(类别集合, 变化比例), ...]；noise[pixel_delta] = [变化比例, ...]
+    ratios, noise = {}, {}
+    used = 0
+    for path in paths:
+        if used >= args.limit:
+            break
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        boxes = load_boxes(path, image.shape[1], image.shape[0])
+        if not boxes:
+            continue
+        used += 1
+
+        background, mask = make_background(image, boxes)
+        classes = {cls_id for cls_id, *_ in boxes}
+        noisy = add_noise(background, rng)
+        for delta in args.pixel_delta:
+            gate = MotionGate(pixel_delta=delta, width=args.width)
+            reference = gate.thumbnail(background)
+            noise.setdefault(delta, []).append(gate.change_ratio(gate.thumbnail(noisy), reference))
+            for alpha in args.alphas:
+                current = cv2.addWeighted(image, alpha, background, 1 - alpha, 0)
+                ratio = gate.change_ratio(gate.thumbnail(current), reference)
+                ratios.setdefault((delta, alpha), []).append((classes, ratio))
+
+    if not used:
+        print(f"没有找到带标注的图片: {image_dir}")
+        return 1
+
+    print(f"{used} 张带标注的验证图片，差分小图宽度 {args.width}")
+    class_ids = sorted({cls_id for rows in ratios.values() for classes, _ in rows for cls_id in classes})
+    columns = [(alpha, cls_id, f"{names.get(cls_id, cls_id)}@{alpha:g}")
+               for alpha in args.alphas for cls_id in class_ids]
+    for delta in args.pixel_delta:
+        print(f"\npixel_delta={delta}（列为 类别@不透明度 的召回）")
+        print(f"{'阈值':>8}  " + "  ".join(label for _, _, label in columns) + "  噪声误触发")
+        recommended = None
+        for threshold in sorted(args.thresholds):
+            cells, worst = [], 1.0
+            for alpha, cls_id, label in columns:
+                hits = [ratio >= threshold for classes, ratio in ratios[(delta, alpha)] if cls_id in classes]
+                recall = float(np.mean(hits)) if hits else float('nan')
+                if hits and alpha >= 0.5:
+                    worst = min(worst, recall)
+                cells.append(f"{recall:>{len(label)}.3f}")
+            false_rate = float(np.mean([ratio >= threshold for ratio in noise[delta]]))
+            print(f"{threshold:>8g}  " + "  ".join(cells) + f"  {false_rate:>10.3f}")
+            # 推荐：不透明度>=0.5时各类别召回都达标的最大阈值（可跳过的帧最多）
+            if worst >= args.target_recall:
+                recommended = threshold
+        if recommended is not None:
+            print(f"推荐 motion_threshold={recommended:g}（不透明度>=0.5时召回 >= {args.target_recall:.0%}）")
+        else:
+            print("没有阈值满足召回要求，请降低阈值或pixel_delta")
+
+    print(f"\n注意：即使门控漏判，每 {PredictionConfig.motion_keyframe_interval} 帧仍会强制推理一次，"
+          f"漏检最多延迟该帧数。")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
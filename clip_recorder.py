@@ -0,0 +1,327 @@
+"""
+事件触发的片段录制
+
+持续把最近几秒的画面写入预分配的环形缓冲；当火灾/烟雾满足置信度与持续帧数规则时，
+把缓冲中的预录帧和之后的后录帧交给后台线程编码为视频片段。
+后录帧同样拷贝（按最大宽度缩小）到预分配的帧槽池中，编码线程按槽位索引读取，
+内存占用只取决于缓冲容量和最大宽度，与视频流长度和源分辨率无关。
+"""
+import os
+import queue
+import threading
+from collections import deque
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+
+def _target_size(frame, max_width):
+    """按最大宽度等比缩小后的尺寸 (w, h)"""
+    h, w = frame.shape[:2]
+    if max_width and w > max_width:
+        return max_width, int(round(h * max_width / w))
+    return w, h
+
+
+def _copy_into(slot, frame):
+    """把帧原地拷贝（尺寸不同时缩放）到预分配的槽位"""
+    if slot.shape[:2] == frame.shape[:2]:
+        np.copyto(slot, frame)
+    else:
+        cv2.resize(frame, (slot.shape[1], slot.shape[0]), dst=slot, interpolation=cv2.INTER_AREA)
+
+
+class FrameRingBuffer:
+    """预分配的环形帧缓冲，写入时原地拷贝，不随帧数增长分配内存
+
+    参数:
+        capacity: 最多保存的帧数
+        max_width: 保存时的最大宽度，超出按比例缩小以控制内存，None表示保持原尺寸
+    """
+
+    def __init__(self, capacity, max_width=None):
+        self.capacity = max(1, int(capacity))
+        self.max_width = max_width
+        self.frame_size = None  # (w, h)
+        self._buffer = None
+        self._start = 0
+        self._count = 0
+
+    def push(self, frame):
+        size = _target_size(frame, self.max_width)
+        if self._buffer is None or size != self.frame_size:
+            # 首帧或分辨率变化时（重新）分配，之后一直复用
+            w, h = size
+            self._buffer = np.empty((self.capacity, h, w, 3), dtype=np.uint8)
+            self.frame_size = size
+            self._start = 0
+            self._count = 0
+
+        index = (self._start + self._count) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+        else:
+            self._start = (self._start + 1) % self.capacity
+
+        _copy_into(self._buffer[index], frame)
+
+    def frames(self):
+        """按时间顺序（从旧到新）依次返回缓冲中的帧视图"""
+        for i in range(self._count):
+            yield self._buffer[(self._start + i) % self.capacity]
+
+    def clear(self):
+        self._start = 0
+        self._count = 0
+
+    @property
+    def nbytes(self):
+        return 0 if self._buffer is None else self._buffer.nbytes
+
+    def __len__(self):
+        return self._count
+
+
+class FramePool:
+    """预分配的帧槽池：生产者把帧拷贝进空闲槽位并交出槽位索引，消费者读完后归还
+
+    首帧时按其（缩小后的）尺寸一次性分配，之后分辨率不同的帧缩放到该尺寸，不再分配内存。
+
+    参数:
+        capacity: 槽位数，即最多同时等待编码的帧数
+        max_width: 保存时的最大宽度，None表示保持原尺寸
+    """
+
+    def __init__(self, capacity, max_width=None):
+        self.capacity = max(1, int(capacity))
+        self.max_width = max_width
+        self.frame_size = None  # (w, h)
+        self._buffer = None
+        self._free = queue.Queue()
+        for index in range(self.capacity):
+            self._free.put(index)
+
+    def put(self, frame):
+        """拷贝到空闲槽位并返回槽位索引，没有空闲槽位时返回None"""
+        try:
+            index = self._free.get_nowait()
+        except queue.Empty:
+            return None
+        if self._buffer is None:
+            w, h = _target_size(frame, self.max_width)
+            self._buffer = np.empty((self.capacity, h, w, 3), dtype=np.uint8)
+            self.frame_size = (w, h)
+        _copy_into(self._buffer[index], frame)
+        return index
+
+    def get(self, index):
+        return self._buffer[index]
+
+    def release(self, index):
+        self._free.put(index)
+
+    @property
+    def nbytes(self):
+        return 0 if self._buffer is None else self._buffer.nbytes
+
+
+class DetectionTrigger:
+    """触发规则：最近 window 帧中至少 min_hits 帧出现置信度不低于 min_conf 的目标类别"""
+
+    def __init__(self, classes=('fire', 'smoke'), min_conf=0.5, min_hits=3, window=5):
+        self.classes = set(classes)
+        self.min_conf = min_conf
+        self.min_hits = min_hits
+        self._history = deque(maxlen=max(window, min_hits))
+
+    def update(self, results):
+        """输入当前帧的检测结果，返回是否触发"""
+        hit = False
+        for result in results or []:
+            boxes = getattr(result, 'boxes', None)
+            if boxes is None or len(boxes) == 0:
+                continue
+            cls_ids = boxes.cls.cpu().numpy().astype(int)
+            confs = boxes.conf.cpu().numpy()
+            names = result.names
+            for cls_id, conf in zip(cls_ids.tolist(), confs.tolist()):
+                if conf >= self.min_conf and names.get(cls_id) in self.classes:
+                    hit = True
+                    break
+
+        self._history.append(hit)
+        return sum(self._history) >= self.min_hits
+
+
+class ClipRecorder:
+    """事件触发的片段录制器
+
+    使用两块预分配的环形缓冲交替工作：触发时把已满的缓冲交给后台线程编码预录部分，
+    另一块继续接收新帧；后录帧拷贝到预分配的帧槽池，只把槽位索引交给编码队列。
+    上一个片段的预录部分尚未写完时，新事件无法获得空闲缓冲，会被计入 dropped_clips；
+    编码跟不上、帧槽池用尽时后录帧计入 dropped_frames。
+
+    参数:
+        save_dir: 片段保存目录
+        fps: 写入视频的帧率，应为送入 process 的画面帧率（视频源帧率 / 检测步长），
+            运行中可通过 process 的 fps 参数更新；预录/后录帧数按创建时的帧率预分配
+        pre_seconds: 触发前保留的秒数
+        post_seconds: 最后一次触发后继续录制的秒数
+        max_clip_seconds: 单个片段的最大时长，持续触发时超过后切分为新片段
+        max_width: 录制画面的最大宽度
+        trigger: 触发规则，默认为 DetectionTrigger()
+        on_saved: 片段写完后的回调 on_saved(path, frame_count)，在后台线程中调用
+    """
+
+    def __init__(self, save_dir='clips', fps=25, pre_seconds=5, post_seconds=5,
+                 max_clip_seconds=60, max_width=1280, trigger=None, on_saved=None):
+        self.save_dir = save_dir
+        self.post_seconds = post_seconds
+        self.max_clip_seconds = max_clip_seconds
+        self.set_fps(fps)
+        self.trigger = trigger or DetectionTrigger()
+        self.on_saved = on_saved
+
+        pre_frames = max(1, int(fps * pre_seconds))
+        self._ring = FrameRingBuffer(pre_frames, max_width)
+        self._spare_rings = queue.Queue()
+        self._spare_rings.put(FrameRingBuffer(pre_frames, max_width))
+
+        # 帧槽池覆盖一个完整的后录阶段；编码队列中只有槽位索引和开始/结束标记
+        self._pool = FramePool(self.post_frames + 2, max_width)
+        self._encode_queue = queue.Queue()
+        self._post_remaining = 0
+        self._clip_frames = 0
+
+        self.clips_saved = 0
+        self.dropped_clips = 0
+        self.dropped_frames = 0
+
+        os.makedirs(save_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._encode_loop, name="clip-encoder", daemon=True)
+        self._thread.start()
+
+    @property
+    def recording(self):
+        return self._post_remaining > 0
+
+    def set_fps(self, fps):
+        """更新写入帧率（下一个片段生效）以及按帧计的后录时长和片段上限"""
+        self.fps = fps
+        self.post_frames = max(1, int(fps * self.post_seconds))
+        self.max_clip_frames = max(1, int(fps * self.max_clip_seconds))
+
+    def process(self, frame, results, fps=None):
+        """每帧调用一次（流水线后处理阶段），fps 为当前送入的画面帧率，None表示不变"""
+        if fps and fps != self.fps:
+            self.set_fps(fps)
+        triggered = self.trigger.update(results)
+
+        if self.recording:
+            self._enqueue_frame(frame)
+            self._clip_frames += 1
+            if triggered:
+                self._post_remaining = self.post_frames
+            else:
+                self._post_remaining -= 1
+
+            if self._post_remaining == 0 or self._clip_frames >= self.max_clip_frames:
+                self._post_remaining = 0
+                self._encode_queue.put(('end', None))
+        elif triggered:
+            self._start_clip(frame)
+
+        self._ring.push(frame)
+
+    def _start_clip(self, frame):
+        try:
+            spare = self._spare_rings.get_nowait()
+        except queue.Empty:
+            # 上一个片段的预录帧还在编码，放弃本次事件
+            self.dropped_clips += 1
+            return
+
+        pre_roll, self._ring = self._ring, spare
+        self._ring.clear()
+        path = os.path.join(self.save_dir, f"event_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]}.mp4")
+        self._encode_queue.put(('start', (path, pre_roll, self.fps)))
+        self._enqueue_frame(frame)
+        self._clip_frames = len(pre_roll) + 1
+        self._post_remaining = self.post_frames
+
+    def _enqueue_frame(self, frame):
+        index = self._pool.put(frame)
+        if index is None:
+            # 编码跟不上，帧槽池已用尽
+            self.dropped_frames += 1
+        else:
+            self._encode_queue.put(('frame', index))
+
+    def _encode_loop(self):
+        writer = None
+        size = None
+        path = None
+        fps = self.fps
+        count = 0
+        while True:
+            kind, payload = self._encode_queue.get()
+            if kind == 'stop':
+                break
+
+            if kind == 'start':
+                path, pre_roll, fps = payload
+                size = pre_roll.frame_size
+                writer = None
+                count = 0
+                if size is not None:
+                    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+                    for frame in pre_roll.frames():
+                        writer.write(frame)
+                        count += 1
+                # 预录帧写完，缓冲归还给录制器
+                self._spare_rings.put(pre_roll)
+
+            elif kind == 'frame':
+                frame = self._pool.get(payload)
+                if path is not None:
+                    if writer is None:
+                        size = self._pool.frame_size
+                        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+                    if (frame.shape[1], frame.shape[0]) != size:
+                        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                    writer.write(frame)
+                    count += 1
+                # 写完后槽位归还给录制器
+                self._pool.release(payload)
+
+            elif kind == 'end' and writer is not None:
+                writer.release()
+                writer = None
+                self.clips_saved += 1
+                if self.on_saved:
+                    self.on_saved(path, count)
+                path = None
+
+        if writer is not None:
+            writer.release()
+            self.clips_saved += 1
+            if self.on_saved:
+                self.on_saved(path, count)
+
+    def stats(self):
+        return {
+            'recording': self.recording,
+            'clips_saved': self.clips_saved,
+            'dropped_clips': self.dropped_clips,
+            'dropped_frames': self.dropped_frames,
+            'buffer_mb': (self._ring.nbytes * 2 + self._pool.nbytes) / 1024 / 1024,
+        }
+
+    def close(self):
+        """结束当前片段并等待编码完成"""
+        if self.recording:
+            self._post_remaining = 0
+            self._encode_queue.put(('end', None))
+        self._encode_queue.put(('stop', None))
+        self._thread.join()
@@ -13,6 +13,7 @@ class TrainingConfig:
     
     # 训练超参数
     epochs = 100               # 训练轮数
+    patience = 50              # 验证指标连续多少epoch没有提升时提前停止
     batch_size = 16            # 批次大小
     imgsz = 640                # 图像大小
     
@@ -27,6 +28,7 @@ class TrainingConfig:
     warmup_epochs = 3.0        # 预热轮数
     warmup_momentum = 0.8      # 预热动量
     warmup_bias_lr = 0.1       # 预热偏置学习率
+    cos_lr = True              # 余弦学习率调度
     
     # 损失函数权重
     box = 7.5                  # 框损失增益
@@ -36,13 +38,18 @@ class TrainingConfig:
     # 训练技巧
     amp = True                 # 自动混合精度训练
     cache = True               # 缓存图像以加速训练
+    image_store = None         # 预处理图片存储目录（dataset_store.py build 生成），设置后优先于cache
     workers = 8                # 数据加载线程数
-    device = '0'               # 使用的设备，'0'表示第一个GPU，'cpu'表示CPU
+    autotune = False           # 按本机探测结果自动选择batch_size和workers（autotune.py，结果按机器保存）
+    device = '0'               # 使用的设备，'0'表示第一个GPU，'0,1'或[0, 1]表示多GPU（DDP），'cpu'表示CPU
+    seed = 0                   # 随机种子
+    deterministic = True       # 使用确定性算法，便于复现（略慢）
     
     # 增强配置
     augment = True             # 是否使用数据增强
     mosaic = 1.0               # 马赛克增强系数，0.0表示禁用
     mixup = 0.1                # 混合增强系数，0.0表示禁用
+    copy_paste = 0.1           # 复制粘贴增强系数，0.0表示禁用
     
     # 输出配置
     project = 'runs/train'     # 保存结果的项目文件夹
@@ -51,13 +58,78 @@ class TrainingConfig:
     
     # 验证配置
     val = True                 # 是否在训练期间进行验证
+    val_every = 1              # 每隔多少epoch验证一次，最后一个epoch总是完整验证
+    val_subset = 0.0           # >0时先在按类别分层抽样的验证子集（比例）上验证，子集指标提升时才完整验证
+    val_subset_seed = 0        # 验证子集的抽样种子
     save_period = -1           # 每隔多少epoch保存一次模型，-1表示只保存最后一个
+    run_test = True            # 训练结束后是否用最佳模型在测试集上评估
     
     # 回调函数配置
     plots = True               # 是否绘制训练图表
     save = True                # 是否保存训练结果
     save_json = False          # 是否保存json格式的预测结果
 
+class QuantizationConfig:
+    # 输入模型
+    project = 'runs/train'     # 训练结果所在的项目文件夹
+    name = 'improved_exp'      # 实验名称，量化 <project>/<name>/weights/best.pt
+    data_yaml = 'data.yaml'    # 验证精度使用的数据集配置
+    imgsz = 640                # 量化模型的输入尺寸
+    opset = 13                 # 导出ONNX的opset版本，INT8 QDQ格式需要>=13
+    method = 'onnx'            # 量化方式：'onnx'（ONNX Runtime静态量化）或 'openvino'（NNCF）
+    
+    # 校准配置
+    calib_images = 'data/val/images'  # 校准图片目录，不存在时使用data.yaml中的val路径
+    calib_size = 200           # 校准使用的图片数量（随机抽样）
+    calib_seed = 0             # 抽样随机种子
+    per_channel = True         # 权重按通道量化
+    exclude_head = True        # 检测头的解码部分（DFL/Sigmoid/Concat等）保持FP32
+    
+    # 精度门限与发布
+    max_map_drop = 0.01        # mAP50-95允许下降的最大值（绝对值），超过则不发布
+    publish_dir = 'weights'    # 通过门限后发布到的目录
+    
+    # 性能测试
+    bench_frames = 50          # 测试延迟/吞吐使用的图片数量
+    bench_batch = 8            # 吞吐测试的批大小
+    threads = None             # ONNX Runtime线程数，None表示使用全部可用CPU核
+
+class SweepConfig:
+    # 调度
+    devices = '0'              # 试验使用的设备，'0,1'表示每块GPU同时运行一个试验，'cpu'表示CPU进程池
+    cpu_workers = 1            # devices为cpu时同时运行的试验数（平分CPU核心）
+    poll_seconds = 30          # 检查训练进度的间隔（秒）
+    
+    # 提前停止（中位数规则）
+    metric = 'metrics/mAP50-95(B)'  # results.csv 中用于提前停止和帕累托表的指标列
+    min_epochs = 10            # 训练满多少epoch后才参与提前停止判断
+    min_trials = 3             # 至少有多少个其他试验到达同一epoch才做判断
+    
+    # 延迟测量（全部试验结束后依次测量）
+    latency_device = 'cpu'     # 测量延迟的设备，应与部署环境一致
+    latency_backend = 'torch'  # 推理后端：torch, onnx, openvino
+    latency_frames = 100       # 使用的验证集图片数
+    latency_warmup = 5         # 预热帧数
+
+class AutotuneConfig:
+    profile_dir = '.autotune'  # 调优结果目录，每台机器一个 <主机名>.json
+    plateau_gain = 0.05        # 吞吐提升小于该比例时视为饱和
+    
+    # 训练批量探测
+    train_min_batch = 4        # 探测的最小批量（单卡）
+    train_max_batch = 256      # 探测的最大批量（单卡）
+    train_probe_steps = 5      # 每个批量测量的训练步数
+    memory_fraction = 0.85     # 显存峰值不超过总显存的比例，为数据增强和碎片留余量
+    min_free_mb = 2048         # CPU训练探测时至少保留的可用内存（MB）
+    
+    # 数据加载探测
+    loader_batches = 10        # 每个workers取值测量的批数
+    loader_margin = 1.2        # 数据加载/解码速度至少为模型消耗速度的倍数
+    
+    # 推理探测
+    infer_max_batch = 64       # 探测的最大推理批量
+    infer_probe_frames = 64    # 探测使用的帧数
+
 class PredictionConfig:
     # 预测配置
     conf_threshold = 0.25      # 置信度阈值
@@ -70,6 +142,113 @@ class PredictionConfig:
     hide_labels = False        # 是否隐藏标签
     hide_conf = False          # 是否隐藏置信度
     half = False               # 是否使用FP16推理
+    device = None              # 推理设备，None表示自动选择，'cpu'或'0'等
+    
+    # 推理后端配置
+    backend = 'torch'          # 推理后端：'torch'、'onnx'（ONNX Runtime CPU）、'openvino'
+    imgsz = 640                # 导出ONNX/OpenVINO模型的输入尺寸
+    onnx_opset = 12            # 导出ONNX的opset版本
+    onnx_threads = None        # ONNX Runtime / OpenVINO 推理线程数，None表示使用全部可用CPU核
+    
+    # 模型缓存配置
+    model_cache_mb = 1024      # 进程内缓存模型的内存预算（MB），超出时按LRU淘汰
+    warmup_imgsz = 640         # 模型加载后预热推理的图像尺寸，0表示不预热
+    
+    # 流水线配置
+    queue_size = 2             # 采集/推理/后处理之间的队列容量
+    drop_oldest = None         # 队列满时是否丢弃最旧帧，None表示摄像头丢弃、视频文件阻塞
+    
+    # 运动门控配置（画面无变化时跳过推理，复用上一帧结果）
+    motion_gate = False        # 是否启用运动门控
+    motion_threshold = 0.002   # 变化像素比例阈值，越小越灵敏；修改后用 benchmarks/validate_motion_gate.py 验证召回
+    motion_pixel_delta = 12    # 灰度差超过该值的像素才算变化
+    motion_keyframe_interval = 30  # 最多连续跳过的帧数，达到后强制推理
+    motion_width = 160         # 差分小图的宽度
+    
+    # 自适应调度配置（推理跟不上视频源时加大检测步长/降低输入尺寸）
+    adaptive_stride = False    # 是否启用自适应调度
+    vid_stride = 1             # 检测步长下限，每N帧检测一次（同ultralytics的vid_stride）
+    max_stride = 8             # 检测步长上限
+    target_latency_ms = 200    # 目标端到端延迟（毫秒）
+    adaptive_imgsz_levels = (640, 480, 320)  # 可选推理输入尺寸，步长达到上限仍跟不上时逐级降低
+    boost_seconds = 5.0        # 检测到火灾/烟雾后恢复逐帧检测的时长（秒）
+    
+    # 分块推理配置（高分辨率画面切成重叠分块检测远处的小目标）
+    tiled = False              # 是否启用分块推理
+    tile_size = 640            # 分块边长（同时作为分块推理的输入尺寸）
+    tile_overlap = 0.2         # 相邻分块的重叠比例
+    tile_merge = 'nms'         # 分块结果合并方式：'nms' 或 'wbf'（加权框融合）
+    tile_merge_iou = 0.5       # 合并时的IoU阈值
+    tile_roi_only = False      # 只对整帧粗检框附近的分块做精检
+    tile_coarse_conf = 0.1     # ROI模式下整帧粗检的置信度阈值
+    tile_roi_margin = 0.5      # ROI向外扩展的比例（相对框的宽高）
+    
+    # 目标跟踪与告警去抖配置
+    tracking = True            # 是否启用目标跟踪与告警状态机
+    track_high_thresh = 0.4    # 高于该置信度的检测框才能创建新轨迹
+    track_low_thresh = 0.1     # 低置信度框只用于延续已有轨迹
+    track_match_iou = 0.3      # 关联所需的最小IoU
+    track_max_age = 30         # 轨迹连续未匹配超过该帧数后删除
+    alarm_min_hits = 3         # N-of-M规则：最近alarm_window帧中至少出现的帧数
+    alarm_window = 5           # N-of-M规则的窗口帧数
+    alarm_fire_min_growth = 0.1  # 火焰面积相对首次出现时的最小增长比例，0表示不检查
+    alarm_clear_frames = 25    # 连续多少帧没有满足条件的目标后结束告警
+    alarm_cooldown_seconds = 30.0  # 告警结束后的冷却时长，期间再次触发视为同一事件
+    
+    # 检测事件日志配置（按列批量写入，用于按天统计分析）
+    event_log = False          # 是否记录检测事件日志
+    event_log_dir = 'events'   # 日志目录，分段文件按日期存放在子目录中
+    event_log_format = None    # 'parquet'（需要pyarrow）/ 'npz'，None表示自动选择
+    event_flush_rows = 10000   # 内存中累计的行数达到该值时立即写入
+    event_flush_seconds = 5.0  # 定期写入的间隔（秒）
+    event_segment_rows = 1000000  # 单个分段的最大行数，超过后轮转
+    event_segment_seconds = 3600  # 单个分段的最长时长（秒），超过后轮转
+    
+    # 本地推理服务配置（firedetect serve）
+    server_host = '127.0.0.1'  # 监听地址，默认只接受本机请求
+    server_port = 8765         # 监听端口
+    server_max_batch = 8       # 微批处理的最大帧数
+    server_max_wait_ms = 5     # 收到第一帧后最多等待多久再凑批（毫秒）
+    server_max_inflight = 4    # 每个WebSocket连接同时处理的最大帧数
+    server_decode_workers = 4  # 图片解码线程数
+    server_max_body_mb = 20    # 单张图片的最大字节数（MB）
+    
+    # 目录批量检测配置（firedetect batch / 界面"图片文件夹"）
+    batch_size = 16            # 每次推理的图片数，显存不足时自动减半
+    batch_workers = 4          # 解码线程数
+    batch_prefetch = 2         # 提前解码的批数
+    
+    # 解码帧缓存配置（预览与图片检测共用）
+    frame_cache_mb = 512       # 缓存解码帧的内存预算（MB），超出后按LRU淘汰
+    frame_cache_workers = 2    # 后台预取线程数
+    preview_max_side = 960     # 预览图长边的最小像素数，据此选择 IMREAD_REDUCED 缩小倍数
+    folder_prefetch = 32       # 打开图片文件夹时预取预览的图片数
+    
+    # 推理结果缓存配置（相同模型、参数和帧内容直接返回已保存的检测框）
+    result_cache = False       # 是否默认启用
+    result_cache_dir = '.result_cache'  # 磁盘缓存目录，每个模型一个打包文件
+    result_cache_items = 4096  # 内存层保存的帧数
+    
+    # 自动调优配置（autotune.py）
+    autotune = False           # 批量检测/推理服务是否默认按本机调优结果选择批量和线程数
+    
+    # 显示配置
+    display_fps = 60           # 界面刷新帧率上限，实际取其与显示器刷新率的较小值
+    
+    # 检测结果保存配置
+    save_mode = 'all'          # 保存方式：'all'全部显示的帧（与原先的保存行为一致），'detections'只保存有目标的帧，'video'分段视频
+    save_every_n = 1           # 每隔N帧保存一帧
+    save_workers = 2           # 后台写入线程数
+    save_queue_size = 32       # 待写入队列容量，满时丢弃新帧
+    
+    # 事件片段录制配置
+    clip_fps = 25              # 录制片段的默认帧率，无法获取视频源帧率时使用（实际按 源帧率/检测步长 写入）
+    clip_pre_seconds = 5       # 触发前预录的秒数
+    clip_post_seconds = 5      # 最后一次触发后继续录制的秒数
+    clip_min_conf = 0.5        # 触发所需的最低置信度
+    clip_min_hits = 3          # 最近clip_window帧中至少多少帧检测到火灾/烟雾才触发
+    clip_window = 5            # 触发判定的滑动窗口帧数
+    clip_max_width = 1280      # 录制画面的最大宽度，控制环形缓冲内存
     
     # 输出配置
     save_crop = False          # 是否保存裁剪的预测框
@@ -0,0 +1,447 @@
+"""
+训练图片预处理存储
+
+训练时每个epoch都要重新解码、缩放全部JPEG（args.yaml 中 cache: false），数据加载成为瓶颈。
+本工具把 train/val 图片一次性解码并按训练尺寸letterbox，写入内存映射的 uint8 数组
+（N × imgsz × imgsz × 3），标签打包为紧凑的NumPy索引；训练时由 StoreDataset 直接从
+内存映射中切出缩放后的图片，跳过JPEG解码和缩放，数据增强等其余流程保持不变。
+
+存储文件（<out>/<split>_<imgsz>.*）:
+    images.npy   内存映射的图片数组，每行为居中letterbox后的图片（填充值114）
+    index.npz    文件列表、原图/缩放后尺寸、填充偏移、标签（cls、归一化xywh及每张图的起止位置）
+    json         构建信息：源目录、文件指纹、耗时、大小；源图片未变化时不会重复构建
+
+用法:
+    python dataset_store.py build --data-yaml data.yaml --imgsz 640
+    python dataset_store.py bench --data-yaml data.yaml --store data/image_store
+    python dataset_store.py compare runs/train/baseline runs/train/store_exp
+训练时在 train.py 中设置 image_store 为存储目录即可。
+"""
+import argparse
+import concurrent.futures
+import glob
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+import yaml
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+PAD_VALUE = 114
+DEFAULT_STORE_DIR = os.path.join('data', 'image_store')
+IMAGE_STORE_ENV = 'FIRE_DETECT_IMAGE_STORE'  # 训练进程（含DDP子进程）使用的存储目录
+
+
+def resolve_split_dir(data_yaml, split):
+    """数据集配置中某个划分的图片目录，配置中的路径不存在时退回到本地 data/<split>/images"""
+    with open(data_yaml, 'r', encoding='utf-8') as f:
+        data = yaml.safe_load(f)
+    image_dir = data.get(split, '')
+    if data.get('path') and image_dir and not os.path.isabs(image_dir):
+        image_dir = os.path.join(data['path'], image_dir)
+    if image_dir and os.path.isdir(image_dir):
+        return image_dir
+    local = os.path.join('data', split, 'images')
+    if os.path.isdir(local):
+        return local
+    raise FileNotFoundError(f"找不到 {split} 图片目录: {image_dir} 或 {local}")
+
+
+def list_images(image_dir):
+    return sorted(p for p in glob.glob(os.path.join(image_dir, '**', '*'), recursive=True)
+                  if p.lower().endswith(IMAGE_EXTS))
+
+
+def label_path(image_path):
+    """与ultralytics相同的标签路径规则：/images/ 替换为 /labels/，扩展名改为 .txt"""
+    sa, sb = f"{os.sep}images{os.sep}", f"{os.sep}labels{os.sep}"
+    return sb.join(image_path.rsplit(sa, 1)).rsplit('.', 1)[0] + '.txt'
+
+
+def read_labels(path):
+    """读取YOLO格式标签，返回 cls (n,) 和归一化 xywh (n, 4)；多边形标注转换为外接框"""
+    classes, boxes = [], []
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                values = line.split()
+                if len(values) < 5:
+                    continue
+                coords = np.asarray(values[1:], dtype=np.float32)
+                if len(coords) > 4:
+                    xy = coords.reshape(-1, 2)
+                    (x1, y1), (x2, y2) = xy.min(axis=0), xy.max(axis=0)
+                    coords = np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], dtype=np.float32)
+                classes.append(int(float(values[0])))
+                boxes.append(coords)
+    return (np.asarray(classes, dtype=np.int16),
+            np.asarray(boxes, dtype=np.float32).reshape(-1, 4))
+
+
+def resized_shape(h0, w0, imgsz):
+    """与ultralytics BaseDataset.load_image 相同：长边缩放到imgsz，保持宽高比"""
+    r = imgsz / max(h0, w0)
+    if r == 1:
+        return h0, w0
+    return min(math.ceil(h0 * r), imgsz), min(math.ceil(w0 * r), imgsz)
+
+
+def fingerprint(paths):
+    """源图片及标签的指纹（路径、大小、修改时间），用于判断存储是否过期"""
+    digest = hashlib.sha1()
+    for path in paths:
+        for p in (path, label_path(path)):
+            if os.path.exists(p):
+                stat = os.stat(p)
+                digest.update(f"{p}:{stat.st_size}:{stat.st_mtime_ns};".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def store_prefix(out_dir, split, imgsz):
+    return os.path.join(out_dir, f"{split}_{imgsz}")
+
+
+def build_store(image_dir, out_dir, split, imgsz=640, workers=8, force=False):
+    """解码并letterbox整个目录，写入内存映射存储，返回构建信息"""
+    paths = list_images(image_dir)
+    if not paths:
+        raise FileNotFoundError(f"目录中没有图片: {image_dir}")
+    prefix = store_prefix(out_dir, split, imgsz)
+    source_fingerprint = fingerprint(paths)
+    if not force and os.path.exists(prefix + '.json'):
+        with open(prefix + '.json', 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('fingerprint') == source_fingerprint and os.path.exists(prefix + '.images.npy'):
+            manifest['skipped'] = True
+            return manifest
+
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+    n = len(paths)
+    images = np.lib.format.open_memmap(prefix + '.images.npy.tmp', mode='w+', dtype=np.uint8,
+                                       shape=(n, imgsz, imgsz, 3))
+    shapes0 = np.zeros((n, 2), dtype=np.int32)  # 原图 h, w
+    shapes = np.zeros((n, 2), dtype=np.int32)  # 缩放后 h, w
+    pads = np.zeros((n, 2), dtype=np.int32)  # 上、左填充
+    valid = np.zeros(n, dtype=bool)
+
+    def process(i):
+        img = cv2.imread(paths[i])
+        if img is None:
+            images[i] = PAD_VALUE
+            return
+        h0, w0 = img.shape[:2]
+        h, w = resized_shape(h0, w0, imgsz)
+        if (h, w) != (h0, w0):
+            img = cv2.resize(img, (w, h), interpolation=cv2.INTER_LINEAR)
+        top, left = (imgsz - h) // 2, (imgsz - w) // 2
+        row = images[i]
+        row[:] = PAD_VALUE
+        row[top:top + h, left:left + w] = img
+        shapes0[i], shapes[i], pads[i] = (h0, w0), (h, w), (top, left)
+        valid[i] = True
+
+    # 每个线程写入不同的行，互不冲突；cv2的解码和缩放会释放GIL
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(process, range(n)))
+    images.flush()
+    del images
+
+    # 标签打包：所有框连续存放，label_index[i]:label_index[i+1] 为第i张图的标签
+    all_cls, all_boxes, label_index = [], [], [0]
+    for path in paths:
+        cls, boxes = read_labels(label_path(path))
+        all_cls.append(cls)
+        all_boxes.append(boxes)
+        label_index.append(label_index[-1] + len(cls))
+    np.savez(prefix + '.index.npz',
+             files=np.asarray([os.path.abspath(p) for p in paths]),
+             shapes0=shapes0, shapes=shapes, pads=pads, valid=valid,
+             label_index=np.asarray(label_index, dtype=np.int64),
+             cls=np.concatenate(all_cls) if all_cls else np.empty(0, dtype=np.int16),
+             boxes=np.concatenate(all_boxes) if all_boxes else np.empty((0, 4), dtype=np.float32))
+    os.replace(prefix + '.images.npy.tmp', prefix + '.images.npy')
+
+    manifest = {
+        'split': split,
+        'image_dir': os.path.abspath(image_dir),
+        'imgsz': imgsz,
+        'images': n,
+        'invalid': int(n - valid.sum()),
+        'labels': int(label_index[-1]),
+        'size_mb': os.path.getsize(prefix + '.images.npy') / 1024 / 1024,
+        'build_seconds': time.perf_counter() - start,
+        'fingerprint': source_fingerprint,
+    }
+    with open(prefix + '.json', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+class ImageStore:
+    """只读打开的图片存储"""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        with open(prefix + '.json', 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.imgsz = self.manifest['imgsz']
+        self.images = np.load(prefix + '.images.npy', mmap_mode='r')
+        with np.load(prefix + '.index.npz') as index:
+            self.files = [str(p) for p in index['files']]
+            self.shapes0 = index['shapes0']
+            self.shapes = index['shapes']
+            self.pads = index['pads']
+            self.valid = index['valid']
+            self.label_index = index['label_index']
+            self.cls = index['cls']
+            self.boxes = index['boxes']
+        self.index_of = {path: i for i, path in enumerate(self.files)}
+
+    def __getstate__(self):
+        # DataLoader工作进程以spawn方式启动时只传递路径，在子进程中重新映射，不拷贝图片数据
+        state = self.__dict__.copy()
+        state['images'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.images = np.load(self.prefix + '.images.npy', mmap_mode='r')
+
+    @classmethod
+    def find(cls, store_dir, image_dir, imgsz):
+        """查找与图片目录和尺寸匹配的存储，没有时返回None"""
+        image_dir = os.path.abspath(image_dir)
+        for manifest_path in glob.glob(os.path.join(store_dir, f"*_{imgsz}.json")):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('image_dir') == image_dir and manifest.get('imgsz') == imgsz:
+                return cls(manifest_path[:-len('.json')])
+        return None
+
+    def image(self, i):
+        """缩放后（未填充）的图片视图"""
+        (h, w), (top, left) = self.shapes[i], self.pads[i]
+        return self.images[i, top:top + h, left:left + w]
+
+    def labels(self, i):
+        start, end = self.label_index[i], self.label_index[i + 1]
+        return self.cls[start:end], self.boxes[start:end]
+
+
+def make_store_trainer(store_dir):
+    """返回从图片存储读取数据的 DetectionTrainer 子类，用法: model.train(trainer=..., cache=False)
+
+    train/val 数据集在存储中找到与图片目录和 imgsz 匹配的条目时从内存映射读取，
+    否则（或个别图片不在存储中时）退回到ultralytics原有的读取方式。
+    存储目录通过环境变量传递，多GPU训练时ultralytics生成的DDP子进程
+    以 `from dataset_store import StoreTrainer` 导入同一个类。
+    """
+    os.environ[IMAGE_STORE_ENV] = os.path.abspath(store_dir)
+    return _store_classes()[1]
+
+
+_classes = None
+
+
+def _store_classes():
+    """首次使用时才导入ultralytics并定义 (StoreDataset, StoreTrainer)"""
+    global _classes
+    if _classes is not None:
+        return _classes
+
+    from ultralytics.data import YOLODataset
+    from ultralytics.models.yolo.detect import DetectionTrainer
+    from ultralytics.utils import colorstr
+    from ultralytics.utils.torch_utils import de_parallel
+
+    class StoreDataset(YOLODataset):
+        def __init__(self, *args, store=None, **kwargs):
+            self.store = store
+            self.store_index = []
+            super().__init__(*args, **kwargs)
+            # 父类可能过滤掉没有有效标签的图片，按最终的文件列表建立映射
+            if store is not None:
+                self.store_index = [store.index_of.get(os.path.abspath(p)) for p in self.im_files]
+
+        def get_labels(self):
+            if self.store is None:
+                return super().get_labels()
+            indices = [self.store.index_of.get(os.path.abspath(p)) for p in self.im_files]
+            if any(k is None or not self.store.valid[k] for k in indices):
+                # 存储不完整（新增了图片等）：标签按原方式读取，图片能找到的仍从存储读取
+                return super().get_labels()
+            labels = []
+            for path, k in zip(self.im_files, indices):
+                cls, boxes = self.store.labels(k)
+                labels.append({
+                    'im_file': path,
+                    'shape': tuple(int(v) for v in self.store.shapes0[k]),
+                    'cls': cls.astype(np.float32).reshape(-1, 1),
+                    'bboxes': boxes.copy(),
+                    'segments': [],
+                    'keypoints': None,
+                    'normalized': True,
+                    'bbox_format': 'xywh',
+                })
+            return labels
+
+        def load_image(self, i, rect_mode=True):
+            k = self.store_index[i] if i < len(self.store_index) else None
+            if not rect_mode or k is None or not self.store.valid[k]:
+                return super().load_image(i, rect_mode)
+            im = np.array(self.store.image(k))  # 拷贝：数据增强会原地修改图片
+            hw0, hw = tuple(self.store.shapes0[k]), im.shape[:2]
+            if self.augment:
+                # 与父类一致地维护马赛克增强使用的缓冲区
+                self.ims[i], self.im_hw0[i], self.im_hw[i] = im, hw0, hw
+                self.buffer.append(i)
+                if 1 < len(self.buffer) >= self.max_buffer_length:
+                    j = self.buffer.pop(0)
+                    self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+            return im, hw0, hw
+
+    class StoreTrainer(DetectionTrainer):
+        def build_dataset(self, img_path, mode='train', batch=None):
+            cfg = self.args
+            stride = max(int(de_parallel(self.model).stride.max() if self.model else 0), 32)
+            store_dir = os.environ.get(IMAGE_STORE_ENV)
+            store = ImageStore.find(store_dir, img_path, cfg.imgsz) if store_dir and isinstance(img_path, str) else None
+            return StoreDataset(
+                img_path=img_path,
+                imgsz=cfg.imgsz,
+                batch_size=batch,
+                augment=mode == 'train',
+                hyp=cfg,
+                rect=cfg.rect or mode == 'val',
+                # 从存储读取时不再需要ultralytics的缓存；没有存储时与 build_yolo_dataset 一致
+                cache=None if store is not None else (cfg.cache or None),
+                single_cls=cfg.single_cls or False,
+                stride=stride,
+                pad=0.0 if mode == 'train' else 0.5,
+                prefix=colorstr(f"{mode}: "),
+                task=cfg.task,
+                classes=cfg.classes,
+                data=self.data,
+                fraction=cfg.fraction if mode == 'train' else 1.0,
+                store=store,
+            )
+
+    StoreDataset.__module__ = StoreTrainer.__module__ = __name__
+    StoreDataset.__qualname__, StoreTrainer.__qualname__ = 'StoreDataset', 'StoreTrainer'
+    _classes = (StoreDataset, StoreTrainer)
+    return _classes
+
+
+def __getattr__(name):
+    # 支持 from dataset_store import StoreTrainer（DDP子进程）而不在导入本模块时加载ultralytics
+    if name in ('StoreDataset', 'StoreTrainer'):
+        return _store_classes()[name == 'StoreTrainer']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def epoch_times(run_dir):
+    """从 results.csv 的累计 time 列计算每个epoch的耗时（秒）"""
+    path = os.path.join(run_dir, 'results.csv') if os.path.isdir(run_dir) else run_dir
+    with open(path, 'r', encoding='utf-8') as f:
+        header = [h.strip() for h in f.readline().split(',')]
+        if 'time' not in header:
+            raise ValueError(f"{path} 中没有time列（需要较新版本的ultralytics）")
+        column = header.index('time')
+        cumulative = [float(line.split(',')[column]) for line in f if line.strip()]
+    return np.diff([0.0] + cumulative)
+
+
+def bench_loading(image_dir, store_dir, imgsz, samples, data):
+    """对比从原图和从存储读取（含数据增强）单个样本的耗时，data为数据集配置（需要names）"""
+    from ultralytics.cfg import get_cfg
+    from ultralytics.data import YOLODataset
+
+    cfg = get_cfg(overrides={'imgsz': imgsz})
+    make_store_trainer(store_dir)
+    dataset_class = _store_classes()[0]
+    store = ImageStore.find(store_dir, image_dir, imgsz)
+    if store is None:
+        raise FileNotFoundError(f"{store_dir} 中没有 {image_dir} 的 {imgsz} 尺寸存储，请先运行 build")
+
+    common = dict(img_path=image_dir, imgsz=imgsz, batch_size=16, augment=True, hyp=cfg, data=data)
+    rows = {}
+    for label, dataset in (('原图', YOLODataset(**common)), ('存储', dataset_class(store=store, **common))):
+        count = min(samples, len(dataset))
+        start = time.perf_counter()
+        for i in range(count):
+            dataset[i]
+        per_sample = (time.perf_counter() - start) / count
+        rows[label] = {'ms_per_sample': per_sample * 1000, 'epoch_seconds': per_sample * len(dataset)}
+    return rows
+
+
+def run_build(args):
+    for split in args.splits:
+        image_dir = resolve_split_dir(args.data_yaml, split)
+        print(f"构建 {split}: {image_dir}")
+        manifest = build_store(image_dir, args.out, split, args.imgsz, args.workers, args.force)
+        if manifest.get('skipped'):
+            print(f"  源图片未变化，跳过（{manifest['images']} 张，{manifest['size_mb']:.0f} MB）")
+        else:
+            print(f"  {manifest['images']} 张（无法读取 {manifest['invalid']} 张），{manifest['labels']} 个标注框，"
+                  f"{manifest['size_mb']:.0f} MB，耗时 {manifest['build_seconds']:.1f}s")
+    return 0
+
+
+def run_bench(args):
+    image_dir = resolve_split_dir(args.data_yaml, 'train')
+    with open(args.data_yaml, 'r', encoding='utf-8') as f:
+        data = yaml.safe_load(f)
+    rows = bench_loading(image_dir, args.store, args.imgsz, args.samples, data)
+    print(f"{'读取方式':<8}{'每个样本(ms)':>14}{'单进程每epoch(s)':>18}")
+    for label, row in rows.items():
+        print(f"{label:<8}{row['ms_per_sample']:>14.2f}{row['epoch_seconds']:>18.1f}")
+    print(f"数据加载加速: {rows['原图']['ms_per_sample'] / rows['存储']['ms_per_sample']:.2f}x"
+          f"（实际epoch耗时取决于数据加载是否是瓶颈，请用 compare 对比两次训练）")
+    return 0
+
+
+def run_compare(args):
+    base, new = epoch_times(args.baseline), epoch_times(args.candidate)
+    print(f"基线: {args.baseline}（{len(base)} 个epoch，中位 {np.median(base):.1f}s/epoch）")
+    print(f"对比: {args.candidate}（{len(new)} 个epoch，中位 {np.median(new):.1f}s/epoch）")
+    print(f"每个epoch减少 {np.median(base) - np.median(new):.1f}s（{1 - np.median(new) / np.median(base):.1%}）")
+    return 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='训练图片预处理存储（内存映射）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='解码并letterbox图片，写入存储')
+    build_parser.add_argument('--data-yaml', default='data.yaml')
+    build_parser.add_argument('--splits', nargs='+', default=['train', 'val'])
+    build_parser.add_argument('--imgsz', type=int, default=640, help='与训练时的imgsz一致')
+    build_parser.add_argument('--out', default=DEFAULT_STORE_DIR, help='存储目录')
+    build_parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help='解码线程数')
+    build_parser.add_argument('--force', action='store_true', help='源图片未变化也重新构建')
+    build_parser.set_defaults(func=run_build)
+
+    bench_parser = subparsers.add_parser('bench', help='对比从原图和从存储读取训练样本的耗时')
+    bench_parser.add_argument('--data-yaml', default='data.yaml')
+    bench_parser.add_argument('--store', default=DEFAULT_STORE_DIR)
+    bench_parser.add_argument('--imgsz', type=int, default=640)
+    bench_parser.add_argument('--samples', type=int, default=500)
+    bench_parser.set_defaults(func=run_bench)
+
+    compare_parser = subparsers.add_parser('compare', help='对比两次训练的epoch耗时（results.csv）')
+    compare_parser.add_argument('baseline', help='基线训练目录或results.csv')
+    compare_parser.add_argument('candidate', help='使用存储的训练目录或results.csv')
+    compare_parser.set_defaults(func=run_compare)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    sys.exit(args.func(args))
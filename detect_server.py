@@ -0,0 +1,290 @@
+"""
+本地推理服务（HTTP / WebSocket）
+
+其他服务通过HTTP发送图片即可使用火灾/烟雾检测模型，无需各自集成ultralytics：
+    POST /detect   请求体为JPEG/PNG字节，返回检测框JSON（可用 ?conf=0.3 覆盖置信度阈值）
+    GET  /ws       WebSocket，客户端逐帧发送二进制图片，服务按发送顺序逐帧返回JSON
+    GET  /stats    批处理统计
+    GET  /health   健康检查
+
+模型与 VideoThread.run 一样从进程级缓存加载，所有连接共享同一个模型。
+并发请求由微批处理器按最大批量和最长等待时间合并成一次批量推理：
+空闲时单个请求几乎不用等待，负载高时自动攒成大批次提高吞吐。
+依赖aiohttp（pip install aiohttp），仅在启动服务时导入。
+"""
+import asyncio
+import concurrent.futures
+import json
+import time
+
+import cv2
+import numpy as np
+
+import utils
+import model_cache
+from config import PredictionConfig
+from detection_pipeline import StageMeter
+from tiled_inference import create_tiled_predictor
+
+
+class MicroBatcher:
+    """把并发的单帧请求合并为批量推理
+
+    参数:
+        model: 已加载的模型，所有请求共享
+        conf: 默认置信度阈值
+        max_batch: 单次推理的最大帧数
+        max_wait_ms: 收到第一帧后最多等待多久再凑批
+        imgsz: 推理输入尺寸，None表示使用模型默认值
+
+    推理在单独的线程中串行执行，不阻塞事件循环；置信度阈值不同的请求分到不同批次。
+    """
+
+    def __init__(self, model, conf=0.25, max_batch=8, max_wait_ms=5, imgsz=None):
+        self.model = model
+        self.conf = conf
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.imgsz = imgsz
+        self.batch_meter = StageMeter('batch')
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self._queue = None
+        self._task = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="server-infer")
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=True)
+
+    async def submit(self, frame, conf=None):
+        """提交一帧，返回该帧的检测结果（Results）"""
+        future = asyncio.get_event_loop().create_future()
+        self.requests += 1
+        await self._queue.put((frame, self.conf if conf is None else conf, future))
+        return await future
+
+    async def _collect(self):
+        """取出第一帧后在等待时间内尽量凑满一个批次"""
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _loop(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = await self._collect()
+            # 按置信度阈值分组，每组一次推理
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[1], []).append(item)
+            for conf, items in groups.items():
+                frames = [frame for frame, _, _ in items]
+                start = time.perf_counter()
+                try:
+                    results = await loop.run_in_executor(self._executor, self._predict, frames, conf)
+                except Exception as e:
+                    self.errors += 1
+                    for _, _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                self.batch_meter.record(time.perf_counter() - start)
+                self.batches += 1
+                for (_, _, future), result in zip(items, results):
+                    if not future.done():
+                        future.set_result(result)
+
+    def _predict(self, frames, conf):
+        kwargs = {'imgsz': self.imgsz} if self.imgsz else {}
+        return self.model.predict(frames, conf=conf, verbose=False, **kwargs)
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'avg_batch': self.requests / self.batches if self.batches else 0.0,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'errors': self.errors,
+            'batch': self.batch_meter.snapshot(),
+        }
+
+
+class DetectServer:
+    """aiohttp应用：HTTP单帧检测与WebSocket帧流检测
+
+    参数:
+        batcher: 微批处理器
+        decode_workers: 图片解码线程数（cv2.imdecode 会释放GIL）
+        max_inflight: 每个WebSocket连接同时处理的最大帧数，超过后暂停读取（背压）
+    """
+
+    def __init__(self, batcher, decode_workers=4, max_inflight=4):
+        self.batcher = batcher
+        self.max_inflight = max(1, max_inflight)
+        self._decoder = concurrent.futures.ThreadPoolExecutor(max_workers=decode_workers,
+                                                              thread_name_prefix="server-decode")
+        self.start_time = time.time()
+
+    def create_app(self):
+        from aiohttp import web
+
+        app = web.Application(client_max_size=PredictionConfig.server_max_body_mb * 1024 * 1024)
+        app.router.add_post('/detect', self.handle_detect)
+        app.router.add_get('/ws', self.handle_ws)
+        app.router.add_get('/stats', self.handle_stats)
+        app.router.add_get('/health', self.handle_health)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    async def _on_startup(self, app):
+        self.batcher.start()
+
+    async def _on_cleanup(self, app):
+        await self.batcher.stop()
+        self._decoder.shutdown(wait=False)
+
+    async def _decode(self, data):
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        frame = await asyncio.get_event_loop().run_in_executor(
+            self._decoder, cv2.imdecode, buffer, cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError("无法解码图片")
+        return frame
+
+    async def _detect(self, data, conf=None):
+        """解码并检测一帧，返回可直接序列化的字典"""
+        start = time.perf_counter()
+        frame = await self._decode(data)
+        result = await self.batcher.submit(frame, conf)
+        return {
+            'width': frame.shape[1],
+            'height': frame.shape[0],
+            'detections': utils.result_to_detections(result),
+            'latency_ms': round((time.perf_counter() - start) * 1000, 2),
+        }
+
+    async def handle_detect(self, request):
+        from aiohttp import web
+
+        try:
+            conf = float(request.query['conf']) if 'conf' in request.query else None
+            payload = await self._detect(await request.read(), conf)
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        except Exception as e:
+            return web.json_response({'error': str(e)}, status=500)
+        return web.json_response(payload, dumps=lambda obj: json.dumps(obj, ensure_ascii=False))
+
+    async def handle_ws(self, request):
+        from aiohttp import web, WSMsgType
+
+        # 握手前校验参数，与 /detect 一样返回400
+        try:
+            conf = float(request.query['conf']) if 'conf' in request.query else None
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=400)
+
+        ws = web.WebSocketResponse(max_msg_size=PredictionConfig.server_max_body_mb * 1024 * 1024)
+        await ws.prepare(request)
+
+        # 读取与发送分离：最多 max_inflight 帧同时在处理，结果按接收顺序返回
+        pending = asyncio.Queue(maxsize=self.max_inflight)
+
+        async def sender():
+            index = 0
+            while True:
+                task = await pending.get()
+                if task is None:
+                    break
+                try:
+                    payload = await task
+                except Exception as e:
+                    payload = {'error': str(e)}
+                payload['frame'] = index
+                index += 1
+                try:
+                    await ws.send_str(json.dumps(payload, ensure_ascii=False))
+                except Exception:
+                    break  # 连接已断开，停止发送
+
+        async def enqueue(item):
+            """放入待发送队列；发送端已退出时返回False，避免队列满后永远阻塞"""
+            put = asyncio.ensure_future(pending.put(item))
+            await asyncio.wait([put, send_task], return_when=asyncio.FIRST_COMPLETED)
+            if put.done():
+                return True
+            put.cancel()
+            return False
+
+        send_task = asyncio.ensure_future(sender())
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.BINARY:
+                    task = asyncio.ensure_future(self._detect(msg.data, conf))
+                    if send_task.done() or not await enqueue(task):
+                        task.cancel()
+                        break
+                elif msg.type == WSMsgType.ERROR:
+                    break
+            if not send_task.done() and await enqueue(None):
+                await send_task
+        finally:
+            send_task.cancel()
+            # 发送端提前退出时丢弃仍在排队的帧
+            while not pending.empty():
+                task = pending.get_nowait()
+                if task is not None:
+                    task.cancel()
+        return ws
+
+    async def handle_stats(self, request):
+        from aiohttp import web
+
+        return web.json_response(self.batcher.stats())
+
+    async def handle_health(self, request):
+        from aiohttp import web
+
+        return web.json_response({'status': 'ok', 'uptime': round(time.time() - self.start_time, 1)})
+
+
+def load_server_model(model_path, backend=PredictionConfig.backend, tiled=False):
+    """与 VideoThread.run 相同的模型加载方式：进程级缓存（已预热），可选分块推理"""
+    model = model_cache.get_model(model_path, backend=backend)
+    if tiled:
+        model = create_tiled_predictor(model)
+    return model
+
+
+def run_server(model_path, host=PredictionConfig.server_host, port=PredictionConfig.server_port,
+               backend=PredictionConfig.backend, conf=PredictionConfig.conf_threshold,
+               max_batch=PredictionConfig.server_max_batch, max_wait_ms=PredictionConfig.server_max_wait_ms,
+               tiled=False, log=print):
+    """加载模型并启动服务，阻塞到进程退出"""
+    from aiohttp import web
+
+    model = load_server_model(model_path, backend, tiled)
+    batcher = MicroBatcher(model, conf, max_batch, max_wait_ms)
+    server = DetectServer(batcher, PredictionConfig.server_decode_workers, PredictionConfig.server_max_inflight)
+    log(f"推理服务已启动: http://{host}:{port}（最大批量 {max_batch}，最长等待 {max_wait_ms} ms）")
+    web.run_app(server.create_app(), host=host, port=port, print=None)
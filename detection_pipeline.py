@@ -0,0 +1,369 @@
+"""
+检测流水线：采集 / 推理 / 后处理 三级流水线
+
+三个阶段各自运行在独立线程中，通过有界队列连接，
+使视频解码与模型推理可以并行进行。本模块不依赖PyQt5，GUI与命令行共用。
+"""
+import math
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from motion_gate import reuse_results
+
+
+class FrameQueue:
+    """有界帧队列
+
+    队列满时根据策略处理：drop_oldest=True 时丢弃最旧的一项（适合摄像头，保证低延迟），
+    否则阻塞生产者直到有空位（适合视频文件，保证不丢帧）。
+    """
+
+    def __init__(self, maxsize=2, drop_oldest=True):
+        self.maxsize = max(1, int(maxsize))
+        self.drop_oldest = drop_oldest
+        self.dropped = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item):
+        """放入一项，队列已关闭时返回False"""
+        with self._cond:
+            while len(self._items) >= self.maxsize and not self._closed:
+                if self.drop_oldest:
+                    self._items.popleft()
+                    self.dropped += 1
+                    break
+                self._cond.wait(0.1)
+
+            if self._closed:
+                return False
+
+            self._items.append(item)
+            self._cond.notify_all()
+            return True
+
+    def get(self):
+        """取出一项，队列关闭且已取空时返回None"""
+        with self._cond:
+            while not self._items:
+                if self._closed:
+                    return None
+                self._cond.wait(0.1)
+
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def close(self, discard=False):
+        """关闭队列，discard=True 时丢弃尚未取出的项"""
+        with self._cond:
+            self._closed = True
+            if discard:
+                self._items.clear()
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class FrameMailbox:
+    """单槽邮箱：生产者覆盖写入，消费者按自己的节奏取走最新一项
+
+    用于检测线程与界面之间传递帧，界面处理得慢时旧帧被直接覆盖，
+    不会在事件队列中堆积，显示延迟始终不超过一帧。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._item = None
+        self.posted = 0
+        self.taken = 0
+        self.dropped = 0  # 未被取走就被覆盖的项数
+
+    def post(self, item):
+        with self._lock:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self.posted += 1
+
+    def take(self):
+        """取走最新一项，没有新项时返回None"""
+        with self._lock:
+            item = self._item
+            self._item = None
+            if item is not None:
+                self.taken += 1
+            return item
+
+    def stats(self):
+        with self._lock:
+            return {'posted': self.posted, 'rendered': self.taken, 'dropped': self.dropped}
+
+
+class StageMeter:
+    """单个阶段的吞吐与耗时统计（按1秒窗口计算）"""
+
+    def __init__(self, name, window=1.0):
+        self.name = name
+        self.window = window
+        self.fps = 0.0
+        self.latency_ms = 0.0  # 窗口内平均单帧处理耗时
+        self.total = 0
+        self._count = 0
+        self._busy = 0.0
+        self._window_start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, busy_seconds):
+        """记录处理完成的一帧及其耗时"""
+        with self._lock:
+            self._count += 1
+            self.total += 1
+            self._busy += busy_seconds
+
+            now = time.perf_counter()
+            elapsed = now - self._window_start
+            if elapsed >= self.window:
+                self.fps = self._count / elapsed
+                self.latency_ms = self._busy / self._count * 1000
+                self._count = 0
+                self._busy = 0.0
+                self._window_start = now
+
+    def snapshot(self):
+        return {'fps': self.fps, 'latency_ms': self.latency_ms, 'total': self.total}
+
+
+class FramePacket:
+    """在各阶段之间传递的帧数据，track_ids/events 由跟踪处理器填写"""
+    __slots__ = ('index', 'frame', 'capture_time', 'results', 'track_ids', 'events')
+
+    def __init__(self, index, frame, capture_time):
+        self.index = index
+        self.frame = frame
+        self.capture_time = capture_time
+        self.results = None
+        self.track_ids = None
+        self.events = None
+
+
+class DetectionPipeline:
+    """三级检测流水线：采集线程 → 推理线程 → 后处理线程
+
+    参数:
+        source: 视频源（摄像头索引或视频文件路径）
+        model: 已加载的YOLO模型（或任何提供 predict 方法的对象）
+        conf: 置信度阈值，运行中可通过 set_conf 修改
+        use_camera: 是否为摄像头，读取失败时重连而不是结束
+        queue_size: 各级队列容量
+        drop_oldest: 队列满时是否丢弃最旧帧，None表示摄像头丢弃、视频文件阻塞
+        motion_gate: 运动门控（MotionGate），画面无变化时复用上一帧结果而不推理，None表示每帧推理
+        scheduler: 自适应调度器（AdaptiveScheduler），按负载调整检测步长和输入尺寸
+        vid_stride: 固定检测步长（每N帧检测一次），未使用调度器时生效
+        on_result: 结果回调 on_result(frame, results)
+        on_status: 状态回调 on_status(text, color)
+        on_stats: 统计回调 on_stats(stats)，约每秒调用一次
+    """
+    STAGES = ('capture', 'inference', 'postprocess')
+
+    def __init__(self, source, model, conf=0.25, use_camera=False, queue_size=2,
+                 drop_oldest=None, motion_gate=None, scheduler=None, vid_stride=1,
+                 on_result=None, on_status=None, on_stats=None):
+        self.source = source
+        self.model = model
+        self.conf = conf
+        self.use_camera = use_camera
+        self.motion_gate = motion_gate
+        self.scheduler = scheduler
+        self.vid_stride = max(1, int(vid_stride))
+        self.on_result = on_result
+        self.on_status = on_status
+        self.on_stats = on_stats
+
+        # 后处理阶段依次调用的处理器 processor(packet)
+        self.processors = []
+
+        if drop_oldest is None:
+            drop_oldest = use_camera
+        self.capture_queue = FrameQueue(queue_size, drop_oldest)
+        self.result_queue = FrameQueue(queue_size, drop_oldest)
+        self.meters = {name: StageMeter(name) for name in self.STAGES}
+
+        self.running = False
+        self.source_fps = None  # 视频源帧率，打开视频源后读取，无法获取时为None
+        self._cap = None
+        self._threads = []
+
+    def set_conf(self, conf):
+        self.conf = conf
+        # 阈值变化后复用的旧结果不再有效
+        if self.motion_gate:
+            self.motion_gate.force()
+
+    def add_processor(self, processor):
+        """添加后处理器，在后处理线程中按添加顺序调用"""
+        self.processors.append(processor)
+
+    def _status(self, text, color):
+        if self.on_status:
+            self.on_status(text, color)
+
+    def start(self):
+        """打开视频源并启动各阶段线程，打开失败时返回False"""
+        self._cap = cv2.VideoCapture(self.source)
+        if not self._cap.isOpened():
+            self._status(f"无法打开视频源: {self.source}", "#EA4335")  # 红色
+            self._cap.release()
+            return False
+
+        fps = self._cap.get(cv2.CAP_PROP_FPS)
+        self.source_fps = fps if fps and fps > 0 and not math.isnan(fps) else None
+        if self.scheduler:
+            self.scheduler.set_source_fps(fps)
+
+        self.running = True
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name="capture", daemon=True),
+            threading.Thread(target=self._inference_loop, name="inference", daemon=True),
+            threading.Thread(target=self._postprocess_loop, name="postprocess", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+        self._status("检测中...", "#4CAF50")  # 绿色
+        return True
+
+    def wait(self):
+        """等待所有阶段线程结束"""
+        for thread in self._threads:
+            thread.join()
+
+    def run(self):
+        """启动流水线并阻塞直到结束"""
+        if self.start():
+            self.wait()
+
+    def stop(self):
+        """停止流水线，丢弃队列中尚未处理的帧"""
+        self.running = False
+        self.capture_queue.close(discard=True)
+        self.result_queue.close(discard=True)
+
+    def stats(self):
+        """各阶段统计快照"""
+        stats = {name: meter.snapshot() for name, meter in self.meters.items()}
+        stats['dropped'] = self.capture_queue.dropped + self.result_queue.dropped
+        if self.motion_gate:
+            stats['motion'] = self.motion_gate.stats()
+        if self.scheduler:
+            stats['scheduler'] = self.scheduler.stats()
+        return stats
+
+    def output_fps(self, default=25.0):
+        """送入后处理阶段的画面帧率：视频源帧率 / 当前检测步长，无法获取源帧率时按 default 计算"""
+        stride = self.scheduler.current_stride if self.scheduler else self.vid_stride
+        return (self.source_fps or default) / stride
+
+    def _should_detect(self, position):
+        if self.scheduler:
+            return self.scheduler.should_detect(position)
+        return position % self.vid_stride == 0
+
+    def _capture_loop(self):
+        cap = self._cap
+        position = 0  # 视频源中的帧序号，跳过的帧也计数
+        meter = self.meters['capture']
+        try:
+            while self.running:
+                start = time.perf_counter()
+                if self._should_detect(position):
+                    ret, frame = cap.read()
+                else:
+                    # 不需要检测的帧只grab不解码
+                    ret, frame = cap.grab(), None
+                if not ret:
+                    if not self.use_camera:  # 如果是视频文件，结束采集
+                        self._status("视频结束", "#FFA500")  # 橙色
+                        break
+                    # 如果是摄像头，尝试重新连接
+                    self._status("尝试重新连接摄像头...", "#FFA500")  # 橙色
+                    cap.release()
+                    cap = cv2.VideoCapture(self.source)
+                    self._cap = cap
+                    time.sleep(0.1)
+                    continue
+
+                position += 1
+                if frame is None:
+                    continue
+
+                meter.record(time.perf_counter() - start)
+                if not self.capture_queue.put(FramePacket(position - 1, frame, start)):
+                    break
+        finally:
+            cap.release()
+            self.capture_queue.close()
+
+    def _inference_loop(self):
+        meter = self.meters['inference']
+        gate = self.motion_gate
+        scheduler = self.scheduler
+        last_results = None
+        try:
+            while True:
+                packet = self.capture_queue.get()
+                if packet is None:
+                    break
+
+                start = time.perf_counter()
+                if gate is not None and not gate.check(packet.frame) and last_results is not None:
+                    # 画面与上次推理时相比没有明显变化，复用上次的检测框
+                    packet.results = reuse_results(last_results, packet.frame)
+                elif scheduler is not None:
+                    imgsz = scheduler.imgsz
+                    packet.results = self.model.predict(packet.frame, conf=self.conf, imgsz=imgsz, verbose=False)
+                    scheduler.record_inference(time.perf_counter() - start, imgsz)
+                    scheduler.observe(packet.results)
+                    last_results = packet.results
+                else:
+                    packet.results = self.model.predict(packet.frame, conf=self.conf, verbose=False)
+                    last_results = packet.results
+                meter.record(time.perf_counter() - start)
+
+                if not self.result_queue.put(packet):
+                    break
+        except Exception as e:
+            self._status(f"错误: {str(e)}", "#EA4335")  # 红色
+            self.stop()
+        finally:
+            self.result_queue.close()
+
+    def _postprocess_loop(self):
+        meter = self.meters['postprocess']
+        last_report = time.perf_counter()
+        while True:
+            packet = self.result_queue.get()
+            if packet is None:
+                break
+
+            start = time.perf_counter()
+            try:
+                for processor in self.processors:
+                    processor(packet)
+                if self.on_result:
+                    self.on_result(packet.frame, packet.results)
+            except Exception as e:
+                self._status(f"后处理错误: {str(e)}", "#EA4335")  # 红色
+            meter.record(time.perf_counter() - start)
+            if self.scheduler:
+                self.scheduler.record_latency(time.perf_counter() - packet.capture_time)
+
+            now = time.perf_counter()
+            if self.on_stats and now - last_report >= 1.0:
+                self.on_stats(self.stats())
+                last_report = now
@@ -0,0 +1,304 @@
+"""
+评估引擎与训练期间的增量验证
+
+EvalEngine:
+    按 (划分, imgsz) 缓存验证/测试集的 DataLoader：图片解码缩放后保存在内存（cache='ram'），
+    标签由数据集读取一次；同一个已加载的模型依次评估 val 和 test，多次调用（例如比较多个权重）
+    不再重复解码和读取标签。
+EvalTrainer（train.py 使用）:
+    - val_every: 每隔K个epoch验证一次，最后一个epoch总是完整验证
+    - val_subset: 先在按类别组合分层抽样的固定验证子集上验证，子集指标提升时才做完整验证；
+      未做完整验证的epoch不参与 best.pt 的选择和提前停止计数，results.csv 中保留上一次完整验证的指标
+    每次验证的方式和耗时写入训练目录的 eval_log.csv。
+
+用法:
+    python evaluate.py runs/train/improved_exp/weights/best.pt
+    python evaluate.py runs/train/a/weights/best.pt runs/train/b/weights/best.pt --splits val test
+    python train.py --config configs/improved_exp.yaml --set val_every=2 --set val_subset=0.2
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import time
+
+from dataset_store import label_path, list_images, read_labels
+
+VAL_EVERY_ENV = 'FIRE_DETECT_VAL_EVERY'  # 训练进程（含DDP子进程）使用的验证间隔
+VAL_SUBSET_ENV = 'FIRE_DETECT_VAL_SUBSET'  # 验证子集比例
+VAL_SUBSET_SEED_ENV = 'FIRE_DETECT_VAL_SUBSET_SEED'
+EVAL_LOG = 'eval_log.csv'
+EVAL_LOG_FIELDS = ['epoch', 'mode', 'subset_fitness', 'fitness', 'seconds']
+
+_engines = {}  # (数据集配置, imgsz, batch, device) -> 进程级共享的 EvalEngine
+
+
+def split_images(path):
+    """数据集配置中某个划分的图片列表：目录、图片列表txt或它们的列表"""
+    if isinstance(path, (list, tuple)):
+        return [p for item in path for p in split_images(item)]
+    if not path:
+        return []
+    if os.path.isdir(path):
+        return list_images(path)
+    if str(path).endswith('.txt') and os.path.exists(path):
+        parent = os.path.dirname(os.path.abspath(path))
+        with open(path, 'r', encoding='utf-8') as f:
+            return [p if os.path.isabs(p) else os.path.join(parent, p) for p in (line.strip() for line in f) if p]
+    return []
+
+
+def stratified_subset(image_paths, fraction, seed=0):
+    """按图片包含的类别组合（含无目标的背景图）分层抽样，每个组合至少保留一张，结果固定不变"""
+    groups = {}
+    for path in image_paths:
+        classes, _ = read_labels(label_path(path))
+        groups.setdefault(tuple(sorted(set(classes.tolist()))), []).append(path)
+    rng = random.Random(seed)
+    subset = []
+    for key in sorted(groups):
+        paths = sorted(groups[key])
+        subset.extend(rng.sample(paths, max(1, round(len(paths) * fraction))))
+    return sorted(subset)
+
+
+def read_eval_log(save_dir):
+    path = os.path.join(save_dir, EVAL_LOG)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def validation_summary(save_dir):
+    """训练期间验证的次数和耗时，没有 eval_log.csv 时返回None"""
+    rows = read_eval_log(save_dir)
+    if not rows:
+        return None
+    modes = [row['mode'] for row in rows]
+    return {
+        'full': modes.count('full'),
+        'subset': modes.count('subset'),
+        'skipped': modes.count('skip'),
+        'seconds': round(sum(float(row['seconds']) for row in rows), 3),
+    }
+
+
+class EvalEngine:
+    """缓存验证/测试数据的评估引擎
+
+    参数:
+        data_yaml: 数据集配置
+        imgsz: 输入尺寸
+        batch: 评估批量
+        workers: DataLoader进程数
+        device: 评估设备，None表示自动选择
+        cache: 图片缓存方式，'ram'（解码缩放后常驻内存）、'disk' 或 None
+    """
+
+    def __init__(self, data_yaml='data.yaml', imgsz=640, batch=32, workers=4, device=None, cache='ram'):
+        self.data_yaml = data_yaml
+        self.imgsz = imgsz
+        self.batch = batch
+        self.workers = workers
+        self.device = device
+        self.cache = cache
+        self.timings = {}
+        self._data = None
+        self._loaders = {}
+
+    @property
+    def data(self):
+        if self._data is None:
+            from ultralytics.data.utils import check_det_dataset
+            self._data = check_det_dataset(self.data_yaml)
+        return self._data
+
+    def dataloader(self, split):
+        """某个划分的 DataLoader，首次调用时解码并缓存全部图片和标签"""
+        if split not in self._loaders:
+            from ultralytics.cfg import get_cfg
+            from ultralytics.data import build_dataloader, build_yolo_dataset
+
+            if not self.data.get(split):
+                raise KeyError(f"{self.data_yaml} 中没有 {split} 划分")
+            start = time.perf_counter()
+            cfg = get_cfg(overrides={'imgsz': self.imgsz, 'cache': self.cache, 'mode': 'val', 'rect': True})
+            # 与 YOLO.val() 和训练结束时的验证一致使用矩形批次，mAP才能与 results.csv 对比；
+            # YOLOv8检测模型的最大步长均为32
+            dataset = build_yolo_dataset(cfg, self.data[split], self.batch, self.data, mode='val', rect=True,
+                                         stride=32)
+            self._loaders[split] = build_dataloader(dataset, self.batch, self.workers, shuffle=False, rank=-1)
+            self.timings[f'{split}_load'] = time.perf_counter() - start
+        return self._loaders[split]
+
+    def evaluate(self, model, splits=('val', 'test'), save_dir=None, conf=0.001, iou=0.7):
+        """用同一个已加载的模型依次评估各划分，返回 {划分: DetMetrics}（与 YOLO.val 的返回值相同）
+
+        model 为权重路径或已加载的 YOLO 模型。
+        """
+        from pathlib import Path
+
+        from ultralytics import YOLO
+        from ultralytics.models.yolo.detect import DetectionValidator
+
+        start = time.perf_counter()
+        yolo = YOLO(model) if isinstance(model, (str, Path)) else model
+        self.timings['model_load'] = time.perf_counter() - start
+
+        results = {}
+        for split in splits:
+            loader = self.dataloader(split)
+            start = time.perf_counter()
+            args = dict(data=self.data_yaml, split=split, imgsz=self.imgsz, batch=self.batch, device=self.device,
+                        conf=conf, iou=iou, plots=False, mode='val')
+            validator = DetectionValidator(loader, save_dir=Path(save_dir, split) if save_dir else None, args=args)
+            validator(model=yolo.model)
+            results[split] = validator.metrics
+            self.timings[split] = time.perf_counter() - start
+        return results
+
+
+def get_eval_engine(data_yaml='data.yaml', imgsz=640, batch=32, device=None):
+    """进程级共享的评估引擎，相同数据集和尺寸的多次评估复用已缓存的数据"""
+    key = (os.path.abspath(data_yaml), imgsz, batch, device)
+    if key not in _engines:
+        _engines[key] = EvalEngine(data_yaml, imgsz, batch, device=device)
+    return _engines[key]
+
+
+def make_eval_trainer(val_every=1, val_subset=0.0, seed=0):
+    """返回带增量验证的 DetectionTrainer 子类，用法: model.train(trainer=...)
+
+    基类为 dataset_store.StoreTrainer，设置了 image_store 时同样从图片存储读取。
+    参数通过环境变量传递，多GPU训练时DDP子进程以 `from evaluate import EvalTrainer` 导入同一个类。
+    """
+    os.environ[VAL_EVERY_ENV] = str(int(val_every or 1))
+    os.environ[VAL_SUBSET_ENV] = str(float(val_subset or 0.0))
+    os.environ[VAL_SUBSET_SEED_ENV] = str(int(seed))
+    # DDP子进程运行的是ultralytics写在用户配置目录下的临时脚本，本项目目录不在其 sys.path 中
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    paths = [p for p in os.environ.get('PYTHONPATH', '').split(os.pathsep) if p]
+    if repo_dir not in paths:
+        os.environ['PYTHONPATH'] = os.pathsep.join([repo_dir] + paths)
+    return _eval_classes()[0]
+
+
+_classes = None
+
+
+def _eval_classes():
+    """首次使用时才导入ultralytics并定义 (EvalTrainer,)"""
+    global _classes
+    if _classes is not None:
+        return _classes
+
+    from copy import copy
+
+    from ultralytics.models.yolo.detect import DetectionValidator
+    from ultralytics.utils import LOGGER
+
+    from dataset_store import StoreTrainer
+
+    class EvalTrainer(StoreTrainer):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.val_every = max(1, int(os.environ.get(VAL_EVERY_ENV, 1)))
+            self.val_subset = float(os.environ.get(VAL_SUBSET_ENV, 0.0))
+            self.val_subset_seed = int(os.environ.get(VAL_SUBSET_SEED_ENV, 0))
+            self.subset_validator = None
+            self.best_subset_fitness = None
+
+        def get_subset_validator(self):
+            if self.subset_validator is None:
+                paths = split_images(self.data.get('val'))
+                subset = stratified_subset(paths, self.val_subset, self.val_subset_seed) if paths else []
+                if not subset or len(subset) >= len(paths):
+                    LOGGER.warning("验证子集不小于完整验证集，改为每次完整验证")
+                    self.val_subset = 0.0
+                    return None
+                list_file = os.path.join(self.save_dir, 'val_subset.txt')
+                with open(list_file, 'w', encoding='utf-8') as f:
+                    f.write('\n'.join(os.path.abspath(p) for p in subset) + '\n')
+                # 注意：子集与完整验证集共用标签目录，ultralytics会改写其中的 .cache，下次训练时重新扫描标签
+                loader = self.get_dataloader(list_file, self.test_loader.batch_size, rank=-1, mode='val')
+                args = copy(self.args)
+                args.plots = False
+                self.subset_validator = DetectionValidator(loader, save_dir=self.save_dir, args=args)
+                LOGGER.info(f"验证子集: {len(subset)}/{len(paths)} 张（{list_file}）")
+            return self.subset_validator
+
+        def validate(self):
+            epoch = self.epoch + 1
+            final = epoch >= self.epochs
+            start = time.perf_counter()
+            if not final and epoch % self.val_every:
+                self.log_eval(epoch, 'skip', None, None, 0.0)
+                # fitness为None：不更新 best.pt，也不计入提前停止
+                return self.metrics, None
+
+            subset_fitness = None
+            validator = self.get_subset_validator() if self.val_subset > 0 and not final else None
+            if validator is not None:
+                subset_fitness = float(validator(self).get('fitness', 0.0))
+                if self.best_subset_fitness is not None and subset_fitness <= self.best_subset_fitness:
+                    self.log_eval(epoch, 'subset', subset_fitness, None, time.perf_counter() - start)
+                    return self.metrics, None
+                self.best_subset_fitness = subset_fitness
+
+            metrics, fitness = super().validate()
+            self.log_eval(epoch, 'full', subset_fitness, fitness, time.perf_counter() - start)
+            return metrics, fitness
+
+        def log_eval(self, epoch, mode, subset_fitness, fitness, seconds):
+            path = os.path.join(self.save_dir, EVAL_LOG)
+            new = not os.path.exists(path)
+            with open(path, 'a', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                if new:
+                    writer.writerow(EVAL_LOG_FIELDS)
+                writer.writerow([epoch, mode,
+                                 '' if subset_fitness is None else f"{subset_fitness:.5f}",
+                                 '' if fitness is None else f"{float(fitness):.5f}", f"{seconds:.3f}"])
+
+    EvalTrainer.__module__ = __name__
+    EvalTrainer.__qualname__ = 'EvalTrainer'
+    _classes = (EvalTrainer,)
+    return _classes
+
+
+def __getattr__(name):
+    # 支持 from evaluate import EvalTrainer（DDP子进程）而不在导入本模块时加载ultralytics
+    if name == 'EvalTrainer':
+        return _eval_classes()[0]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='用同一个已加载的模型评估验证集和测试集')
+    parser.add_argument('weights', nargs='+', help='模型路径，可指定多个（共用已缓存的数据）')
+    parser.add_argument('--data-yaml', default='data.yaml')
+    parser.add_argument('--splits', nargs='+', default=['val', 'test'])
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--batch', type=int, default=32)
+    parser.add_argument('--device', default=None)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    engine = get_eval_engine(args.data_yaml, args.imgsz, args.batch, args.device)
+    print(f"{'模型':<48}{'划分':>6}{'mAP50':>9}{'mAP50-95':>10}{'耗时(s)':>9}")
+    for weights in args.weights:
+        results = engine.evaluate(weights, args.splits)
+        for split, metrics in results.items():
+            print(f"{weights:<48}{split:>6}{metrics.box.map50:>9.4f}{metrics.box.map:>10.4f}"
+                  f"{engine.timings[split]:>9.1f}")
+    loads = '，'.join(f"{k[:-5]} {v:.1f}s" for k, v in engine.timings.items() if k.endswith('_load'))
+    print(f"数据解码与缓存（只在首次评估时进行）: {loads}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
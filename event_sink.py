@@ -0,0 +1,302 @@
+"""
+检测事件日志
+
+把每帧的检测框（视频流、时间、类别、置信度、坐标、跟踪ID）按列缓存在内存中，
+由后台线程定期批量写入只追加的列式分段文件，按日期分目录，并按行数/时长轮转：
+    - 安装了 pyarrow 时写 Parquet（每次刷新写一个row group，分段关闭后才改为正式文件名）
+    - 否则写NumPy分段：运行中以定长记录追加到 .part 文件（崩溃后可恢复），
+      轮转时转换为按列存储的 .npz
+load_events 读取整个目录（或某一天）的所有分段，便于做按天的统计分析，无需解析图片。
+"""
+import glob
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from config import PredictionConfig
+
+FORMAT_PARQUET = 'parquet'
+FORMAT_NUMPY = 'npz'
+
+# 列名与类型，NumPy分段的 .part 文件按此结构体逐行追加
+EVENT_DTYPE = np.dtype([
+    ('stream', np.int32),
+    ('frame', np.int64),
+    ('time', np.float64),
+    ('class_id', np.int16),
+    ('conf', np.float32),
+    ('x1', np.float32),
+    ('y1', np.float32),
+    ('x2', np.float32),
+    ('y2', np.float32),
+    ('track_id', np.int32),
+])
+COLUMNS = EVENT_DTYPE.names
+
+
+def default_format():
+    """安装了pyarrow时使用Parquet，否则使用NumPy分段"""
+    try:
+        import pyarrow  # noqa: F401
+        return FORMAT_PARQUET
+    except ImportError:
+        return FORMAT_NUMPY
+
+
+class DetectionEventSink:
+    """检测事件日志写入器
+
+    参数:
+        out_dir: 输出目录，分段文件按日期存放在 out_dir/YYYY-MM-DD/ 下
+        fmt: 'parquet' / 'npz'，None表示自动选择
+        flush_rows: 内存中累计的行数达到该值时立即刷新
+        flush_seconds: 定期刷新的间隔（秒）
+        segment_rows: 单个分段的最大行数，超过后轮转
+        segment_seconds: 单个分段的最长时长（秒），超过后轮转；跨天时也会轮转
+        metadata: 写入分段头部的附加信息（如模型路径、视频源）
+    """
+
+    def __init__(self, out_dir='events', fmt=None, flush_rows=10000, flush_seconds=5.0,
+                 segment_rows=1000000, segment_seconds=3600, metadata=None):
+        self.out_dir = out_dir
+        self.fmt = fmt or default_format()
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.segment_rows = segment_rows
+        self.segment_seconds = segment_seconds
+        self.metadata = dict(metadata or {})
+        self.names = {}
+
+        self.rows = 0  # 累计写入的行数
+        self.segments = 0
+        self.errors = 0
+        self.last_error = None
+
+        self._buffer = []  # 待刷新的结构体数组
+        self._buffered = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+
+        self._segment = None  # 当前分段：路径、写入器、行数、开始时间、日期
+        self._thread = threading.Thread(target=self._flush_loop, name="event-sink", daemon=True)
+        self._thread.start()
+
+    def add(self, stream, frame_index, results, track_ids=None, timestamp=None):
+        """记录一帧的检测结果（无检测框时不产生记录）"""
+        result = results[0] if results else None
+        if result is None or result.boxes is None or len(result.boxes) == 0:
+            return 0
+
+        data = result.boxes.data
+        data = data.cpu().numpy() if hasattr(data, 'cpu') else np.asarray(data)
+        n = len(data)
+        records = np.empty(n, dtype=EVENT_DTYPE)
+        records['stream'] = stream
+        records['frame'] = frame_index
+        records['time'] = time.time() if timestamp is None else timestamp
+        records['class_id'] = data[:, -1]
+        records['conf'] = data[:, -2]
+        records['x1'], records['y1'], records['x2'], records['y2'] = data[:, 0], data[:, 1], data[:, 2], data[:, 3]
+        records['track_id'] = track_ids if track_ids is not None else -1
+
+        with self._lock:
+            if not self.names:
+                self.names = {int(k): v for k, v in result.names.items()}
+            self._buffer.append(records)
+            self._buffered += n
+            if self._buffered >= self.flush_rows:
+                self._wake.set()
+        return n
+
+    def __call__(self, packet):
+        """作为检测流水线的后处理器使用"""
+        self.add(0, packet.index, packet.results, packet.track_ids)
+
+    def _flush_loop(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """把内存中的记录写入当前分段"""
+        with self._lock:
+            if not self._buffer:
+                records = None
+            else:
+                records = np.concatenate(self._buffer)
+                self._buffer = []
+                self._buffered = 0
+
+        with self._write_lock:
+            try:
+                if self._segment is not None and self._should_rotate():
+                    self._close_segment()
+                if records is None:
+                    return
+                if self._segment is None:
+                    self._open_segment()
+                self._write(records)
+                self._segment['rows'] += len(records)
+                self.rows += len(records)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+
+    def _should_rotate(self):
+        segment = self._segment
+        return (segment['rows'] >= self.segment_rows
+                or time.time() - segment['start'] >= self.segment_seconds
+                or datetime.now().strftime('%Y-%m-%d') != segment['date'])
+
+    def _header(self):
+        return {
+            'columns': list(COLUMNS),
+            'names': {str(k): v for k, v in self.names.items()},
+            'created': time.time(),
+            **self.metadata,
+        }
+
+    def _open_segment(self):
+        now = datetime.now()
+        day_dir = os.path.join(self.out_dir, now.strftime('%Y-%m-%d'))
+        os.makedirs(day_dir, exist_ok=True)
+        self.segments += 1
+        # 文件名包含时间戳、进程号和序号，多个进程写同一目录也不会冲突
+        stem = os.path.join(day_dir, f"events_{now.strftime('%H%M%S')}_{os.getpid()}_{self.segments:04d}")
+        segment = {'stem': stem, 'rows': 0, 'start': time.time(), 'date': now.strftime('%Y-%m-%d')}
+
+        if self.fmt == FORMAT_PARQUET:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            schema = pa.schema([(name, pa.from_numpy_dtype(EVENT_DTYPE[name])) for name in COLUMNS],
+                               metadata={'detection_events': json.dumps(self._header(), ensure_ascii=False)})
+            segment['path'] = stem + '.parquet.part'
+            segment['writer'] = pq.ParquetWriter(segment['path'], schema, compression='zstd')
+        else:
+            segment['path'] = stem + '.part'
+            with open(stem + '.json', 'w', encoding='utf-8') as f:
+                json.dump(self._header(), f, ensure_ascii=False)
+            segment['writer'] = open(segment['path'], 'ab')
+        self._segment = segment
+
+    def _write(self, records):
+        segment = self._segment
+        if self.fmt == FORMAT_PARQUET:
+            import pyarrow as pa
+
+            table = pa.table({name: records[name] for name in COLUMNS})
+            segment['writer'].write_table(table)
+        else:
+            segment['writer'].write(records.tobytes())
+            segment['writer'].flush()
+
+    def _close_segment(self):
+        """关闭当前分段：Parquet写入文件尾后改为正式文件名，NumPy分段转换为按列存储的npz"""
+        segment, self._segment = self._segment, None
+        segment['writer'].close()
+        if self.fmt == FORMAT_PARQUET:
+            os.replace(segment['path'], segment['stem'] + '.parquet')
+        else:
+            records = np.fromfile(segment['path'], dtype=EVENT_DTYPE)
+            np.savez_compressed(segment['stem'] + '.npz', **{name: records[name] for name in COLUMNS})
+            os.remove(segment['path'])
+
+    def stats(self):
+        return {
+            'rows': self.rows,
+            'buffered': self._buffered,
+            'segments': self.segments,
+            'errors': self.errors,
+            'format': self.fmt,
+        }
+
+    def close(self):
+        """刷新剩余记录并关闭当前分段"""
+        self._stopped = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        with self._write_lock:
+            if self._segment is not None:
+                self._close_segment()
+
+
+def _load_segment(path):
+    """读取单个分段，返回结构体数组和类别名"""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path)
+        header = json.loads(table.schema.metadata[b'detection_events'])
+        records = np.empty(table.num_rows, dtype=EVENT_DTYPE)
+        for name in COLUMNS:
+            records[name] = table.column(name).to_numpy()
+        return records, header.get('names', {})
+
+    stem = path[:-len('.npz')] if path.endswith('.npz') else path[:-len('.part')]
+    names = {}
+    if os.path.exists(stem + '.json'):
+        with open(stem + '.json', 'r', encoding='utf-8') as f:
+            names = json.load(f).get('names', {})
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            records = np.empty(len(data['frame']), dtype=EVENT_DTYPE)
+            for name in COLUMNS:
+                records[name] = data[name]
+    else:
+        # 未正常关闭的分段：只读取完整的记录
+        raw = np.fromfile(path, dtype=np.uint8)
+        usable = len(raw) // EVENT_DTYPE.itemsize * EVENT_DTYPE.itemsize
+        records = raw[:usable].view(EVENT_DTYPE)
+    return records, names
+
+
+def load_events(path, as_dataframe=False):
+    """读取事件日志
+
+    参数:
+        path: 单个分段文件、某一天的目录或整个事件目录
+        as_dataframe: 返回pandas DataFrame（需要安装pandas），否则返回 (按列的字典, 类别名)
+    """
+    if os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, '**', 'events_*'), recursive=True))
+        files = [f for f in files if f.endswith(('.parquet', '.npz', '.part')) and not f.endswith('.parquet.part')]
+    else:
+        files = [path]
+
+    parts, names = [], {}
+    for file in files:
+        records, segment_names = _load_segment(file)
+        parts.append(records)
+        names.update({int(k): v for k, v in segment_names.items()})
+    records = np.concatenate(parts) if parts else np.empty(0, dtype=EVENT_DTYPE)
+    columns = {name: records[name] for name in COLUMNS}
+
+    if as_dataframe:
+        import pandas as pd
+
+        frame = pd.DataFrame(columns)
+        frame['class'] = frame['class_id'].map(names)
+        return frame
+    return columns, names
+
+
+def create_event_sink(out_dir=None, metadata=None):
+    """按 PredictionConfig 中的事件日志配置创建写入器"""
+    return DetectionEventSink(
+        out_dir=out_dir or PredictionConfig.event_log_dir,
+        fmt=PredictionConfig.event_log_format,
+        flush_rows=PredictionConfig.event_flush_rows,
+        flush_seconds=PredictionConfig.event_flush_seconds,
+        segment_rows=PredictionConfig.event_segment_rows,
+        segment_seconds=PredictionConfig.event_segment_seconds,
+        metadata=metadata,
+    )
@@ -0,0 +1,509 @@
+"""
+无界面（命令行 / 守护进程）检测入口，不依赖PyQt5
+
+用法示例:
+    python -m firedetect run --source 0 --model weights/best.pt
+    python -m firedetect run --source video.mp4 --model weights/best.pt --format csv --output det.csv
+    python -m firedetect run --source rtsp://cam1 --source rtsp://cam2 --model weights/best.pt
+    python -m firedetect bench --model weights/best.pt --image data/test/images/xxx.jpg
+    python -m firedetect serve --model weights/best.pt --port 8765
+    python -m firedetect batch --input data/test/images --model weights/best.pt --output preds.jsonl
+"""
+import argparse
+import csv
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+_IMPORT_START = time.perf_counter()
+
+import cv2
+import numpy as np
+
+import utils
+import model_cache
+from config import PredictionConfig
+from inference_backend import BACKENDS, BACKEND_OPENVINO
+from detection_pipeline import DetectionPipeline
+from adaptive_scheduler import create_scheduler
+from motion_gate import create_motion_gate
+from tiled_inference import TiledPredictor
+from tracker import create_tracking_processor
+from event_sink import create_event_sink
+from result_cache import create_cached_predictor
+from multi_stream import MultiStreamEngine
+from clip_recorder import ClipRecorder, DetectionTrigger
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+CSV_FIELDS = ['stream', 'frame', 'time', 'class_id', 'class', 'conf', 'x1', 'y1', 'x2', 'y2', 'track_id']
+
+
+class DetectionWriter:
+    """将检测结果以JSON Lines或CSV格式写出
+
+    events_only=True 时只输出跟踪/告警事件（JSON Lines），不输出逐帧检测框。
+    """
+
+    def __init__(self, fmt='jsonl', output=None, only_detections=False, events_only=False):
+        self.fmt = fmt
+        self.only_detections = only_detections
+        self.events_only = events_only
+        self._file = open(output, 'w', newline='', encoding='utf-8') if output else sys.stdout
+        self._csv = None
+        if fmt == 'csv':
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(CSV_FIELDS)
+        self.frames = 0
+        self.detections = 0
+        self.events = 0
+
+    def write(self, stream, frame_index, results, track_ids=None):
+        detections = []
+        for result in results:
+            detections.extend(utils.result_to_detections(result))
+        # 跟踪ID只对应第一个结果（单帧推理时也只有一个）
+        if track_ids is not None:
+            for det, track_id in zip(detections, track_ids.tolist()):
+                det['track_id'] = track_id if track_id >= 0 else None
+
+        self.frames += 1
+        self.detections += len(detections)
+        if self.events_only or (self.only_detections and not detections):
+            return
+
+        timestamp = round(time.time(), 3)
+        if self.fmt == 'csv':
+            for det in detections:
+                self._csv.writerow([stream, frame_index, timestamp, det['class_id'], det['class'],
+                                    det['conf'], *det['xyxy'], det.get('track_id')])
+        else:
+            record = {'stream': stream, 'frame': frame_index, 'time': timestamp, 'detections': detections}
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def write_events(self, stream, events):
+        """输出跟踪/告警事件，每个事件一行（仅JSON Lines格式）"""
+        if not events or self.fmt != 'jsonl':
+            return
+        for event in events:
+            self._file.write(json.dumps({'stream': stream, 'event': event}, ensure_ascii=False) + '\n')
+        self.events += len(events)
+        self._file.flush()
+
+    def close(self):
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+def log(text):
+    """状态信息统一输出到stderr，stdout只用于检测结果"""
+    print(text, file=sys.stderr, flush=True)
+
+
+def parse_source(source):
+    """摄像头索引转换为整数，其余保持字符串"""
+    return int(source) if source.isdigit() else source
+
+
+def print_summary(timings, stats, writer):
+    """输出启动耗时与逐帧开销统计"""
+    log("—— 运行统计 ——")
+    log(f"模块导入: {timings['import'] * 1000:.1f} ms")
+    log(f"模型加载（含ultralytics导入和预热）: {timings['model_load'] * 1000:.1f} ms")
+    if 'first_frame' in timings:
+        log(f"首帧输出: {timings['first_frame'] * 1000:.1f} ms（自进程启动）")
+    log(f"处理帧数: {writer.frames}，检测框数: {writer.detections}，跟踪/告警事件: {writer.events}")
+    for name in DetectionPipeline.STAGES:
+        if name in stats:
+            log(f"{name}: {stats[name]['fps']:.1f} FPS, {stats[name]['latency_ms']:.2f} ms/帧")
+    if 'tiling' in stats:
+        log(f"分块推理: 平均 {stats['tiling']['tiles_per_frame']:.1f} 块/帧"
+            f"（全部切分的 {stats['tiling']['tile_ratio']:.0%}）")
+    if 'scheduler' in stats:
+        log(f"自适应调度: 最终步长 {stats['scheduler']['stride']}，输入尺寸 {stats['scheduler']['imgsz']}，"
+            f"跳过 {stats['scheduler']['skipped']} 帧，逐帧检测触发 {stats['scheduler']['boosts']} 次")
+    if 'motion' in stats:
+        log(f"运动门控跳过推理: {stats['motion']['skipped']}/{stats['motion']['checked']} 帧"
+            f"（{stats['motion']['skip_rate']:.1%}）")
+    for stream_id, stream_stats in stats.items():
+        if isinstance(stream_id, int) and 'skip_rate' in stream_stats:
+            log(f"视频流 {stream_id} 运动门控跳过率: {stream_stats['skip_rate']:.1%}")
+    if 'result_cache' in stats:
+        log_cache_stats(stats['result_cache'])
+    if 'events' in stats:
+        log(f"事件日志: 写入 {stats['events']['rows']} 行，{stats['events']['segments']} 个分段"
+            f"（{stats['events']['format']}），写入失败 {stats['events']['errors']} 次")
+    if 'output' in timings and writer.frames:
+        log(f"结果序列化: {timings['output'] / writer.frames * 1000:.3f} ms/帧")
+
+
+def log_cache_stats(stats):
+    log(f"结果缓存: 命中 {stats['hits']}，未命中 {stats['misses']}（命中率 {stats['hit_rate']:.1%}，"
+        f"帧哈希 {stats['hash_ms']:.2f} ms/帧）")
+
+
+def run(args):
+    timings = {'import': time.perf_counter() - _IMPORT_START}
+
+    start = time.perf_counter()
+    model = model_cache.get_model(args.model, backend=args.backend)
+    timings['model_load'] = time.perf_counter() - start
+    log(f"模型加载成功: {args.model}（{BACKENDS[args.backend]}）")
+    if args.tiled:
+        model = TiledPredictor(
+            model,
+            tile_size=PredictionConfig.tile_size,
+            overlap=PredictionConfig.tile_overlap,
+            merge=args.tile_merge,
+            merge_iou=PredictionConfig.tile_merge_iou,
+            roi_only=args.tile_roi,
+            coarse_conf=PredictionConfig.tile_coarse_conf,
+            roi_margin=PredictionConfig.tile_roi_margin,
+        )
+    if args.result_cache:
+        model = create_cached_predictor(model, args.model, args.result_cache, backend=args.backend)
+
+    if args.events_only and (args.format != 'jsonl' or not args.track):
+        log("--events-only 只支持 jsonl 格式，且不能与 --no-track 同时使用")
+        return 2
+    writer = DetectionWriter(args.format, args.output, args.only_detections, args.events_only)
+    timings['output'] = 0.0
+    sources = [parse_source(source) for source in args.source]
+
+    # 每路视频源一个跟踪器
+    trackers = {}
+    event_sink = create_event_sink(args.event_log, metadata={'model': args.model, 'sources': args.source}) \
+        if args.event_log else None
+
+    def emit(stream, frame_index, results):
+        start = time.perf_counter()
+        if 'first_frame' not in timings:
+            timings['first_frame'] = start - _IMPORT_START
+        track_ids = None
+        if args.track:
+            if stream not in trackers:
+                trackers[stream] = create_tracking_processor()
+            track_ids, events = trackers[stream].update(results, frame_index)
+            writer.write_events(stream, events)
+        writer.write(stream, frame_index, results, track_ids)
+        if event_sink:
+            event_sink.add(stream, frame_index, results, track_ids)
+        timings['output'] += time.perf_counter() - start
+
+    stats = {}
+    try:
+        # 单张图片直接推理
+        if len(sources) == 1 and isinstance(sources[0], str) and sources[0].lower().endswith(IMAGE_EXTENSIONS):
+            img = cv2.imread(sources[0])
+            if img is None:
+                log(f"无法读取图片: {sources[0]}")
+                return 1
+            emit(0, 0, model.predict(img, conf=args.conf, verbose=False))
+
+        # 单路视频源使用三级流水线
+        elif len(sources) == 1:
+            pipeline = DetectionPipeline(
+                sources[0], model, args.conf,
+                use_camera=isinstance(sources[0], int) or args.camera,
+                queue_size=args.queue_size,
+                motion_gate=create_motion_gate() if args.motion_gate else None,
+                scheduler=create_scheduler(args.backend == BACKEND_OPENVINO, args.vid_stride) if args.adaptive else None,
+                vid_stride=args.vid_stride,
+                on_status=lambda text, color: log(text),
+            )
+            pipeline.add_processor(lambda packet: emit(0, packet.index, packet.results))
+            recorder = None
+            if args.record_clips:
+                recorder = ClipRecorder(
+                    save_dir=args.record_clips,
+                    fps=PredictionConfig.clip_fps,
+                    pre_seconds=PredictionConfig.clip_pre_seconds,
+                    post_seconds=PredictionConfig.clip_post_seconds,
+                    max_width=PredictionConfig.clip_max_width,
+                    trigger=DetectionTrigger(
+                        min_conf=PredictionConfig.clip_min_conf,
+                        min_hits=PredictionConfig.clip_min_hits,
+                        window=PredictionConfig.clip_window,
+                    ),
+                    on_saved=lambda path, count: log(f"已保存事件片段: {path}（{count} 帧）"),
+                )
+                # 片段按实际送入的帧率写入（视频源帧率 / 检测步长），否则跳帧后播放速度不对
+                pipeline.add_processor(lambda packet: recorder.process(
+                    packet.frame, packet.results, pipeline.output_fps(PredictionConfig.clip_fps)))
+            install_signal_handlers(pipeline.stop)
+            try:
+                pipeline.run()
+            finally:
+                if recorder:
+                    recorder.close()
+            stats = pipeline.stats()
+
+        # 多路视频源使用共享模型的批量引擎
+        else:
+            frame_counts = {}
+
+            def on_result(stream_id, frame, results):
+                frame_counts[stream_id] = frame_counts.get(stream_id, -1) + 1
+                emit(stream_id, frame_counts[stream_id], results)
+
+            engine = MultiStreamEngine(
+                sources, model, args.conf, max_batch=args.max_batch,
+                gate_factory=create_motion_gate if args.motion_gate else None,
+                on_result=on_result,
+                on_status=lambda text, color: log(text),
+            )
+            install_signal_handlers(engine.stop)
+            engine.run()
+            stats = engine.stats()
+    finally:
+        # 视频结束或被中断时补发未结束告警的结束事件
+        for stream, tracker in trackers.items():
+            writer.write_events(stream, tracker.close())
+        writer.close()
+        if event_sink:
+            event_sink.close()
+
+    if event_sink:
+        stats['events'] = event_sink.stats()
+    if args.tiled:
+        stats['tiling'] = model.stats()
+    if args.result_cache:
+        stats['result_cache'] = model.cache_stats()
+    print_summary(timings, stats, writer)
+    return 0
+
+
+def install_signal_handlers(stop):
+    """Ctrl+C / SIGTERM 时优雅停止，便于作为守护进程运行"""
+    def handler(signum, frame):
+        log("收到停止信号，正在退出...")
+        stop()
+
+    signal.signal(signal.SIGINT, handler)
+    signal.signal(signal.SIGTERM, handler)
+
+
+def measure_import(module):
+    """在独立子进程中测量模块导入耗时（秒）"""
+    code = ("import time; t = time.perf_counter(); "
+            f"import {module}; print(time.perf_counter() - t)")
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+    if out.returncode != 0:
+        return None
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def bench(args):
+    """对比命令行与GUI路径的启动耗时和逐帧开销"""
+    log("—— 启动耗时（模块导入，不含模型加载） ——")
+    # 命令行模式在加载模型时才导入ultralytics，这里一并计入以便与GUI公平对比
+    for name, module in (("命令行", "firedetect, ultralytics"), ("GUI", "yolo_detector_gui")):
+        seconds = measure_import(module)
+        log(f"{name}: " + (f"{seconds * 1000:.1f} ms" if seconds is not None else "导入失败（缺少依赖？）"))
+
+    if not args.image:
+        return 0
+
+    from ultralytics import YOLO
+    model = YOLO(args.model)
+    img = cv2.imread(args.image)
+    if img is None:
+        log(f"无法读取图片: {args.image}")
+        return 1
+    results = model.predict(img, conf=args.conf, verbose=False)
+
+    log(f"—— 逐帧开销（{args.iterations} 次平均，不含推理） ——")
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        json.dumps([utils.result_to_detections(r) for r in results])
+    log(f"命令行（结果序列化）: {(time.perf_counter() - start) / args.iterations * 1000:.3f} ms/帧")
+
+    try:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtWidgets import QApplication
+        app = QApplication.instance() or QApplication([])
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            # 与 YOLODetectorGUI.update_display 相同的处理步骤
+            processed = results[0].plot()
+            pixmap = utils.cv2_to_qpixmap(np.ascontiguousarray(processed))
+            pixmap.scaled(960, 540)
+        log(f"GUI（绘制+转换+缩放）: {(time.perf_counter() - start) / args.iterations * 1000:.3f} ms/帧")
+    except ImportError:
+        log("GUI: 未安装PyQt5，跳过")
+    return 0
+
+
+def batch(args):
+    from batch_predict import BatchPredictor, BatchResultWriter, collect_images
+
+    paths = collect_images(args.input)
+    if not paths:
+        log(f"没有找到图片: {' '.join(args.input)}")
+        return 1
+    if args.autotune:
+        from autotune import apply_inference_threads, tuned_inference
+
+        tuned = tuned_inference(args.model, args.backend, paths=paths, log=log)
+        args.batch_size, args.workers = tuned['batch_size'], tuned['decode_workers']
+        apply_inference_threads(tuned['threads'], args.backend)
+    model = model_cache.get_model(args.model, backend=args.backend)
+    if args.tiled:
+        model = TiledPredictor(model, tile_size=PredictionConfig.tile_size, overlap=PredictionConfig.tile_overlap,
+                               merge=PredictionConfig.tile_merge, merge_iou=PredictionConfig.tile_merge_iou)
+    if args.result_cache:
+        model = create_cached_predictor(model, args.model, args.result_cache, backend=args.backend)
+    writer = BatchResultWriter(args.output, args.format, resume=not args.overwrite)
+    if writer.processed:
+        log(f"从上次中断处继续：已处理 {len(writer.processed)} 张，共 {len(paths)} 张")
+    predictor = BatchPredictor(model, args.conf, args.batch_size, args.workers, PredictionConfig.batch_prefetch)
+
+    last_report = [time.perf_counter()]
+
+    def on_batch(items, results, done, total):
+        now = time.perf_counter()
+        if now - last_report[0] >= 5.0 or done == total:
+            last_report[0] = now
+            log(f"进度: {done}/{total}（{predictor.images / (now - start):.1f} 张/秒）")
+
+    stopped = []
+    install_signal_handlers(lambda: stopped.append(True))
+    start = time.perf_counter()
+    try:
+        predictor.run(paths, writer, on_batch=on_batch, should_stop=lambda: bool(stopped))
+    finally:
+        writer.close()
+
+    stats = predictor.stats()
+    log(f"处理图片: {writer.images}，检测框: {writer.detections}，读取失败: {writer.failed}")
+    log(f"吞吐: {stats['images_per_second']:.1f} 张/秒（批量 {stats['batch_size']}，"
+        f"每批推理 {stats['predict_ms']:.1f} ms，等待解码 {stats['decode_wait_ms']:.1f} ms）")
+    if args.result_cache:
+        log_cache_stats(model.cache_stats())
+    if stopped:
+        log(f"已中断，再次运行相同命令会从 {args.output} 中断处继续")
+    return 0
+
+
+def serve(args):
+    from detect_server import run_server
+
+    if args.autotune:
+        from autotune import apply_inference_threads, tuned_inference
+
+        tuned = tuned_inference(args.model, args.backend, log=log)
+        args.max_batch = tuned['batch_size']
+        apply_inference_threads(tuned['threads'], args.backend)
+    run_server(args.model, host=args.host, port=args.port, backend=args.backend, conf=args.conf,
+               max_batch=args.max_batch, max_wait_ms=args.max_wait_ms, tiled=args.tiled, log=log)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='firedetect', description='烟雾与火灾检测（无界面模式）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='对视频源/图片进行检测并输出结果')
+    run_parser.add_argument('--source', action='append', required=True,
+                            help='视频源：摄像头索引、视频/图片路径或网络流地址，可重复指定多路')
+    run_parser.add_argument('--model', default='yolov8n.pt', help='模型路径')
+    run_parser.add_argument('--backend', choices=list(BACKENDS), default=PredictionConfig.backend,
+                            help='推理后端：torch / onnx（ONNX Runtime CPU）/ openvino')
+    run_parser.add_argument('--conf', type=float, default=PredictionConfig.conf_threshold, help='置信度阈值')
+    run_parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl', help='输出格式')
+    run_parser.add_argument('--output', default=None, help='输出文件，默认输出到stdout')
+    run_parser.add_argument('--only-detections', action='store_true', help='只输出有检测目标的帧')
+    run_parser.add_argument('--no-track', dest='track', action='store_false', default=PredictionConfig.tracking,
+                            help='关闭目标跟踪与告警去抖（默认开启：检测框附带持续的track_id，并输出跟踪/告警事件）')
+    run_parser.add_argument('--events-only', action='store_true',
+                            help='只输出跟踪/告警事件，不输出逐帧检测框')
+    run_parser.add_argument('--event-log', default=PredictionConfig.event_log_dir if PredictionConfig.event_log else None,
+                            metavar='DIR', help='把逐帧检测框按列批量写入该目录（Parquet或NumPy分段，按日期分目录并轮转）')
+    run_parser.add_argument('--camera', action='store_true', help='将视频源视为实时流（断开后重连）')
+    run_parser.add_argument('--queue-size', type=int, default=PredictionConfig.queue_size, help='流水线队列容量')
+    run_parser.add_argument('--record-clips', default=None, metavar='DIR',
+                            help='检测到火灾/烟雾时把前后几秒的视频片段保存到该目录（单路视频源）')
+    run_parser.add_argument('--motion-gate', action='store_true', default=PredictionConfig.motion_gate,
+                            help='画面无变化时跳过推理，复用上一帧结果（阈值见PredictionConfig.motion_*）')
+    run_parser.add_argument('--vid-stride', type=int, default=PredictionConfig.vid_stride,
+                            help='每N帧检测一次（单路视频源）')
+    run_parser.add_argument('--adaptive', action='store_true', default=PredictionConfig.adaptive_stride,
+                            help='按推理耗时自适应调整检测步长和输入尺寸，--vid-stride作为步长下限')
+    run_parser.add_argument('--tiled', action='store_true', default=PredictionConfig.tiled,
+                            help='高分辨率画面切成重叠分块检测小目标')
+    run_parser.add_argument('--tile-roi', action='store_true', default=PredictionConfig.tile_roi_only,
+                            help='只对整帧粗检框附近的分块做精检')
+    run_parser.add_argument('--tile-merge', choices=['nms', 'wbf'], default=PredictionConfig.tile_merge,
+                            help='分块结果合并方式')
+    run_parser.add_argument('--result-cache', nargs='?', metavar='DIR', const=PredictionConfig.result_cache_dir,
+                            default=PredictionConfig.result_cache_dir if PredictionConfig.result_cache else None,
+                            help='缓存推理结果：相同模型、参数和帧内容直接返回已保存的检测框（默认目录 %(const)s）')
+    run_parser.add_argument('--max-batch', type=int, default=None, help='多路模式下单次推理的最大帧数')
+    run_parser.set_defaults(func=run)
+
+    bench_parser = subparsers.add_parser('bench', help='对比命令行与GUI路径的启动和逐帧开销')
+    bench_parser.add_argument('--model', default='yolov8n.pt', help='模型路径')
+    bench_parser.add_argument('--image', default=None, help='用于测量逐帧开销的图片')
+    bench_parser.add_argument('--conf', type=float, default=PredictionConfig.conf_threshold, help='置信度阈值')
+    bench_parser.add_argument('--iterations', type=int, default=100, help='逐帧开销的测量次数')
+    bench_parser.set_defaults(func=bench)
+
+    batch_parser = subparsers.add_parser('batch', help='对目录/通配符中的大量图片批量检测')
+    batch_parser.add_argument('--input', action='append', required=True,
+                              help='图片目录（递归）、通配符或图片路径，可重复指定')
+    batch_parser.add_argument('--model', default='yolov8n.pt', help='模型路径')
+    batch_parser.add_argument('--backend', choices=list(BACKENDS), default=PredictionConfig.backend,
+                              help='推理后端：torch / onnx（ONNX Runtime CPU）/ openvino')
+    batch_parser.add_argument('--conf', type=float, default=PredictionConfig.conf_threshold, help='置信度阈值')
+    batch_parser.add_argument('--output', required=True, help='输出文件（.jsonl 或 .csv）')
+    batch_parser.add_argument('--format', choices=['jsonl', 'csv'], default=None,
+                              help='输出格式，默认按输出文件扩展名判断')
+    batch_parser.add_argument('--batch-size', type=int, default=PredictionConfig.batch_size,
+                              help='每次推理的图片数，显存不足时自动减半')
+    batch_parser.add_argument('--workers', type=int, default=PredictionConfig.batch_workers, help='解码线程数')
+    batch_parser.add_argument('--autotune', action='store_true', default=PredictionConfig.autotune,
+                              help='按本机调优结果选择批量、推理线程数和解码线程数（覆盖--batch-size/--workers）')
+    batch_parser.add_argument('--tiled', action='store_true', default=PredictionConfig.tiled,
+                              help='高分辨率图片切成重叠分块检测小目标')
+    batch_parser.add_argument('--result-cache', nargs='?', metavar='DIR', const=PredictionConfig.result_cache_dir,
+                              default=PredictionConfig.result_cache_dir if PredictionConfig.result_cache else None,
+                              help='缓存推理结果，重复处理相同图片时直接返回已保存的检测框（默认目录 %(const)s）')
+    batch_parser.add_argument('--overwrite', action='store_true',
+                              help='覆盖已有输出，默认跳过输出中已记录的图片（断点续跑）')
+    batch_parser.set_defaults(func=batch)
+
+    serve_parser = subparsers.add_parser('serve', help='启动本地HTTP/WebSocket推理服务（需要aiohttp）')
+    serve_parser.add_argument('--model', default='yolov8n.pt', help='模型路径')
+    serve_parser.add_argument('--backend', choices=list(BACKENDS), default=PredictionConfig.backend,
+                              help='推理后端：torch / onnx（ONNX Runtime CPU）/ openvino')
+    serve_parser.add_argument('--host', default=PredictionConfig.server_host, help='监听地址')
+    serve_parser.add_argument('--port', type=int, default=PredictionConfig.server_port, help='监听端口')
+    serve_parser.add_argument('--conf', type=float, default=PredictionConfig.conf_threshold,
+                              help='默认置信度阈值，请求可用 ?conf= 覆盖')
+    serve_parser.add_argument('--max-batch', type=int, default=PredictionConfig.server_max_batch,
+                              help='微批处理的最大帧数')
+    serve_parser.add_argument('--max-wait-ms', type=float, default=PredictionConfig.server_max_wait_ms,
+                              help='收到第一帧后最多等待多久再凑批（毫秒）')
+    serve_parser.add_argument('--autotune', action='store_true', default=PredictionConfig.autotune,
+                              help='按本机调优结果选择最大批量和推理线程数（覆盖--max-batch）')
+    serve_parser.add_argument('--tiled', action='store_true', default=PredictionConfig.tiled,
+                              help='高分辨率图片切成重叠分块检测小目标')
+    serve_parser.set_defaults(func=serve)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'batch' and args.format is None:
+        args.format = 'csv' if args.output.lower().endswith('.csv') else 'jsonl'
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
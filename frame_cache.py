@@ -0,0 +1,229 @@
+"""
+进程级解码帧缓存
+
+图片预览、图片检测和视频首帧预览共用同一解码层：
+按 (路径, 文件修改时间, 文件大小, 缩小倍数) 缓存解码后的帧，超出内存预算时按LRU淘汰，
+同一文件重复预览或重复检测都不再重新解码。预览使用 IMREAD_REDUCED_* 直接按1/2、1/4、1/8
+分辨率解码，速度远快于先全尺寸解码再缩放；浏览文件夹时由后台线程池预取。
+解码通过 np.fromfile + cv2.imdecode 进行，Windows上的中文等非ASCII路径也能读取。
+
+缓存中的帧设为只读，调用方需要修改时请先拷贝。
+"""
+import concurrent.futures
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from config import PredictionConfig
+
+# 缩小倍数 -> OpenCV读取标志
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+VIDEO = 'video'  # 视频首帧条目的缩小倍数占位
+
+
+def imread(path, flags=cv2.IMREAD_COLOR):
+    """读取图片，支持非ASCII路径（Windows上 cv2.imread 无法打开中文路径），失败时返回None
+
+    先用 numpy 读出文件内容再 cv2.imdecode，IMREAD_REDUCED_* 标志同样有效。
+    """
+    data = np.fromfile(path, dtype=np.uint8)
+    if data.size == 0:
+        return None
+    return cv2.imdecode(data, flags)
+
+
+def image_size(path):
+    """只读取文件头获取图片宽高，失败时返回None"""
+    try:
+        from PIL import Image
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def choose_reduce(size, max_side):
+    """选择缩小后长边仍不小于 max_side 的最大缩小倍数"""
+    if size is None or not max_side:
+        return 1
+    longest = max(size)
+    for factor in (8, 4, 2):
+        if longest / factor >= max_side:
+            return factor
+    return 1
+
+
+class FrameCache:
+    """带LRU淘汰和后台预取的解码帧缓存，线程安全
+
+    参数:
+        memory_budget_mb: 缓存帧的总内存预算（MB）
+        workers: 预取线程数
+    """
+
+    def __init__(self, memory_budget_mb=512, workers=2):
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (frame, info)
+        self._bytes = 0
+        self._loading = {}  # 正在解码的key -> Future，避免并发重复解码
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="frame-decode")
+
+    @staticmethod
+    def make_key(path, reduce=1):
+        """缓存键：路径 + 修改时间 + 文件大小 + 缩小倍数，文件被覆盖后自动失效"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        return (path, stat.st_mtime_ns, stat.st_size, reduce)
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry, None
+            future = self._loading.get(key)
+            if future is None:
+                future = concurrent.futures.Future()
+                self._loading[key] = future
+                self.misses += 1
+                return None, (future, True)
+            return None, (future, False)
+
+    def _fetch(self, key, decode):
+        """命中直接返回，否则由当前线程解码（其他线程正在解码时等待其结果）"""
+        entry, loading = self._lookup(key)
+        if entry is not None:
+            return entry
+        future, owner = loading
+        if not owner:
+            return future.result()
+
+        try:
+            entry = decode()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+        if entry[0] is not None:
+            entry[0].setflags(write=False)
+            self._store(key, entry)
+        future.set_result(entry)
+        return entry
+
+    def _store(self, key, entry):
+        with self._lock:
+            # 同一路径的旧版本文件不会再被命中，直接移除
+            for stale in [k for k in self._entries if k[0] == key[0] and k[1:3] != key[1:3]]:
+                self._bytes -= self._entries.pop(stale)[0].nbytes
+            self._entries[key] = entry
+            self._bytes += entry[0].nbytes
+            for old in list(self._entries):
+                if self._bytes <= self.memory_budget or old == key:
+                    break
+                self._bytes -= self._entries.pop(old)[0].nbytes
+                self.evictions += 1
+
+    def get(self, path, reduce=1):
+        """获取解码后的BGR帧，reduce为1/2/4/8；无法读取时返回None"""
+        key = self.make_key(path, reduce)
+
+        def decode():
+            if reduce != 1:
+                # 已有全尺寸帧时直接缩小，比重新解码快
+                with self._lock:
+                    full = self._entries.get(key[:3] + (1,))
+                if full is not None:
+                    h, w = full[0].shape[:2]
+                    frame = cv2.resize(full[0], (max(1, w // reduce), max(1, h // reduce)),
+                                       interpolation=cv2.INTER_AREA)
+                    return frame, None
+            return imread(key[0], REDUCED_FLAGS[reduce]), None
+
+        return self._fetch(key, decode)[0]
+
+    def preview(self, path, max_side=PredictionConfig.preview_max_side):
+        """获取用于预览的帧：按文件头尺寸选择缩小倍数，返回 (帧, 原图宽高)"""
+        size = image_size(path)
+        frame = self.get(path, choose_reduce(size, max_side))
+        if size is None and frame is not None:
+            size = (frame.shape[1], frame.shape[0])
+        return frame, size
+
+    def video_preview(self, path):
+        """获取视频首帧和视频信息 (帧, {'fps', 'frame_count', 'width', 'height'})"""
+        key = self.make_key(path, VIDEO)
+
+        def decode():
+            cap = cv2.VideoCapture(key[0])
+            try:
+                ret, frame = cap.read() if cap.isOpened() else (False, None)
+                info = {
+                    'fps': cap.get(cv2.CAP_PROP_FPS),
+                    'frame_count': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+                    'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                    'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                }
+            finally:
+                cap.release()
+            return (frame if ret else None), info
+
+        return self._fetch(key, decode)
+
+    def prefetch(self, paths, reduce=1):
+        """在后台线程池中预先解码，返回Future列表"""
+        futures = []
+        for path in paths:
+            futures.append(self._executor.submit(self._prefetch_one, path, reduce))
+        return futures
+
+    def prefetch_previews(self, paths, max_side=PredictionConfig.preview_max_side):
+        """浏览文件夹时在后台预取预览帧（读取文件头选择缩小倍数也在后台线程中进行）"""
+        return [self._executor.submit(self._prefetch_one, path, None, max_side) for path in paths]
+
+    def _prefetch_one(self, path, reduce, max_side=None):
+        try:
+            if reduce is None:
+                self.preview(path, max_side)
+            else:
+                self.get(path, reduce)
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'memory_mb': self._bytes / 1024 / 1024,
+                'budget_mb': self.memory_budget / 1024 / 1024,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+# 进程级共享的解码缓存
+_cache = FrameCache(PredictionConfig.frame_cache_mb, PredictionConfig.frame_cache_workers)
+
+
+def get_frame_cache():
+    return _cache
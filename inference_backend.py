@@ -0,0 +1,247 @@
+"""
+可插拔的推理后端
+
+- torch: ultralytics 的 PyTorch 推理（默认）
+- onnx: 导出为ONNX后用ONNX Runtime在CPU上推理，可调节线程数
+- openvino: 导出为OpenVINO IR后用OpenVINO Runtime在CPU上推理，可调节线程数
+
+所有后端都提供与 YOLO.predict 相同的调用方式和返回值（Results列表），
+检测流水线、多路引擎和命令行无需区分后端。
+导出的模型缓存在 .pt 文件旁，文件名包含权重哈希、输入尺寸和opset，权重更新后自动重新导出。
+"""
+import ast
+import glob
+import os
+import shutil
+
+import numpy as np
+
+import utils
+
+BACKEND_TORCH = 'torch'
+BACKEND_ONNX = 'onnx'
+BACKEND_OPENVINO = 'openvino'
+
+# 后端标识 -> 显示名称
+BACKENDS = {
+    BACKEND_TORCH: 'PyTorch',
+    BACKEND_ONNX: 'ONNX Runtime (CPU)',
+    BACKEND_OPENVINO: 'OpenVINO (CPU)',
+}
+
+
+def default_cpu_threads():
+    """ONNX Runtime默认线程数：当前进程可用的CPU核数"""
+    if hasattr(os, 'sched_getaffinity'):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+
+def resolve_backend(model_path, backend=BACKEND_TORCH):
+    """已经是导出格式的模型（.onnx文件或OpenVINO目录）只能使用对应的后端"""
+    if str(model_path).endswith('.onnx'):
+        return BACKEND_ONNX
+    if str(model_path).rstrip('/\\').endswith('_openvino_model'):
+        return BACKEND_OPENVINO
+    return backend
+
+
+def preprocess_frames(frames, imgsz):
+    """letterbox + BGR转RGB + HWC转CHW + 归一化，返回 (输入张量, 各帧缩放参数)"""
+    blob = np.empty((len(frames), 3, imgsz, imgsz), dtype=np.float32)
+    params = []
+    for i, frame in enumerate(frames):
+        image, ratio, pad = utils.letterbox(frame, imgsz)
+        blob[i] = image[:, :, ::-1].transpose(2, 0, 1)
+        params.append((ratio, pad))
+    blob *= 1.0 / 255
+    return blob, params
+
+
+def resolve_weights(model_path):
+    """本地不存在的权重名（如官方的 yolov8n.pt）交给ultralytics下载，返回实际的权重文件路径"""
+    if os.path.exists(model_path):
+        return model_path
+    from ultralytics import YOLO
+
+    return str(YOLO(model_path).ckpt_path or model_path)
+
+
+def export_path(model_path, backend=BACKEND_ONNX, imgsz=640, opset=12):
+    """导出模型的缓存路径：<名称>.<权重哈希>.<尺寸>.op<opset>.onnx（OpenVINO为目录）"""
+    model_path = resolve_weights(model_path)
+    stem = os.path.splitext(model_path)[0]
+    digest = utils.file_hash(model_path)[:12]
+    if backend == BACKEND_OPENVINO:
+        return f"{stem}.{digest}.{imgsz}_openvino_model"
+    return f"{stem}.{digest}.{imgsz}.op{opset}.onnx"
+
+
+def export_model(model_path, backend=BACKEND_ONNX, imgsz=640, opset=12):
+    """导出模型（已有缓存时直接返回缓存路径）"""
+    target = export_path(model_path, backend, imgsz, opset)
+    if os.path.exists(target):
+        return target
+
+    from ultralytics import YOLO
+
+    model = YOLO(resolve_weights(model_path))
+    if backend == BACKEND_OPENVINO:
+        exported = model.export(format='openvino', imgsz=imgsz)
+    else:
+        # 动态batch，便于多路/批量推理
+        exported = model.export(format='onnx', imgsz=imgsz, opset=opset, dynamic=True, simplify=True)
+
+    # ultralytics导出到固定文件名，移动到带哈希的缓存位置
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+    os.replace(str(exported), target)
+    return target
+
+
+class OnnxRuntimeBackend:
+    """ONNX Runtime CPU推理后端
+
+    参数:
+        onnx_path: ONNX模型路径
+        imgsz: 输入尺寸
+        threads: 算子内并行线程数，None为可用CPU核数
+    """
+
+    def __init__(self, onnx_path, imgsz=640, threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads or default_cpu_threads()
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+        self.path = onnx_path
+        self.imgsz = imgsz
+        self.threads = options.intra_op_num_threads
+        self.input_name = self.session.get_inputs()[0].name
+
+        # 输入batch维是否为动态
+        batch_dim = self.session.get_inputs()[0].shape[0]
+        self.dynamic_batch = not isinstance(batch_dim, int)
+
+        # ultralytics导出时把类别名写在元数据中
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata['names']) if 'names' in metadata else {}
+
+    def preprocess(self, frames, imgsz):
+        return preprocess_frames(frames, imgsz)
+
+    def run(self, blob):
+        """前向推理，返回 (batch, 4+类别数, 锚点数) 输出"""
+        return self.session.run(None, {self.input_name: blob})[0]
+
+    def postprocess(self, output, frame, ratio, pad, conf, iou, max_det):
+        """解码单帧输出 (4+类别数, 锚点数) 为 (N, 6) 检测数组，坐标还原到原图"""
+        preds = output.T
+        scores = preds[:, 4:]
+        cls_ids = scores.argmax(axis=1)
+        confs = scores[np.arange(len(scores)), cls_ids]
+        mask = confs >= conf
+        preds, cls_ids, confs = preds[mask], cls_ids[mask], confs[mask]
+        if len(preds) == 0:
+            return np.empty((0, 6), dtype=np.float32)
+
+        # cxcywh -> xyxy
+        boxes = np.empty((len(preds), 4), dtype=np.float32)
+        boxes[:, :2] = preds[:, :2] - preds[:, 2:4] / 2
+        boxes[:, 2:] = preds[:, :2] + preds[:, 2:4] / 2
+
+        keep = utils.nms_boxes(boxes, confs, iou, classes=cls_ids, max_det=max_det)
+        boxes, confs, cls_ids = boxes[keep], confs[keep], cls_ids[keep]
+
+        # 去除letterbox填充并还原缩放
+        boxes[:, [0, 2]] -= pad[0]
+        boxes[:, [1, 3]] -= pad[1]
+        boxes /= ratio
+        h, w = frame.shape[:2]
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, w)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, h)
+
+        return np.hstack([boxes, confs[:, None], cls_ids[:, None]]).astype(np.float32)
+
+    def predict(self, source, conf=0.25, iou=0.45, imgsz=None, max_det=300, verbose=False, **kwargs):
+        """与 YOLO.predict 兼容的推理接口，source 为单帧或帧列表"""
+        frames = source if isinstance(source, (list, tuple)) else [source]
+        imgsz = imgsz or self.imgsz
+
+        blob, params = self.preprocess(frames, imgsz)
+        if self.dynamic_batch:
+            outputs = self.run(blob)
+        else:
+            outputs = [self.run(blob[i:i + 1])[0] for i in range(len(frames))]
+
+        results = []
+        for frame, output, (ratio, pad) in zip(frames, outputs, params):
+            detections = self.postprocess(output, frame, ratio, pad, conf, iou, max_det)
+            results.append(utils.build_results(frame, self.names, detections))
+        return results
+
+
+class OpenVinoBackend(OnnxRuntimeBackend):
+    """OpenVINO CPU推理后端，前后处理与ONNX后端相同
+
+    参数:
+        ov_dir: ultralytics导出的OpenVINO模型目录（.xml/.bin 与 metadata.yaml）
+        imgsz: 输入尺寸
+        threads: 推理线程数（INFERENCE_NUM_THREADS），None为可用CPU核数
+    """
+
+    def __init__(self, ov_dir, imgsz=640, threads=None):
+        try:
+            from openvino import Core
+        except ImportError:
+            from openvino.runtime import Core
+
+        xml_files = sorted(glob.glob(os.path.join(ov_dir, '*.xml')))
+        if not xml_files:
+            raise FileNotFoundError(f"OpenVINO模型目录中没有 .xml 文件: {ov_dir}")
+        core = Core()
+        model = core.read_model(xml_files[0])
+        self.threads = threads or default_cpu_threads()
+        self.compiled = core.compile_model(model, 'CPU', {
+            'INFERENCE_NUM_THREADS': self.threads,
+            'PERFORMANCE_HINT': 'LATENCY',
+        })
+        self.output = self.compiled.output(0)
+        self.path = ov_dir
+        self.imgsz = imgsz
+        self.dynamic_batch = model.input(0).get_partial_shape()[0].is_dynamic
+
+        # ultralytics导出时把类别名写在 metadata.yaml 中
+        self.names = {}
+        metadata_path = os.path.join(ov_dir, 'metadata.yaml')
+        if os.path.exists(metadata_path):
+            import yaml
+
+            with open(metadata_path, encoding='utf-8') as f:
+                self.names = (yaml.safe_load(f) or {}).get('names', {})
+
+    def run(self, blob):
+        return self.compiled(blob)[self.output]
+
+
+def load_backend(model_path, backend=BACKEND_TORCH, imgsz=640, opset=12, threads=None):
+    """按后端加载模型，返回带 predict 方法的对象"""
+    from ultralytics import YOLO
+
+    backend = resolve_backend(model_path, backend)
+    if backend == BACKEND_TORCH:
+        return YOLO(model_path)
+
+    # 已经是导出格式的模型（例如 quantize.py 发布的INT8模型）直接加载，.pt则先导出（有缓存时跳过）
+    if backend == BACKEND_ONNX:
+        onnx_path = model_path if model_path.endswith('.onnx') else export_model(model_path, backend, imgsz, opset)
+        return OnnxRuntimeBackend(onnx_path, imgsz, threads)
+
+    if backend == BACKEND_OPENVINO:
+        ov_path = model_path if os.path.isdir(model_path) else export_model(model_path, backend, imgsz, opset)
+        return OpenVinoBackend(ov_path, imgsz, threads)
+
+    raise ValueError(f"未知的推理后端: {backend}")
@@ -0,0 +1,193 @@
+"""
+进程级模型缓存
+
+按 (模型路径, 文件修改时间, 设备, 半精度, 推理后端) 缓存已加载并预热的模型，
+停止/重新开始检测、在视频与图片之间切换时直接复用，不再重复加载权重和首次推理预热。
+超出内存预算时按最近最少使用（LRU）顺序淘汰。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import inference_backend
+from config import PredictionConfig
+
+
+class CachedModel:
+    """缓存条目"""
+    __slots__ = ('model', 'size_bytes', 'load_time', 'warmup_time', 'hits')
+
+    def __init__(self, model, size_bytes, load_time, warmup_time):
+        self.model = model
+        self.size_bytes = size_bytes
+        self.load_time = load_time
+        self.warmup_time = warmup_time
+        self.hits = 0
+
+
+def estimate_model_bytes(model, model_path):
+    """估算模型占用的内存：参数与缓冲区字节数之和，无法获取时退化为权重文件大小"""
+    try:
+        module = model.model
+        tensors = list(module.parameters()) + list(module.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    except Exception:
+        return os.path.getsize(model_path) if os.path.exists(model_path) else 0
+
+
+class ModelRegistry:
+    """带LRU淘汰和加载预热的模型注册表，线程安全
+
+    参数:
+        memory_budget_mb: 缓存模型的总内存预算（MB）
+        warmup_imgsz: 预热推理使用的图像尺寸，0表示不预热
+    """
+
+    def __init__(self, memory_budget_mb=1024, warmup_imgsz=640):
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.warmup_imgsz = warmup_imgsz
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._loading = {}  # 正在加载的key -> Event，避免并发重复加载
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model_path, device=None, half=False, backend=inference_backend.BACKEND_TORCH):
+        """缓存键：路径 + 文件修改时间 + 设备 + 半精度 + 后端，权重文件更新后自动失效"""
+        path = os.path.abspath(model_path) if os.path.exists(model_path) else model_path
+        mtime = os.path.getmtime(path) if os.path.exists(path) else 0.0
+        backend = inference_backend.resolve_backend(model_path, backend)
+        return (path, mtime, str(device or ''), bool(half), backend)
+
+    def is_cached(self, model_path, device=None, half=False, backend=inference_backend.BACKEND_TORCH):
+        with self._lock:
+            return self.make_key(model_path, device, half, backend) in self._entries
+
+    def get(self, model_path, device=None, half=False, backend=inference_backend.BACKEND_TORCH):
+        """获取已预热的模型，未缓存时加载并预热"""
+        key = self.make_key(model_path, device, half, backend)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    entry.hits += 1
+                    self.hits += 1
+                    return entry.model
+
+                event = self._loading.get(key)
+                if event is None:
+                    # 由当前线程负责加载
+                    event = threading.Event()
+                    self._loading[key] = event
+                    self.misses += 1
+                    break
+
+            # 其他线程正在加载同一模型，等待完成后重新查找
+            event.wait()
+
+        try:
+            entry = self._load(key, model_path, device, half, backend)
+            with self._lock:
+                # 同一路径的旧版本权重不会再被命中，直接移除
+                for stale in [k for k in self._entries if k[0] == key[0] and k[1] != key[1]]:
+                    del self._entries[stale]
+                self._entries[key] = entry
+                self._evict(keep=key)
+            return entry.model
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            event.set()
+
+    def _load(self, key, model_path, device, half, backend):
+        start = time.perf_counter()
+        model = inference_backend.load_backend(
+            model_path, backend,
+            imgsz=PredictionConfig.imgsz,
+            opset=PredictionConfig.onnx_opset,
+            threads=PredictionConfig.onnx_threads,
+        )
+        load_time = time.perf_counter() - start
+
+        # 预热：首次推理会初始化设备、分配显存并固定 device/half 参数
+        warmup_time = 0.0
+        if self.warmup_imgsz:
+            start = time.perf_counter()
+            dummy = np.zeros((self.warmup_imgsz, self.warmup_imgsz, 3), dtype=np.uint8)
+            kwargs = {'half': half, 'verbose': False}
+            if device:
+                kwargs['device'] = device
+            model.predict(dummy, **kwargs)
+            warmup_time = time.perf_counter() - start
+
+        return CachedModel(model, estimate_model_bytes(model, key[0]), load_time, warmup_time)
+
+    def _evict(self, keep=None):
+        """超出内存预算时按LRU顺序淘汰，刚加载的模型保留"""
+        total = sum(entry.size_bytes for entry in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.memory_budget:
+                break
+            if key == keep:
+                continue
+            total -= self._entries.pop(key).size_bytes
+
+    def preload(self, model_path, device=None, half=False, backend=inference_backend.BACKEND_TORCH,
+                callback=None):
+        """在后台线程中加载并预热模型，完成后调用 callback(model_path, error)"""
+        def worker():
+            error = None
+            try:
+                self.get(model_path, device, half, backend)
+            except Exception as e:
+                error = e
+            if callback:
+                callback(model_path, error)
+
+        thread = threading.Thread(target=worker, name="model-preload", daemon=True)
+        thread.start()
+        return thread
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'models': len(self._entries),
+                'memory_mb': sum(e.size_bytes for e in self._entries.values()) / 1024 / 1024,
+                'budget_mb': self.memory_budget / 1024 / 1024,
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': [
+                    {'path': key[0], 'device': key[2], 'half': key[3], 'backend': key[4],
+                     'load_ms': e.load_time * 1000, 'warmup_ms': e.warmup_time * 1000, 'hits': e.hits}
+                    for key, e in self._entries.items()
+                ],
+            }
+
+
+# 进程级共享的注册表
+_registry = ModelRegistry(PredictionConfig.model_cache_mb, PredictionConfig.warmup_imgsz)
+
+
+def get_registry():
+    return _registry
+
+
+def get_model(model_path, device=PredictionConfig.device, half=PredictionConfig.half,
+              backend=PredictionConfig.backend):
+    """从进程级缓存获取已预热的模型"""
+    return _registry.get(model_path, device, half, backend)
+
+
+def preload_model(model_path, device=PredictionConfig.device, half=PredictionConfig.half,
+                  backend=PredictionConfig.backend, callback=None):
+    """后台预加载模型到进程级缓存"""
+    return _registry.preload(model_path, device, half, backend, callback)
@@ -0,0 +1,124 @@
+"""
+运动门控：画面无变化时跳过推理
+
+固定安装的监控摄像头大部分时间画面是静止的。每帧先缩小为灰度小图，与上一次推理时的参考帧做差分，
+变化像素比例低于阈值时复用上一次的检测结果，不调用模型；每隔固定帧数强制推理一次（关键帧），
+避免缓慢变化（例如逐渐扩散的淡烟）长期被跳过。
+"""
+import copy
+import threading
+
+import cv2
+import numpy as np
+
+from config import PredictionConfig
+
+
+def reuse_results(results, frame):
+    """复用上一帧的检测结果：检测框不变，原图替换为当前帧，保存/录制时绘制在当前帧上"""
+    reused = []
+    for result in results:
+        result = copy.copy(result)
+        result.orig_img = frame
+        reused.append(result)
+    return reused
+
+
+class MotionGate:
+    """帧差运动门控
+
+    参数:
+        threshold: 变化像素比例阈值，超过时执行推理；越小越灵敏
+        pixel_delta: 灰度差超过该值的像素才算变化，用于过滤传感器噪声
+        keyframe_interval: 连续跳过的最大帧数，达到后强制推理，0表示不强制
+        width: 差分小图的宽度（高度按比例缩放）
+        blur: 差分前高斯模糊的核大小，0表示不模糊
+    """
+
+    def __init__(self, threshold=0.002, pixel_delta=12, keyframe_interval=30, width=160, blur=3):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.keyframe_interval = keyframe_interval
+        self.width = width
+        self.blur = blur
+
+        self.checked = 0
+        self.skipped = 0
+        self.keyframes = 0
+        self.last_change = 0.0  # 最近一帧的变化像素比例
+        self._reference = None
+        self._since_inference = 0
+        self._force = True
+        self._lock = threading.Lock()
+
+    def thumbnail(self, frame):
+        """缩小并转为灰度，差分计算量与原始分辨率无关"""
+        h, w = frame.shape[:2]
+        height = max(1, round(h * self.width / w))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        if self.blur:
+            small = cv2.GaussianBlur(small, (self.blur, self.blur), 0)
+        return small
+
+    def change_ratio(self, thumb, reference):
+        """两张小图之间变化像素的比例"""
+        if reference is None or reference.shape != thumb.shape:
+            return 1.0
+        diff = cv2.absdiff(thumb, reference)
+        return np.count_nonzero(diff > self.pixel_delta) / diff.size
+
+    def force(self):
+        """下一帧强制推理（例如修改置信度阈值后）"""
+        with self._lock:
+            self._force = True
+
+    def check(self, frame):
+        """判断当前帧是否需要推理，需要时以该帧作为新的参考帧
+
+        与上一次推理的帧而不是上一帧比较，缓慢累积的变化最终也会超过阈值。
+        """
+        thumb = self.thumbnail(frame)
+        with self._lock:
+            self.checked += 1
+            self.last_change = self.change_ratio(thumb, self._reference)
+            keyframe = self.keyframe_interval and self._since_inference + 1 >= self.keyframe_interval
+
+            if self._force or keyframe or self.last_change >= self.threshold:
+                if keyframe and self.last_change < self.threshold:
+                    self.keyframes += 1
+                self._force = False
+                self._reference = thumb
+                self._since_inference = 0
+                return True
+
+            self._since_inference += 1
+            self.skipped += 1
+            return False
+
+    def reset(self):
+        with self._lock:
+            self._reference = None
+            self._since_inference = 0
+            self._force = True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'checked': self.checked,
+                'skipped': self.skipped,
+                'keyframes': self.keyframes,
+                'skip_rate': self.skipped / self.checked if self.checked else 0.0,
+                'last_change': self.last_change,
+            }
+
+
+def create_motion_gate():
+    """按 PredictionConfig 中的运动门控配置创建门控"""
+    return MotionGate(
+        threshold=PredictionConfig.motion_threshold,
+        pixel_delta=PredictionConfig.motion_pixel_delta,
+        keyframe_interval=PredictionConfig.motion_keyframe_interval,
+        width=PredictionConfig.motion_width,
+    )
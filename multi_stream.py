@@ -0,0 +1,240 @@
+"""
+多路视频流批量检测引擎
+
+多路摄像头共享同一个YOLO模型：每路视频源由独立采集线程持续读取并只保留最新帧，
+调度线程每个周期收集各路的最新帧执行一次批量predict，再把结果分发回对应的视频流。
+"""
+import threading
+import time
+
+import cv2
+
+from detection_pipeline import StageMeter
+from motion_gate import reuse_results
+
+
+class LatestFrameSlot:
+    """只保存最新一帧的单槽缓冲，未被取走就被覆盖的帧计为丢弃"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frame = None
+        self._capture_time = 0.0
+        self._fresh = False
+        self.dropped = 0
+
+    def put(self, frame, capture_time):
+        with self._lock:
+            if self._fresh:
+                self.dropped += 1
+            self._frame = frame
+            self._capture_time = capture_time
+            self._fresh = True
+
+    def has_new(self):
+        return self._fresh
+
+    def take(self):
+        """取走最新帧，返回 (frame, capture_time)，没有新帧时返回 (None, 0)"""
+        with self._lock:
+            if not self._fresh:
+                return None, 0.0
+            self._fresh = False
+            return self._frame, self._capture_time
+
+
+class VideoStream:
+    """单路视频源：采集线程 + 最新帧槽 + 统计"""
+
+    def __init__(self, stream_id, source, use_camera=None, motion_gate=None):
+        self.stream_id = stream_id
+        self.source = source
+        # 整数索引或网络地址视为摄像头，读取失败时重连
+        if use_camera is None:
+            use_camera = isinstance(source, int) or str(source).startswith(('rtsp://', 'http://', 'https://'))
+        self.use_camera = use_camera
+        self.slot = LatestFrameSlot()
+        self.meter = StageMeter(str(stream_id))  # 记录端到端延迟（采集到结果输出）
+        self.last_served = 0.0
+        self.finished = False
+        self.thread = None
+        self.motion_gate = motion_gate  # 每路独立的运动门控，参考帧互不影响
+        self.last_results = None
+
+    def stats(self):
+        snapshot = self.meter.snapshot()
+        snapshot['dropped'] = self.slot.dropped
+        snapshot['finished'] = self.finished
+        if self.motion_gate:
+            snapshot['skip_rate'] = self.motion_gate.stats()['skip_rate']
+        return snapshot
+
+
+class MultiStreamEngine:
+    """多路视频流批量检测引擎
+
+    参数:
+        sources: 视频源列表（摄像头索引、视频文件路径或网络流地址）
+        model: 共享的YOLO模型
+        conf: 置信度阈值
+        max_batch: 单次predict的最大帧数，None表示等于视频流数量
+        gate_factory: 运动门控工厂函数，每路视频流调用一次，None表示每帧推理
+        on_result: 结果回调 on_result(stream_id, frame, results)
+        on_status: 状态回调 on_status(text, color)
+        on_stats: 统计回调 on_stats(stats)，约每秒调用一次
+    """
+
+    def __init__(self, sources, model, conf=0.25, max_batch=None, gate_factory=None,
+                 on_result=None, on_status=None, on_stats=None):
+        self.model = model
+        self.conf = conf
+        self.max_batch = max_batch
+        self.on_result = on_result
+        self.on_status = on_status
+        self.on_stats = on_stats
+
+        self.streams = [VideoStream(i, source, motion_gate=gate_factory() if gate_factory else None)
+                        for i, source in enumerate(sources)]
+        self.batch_meter = StageMeter('batch')
+        self.running = False
+        self._new_frame = threading.Condition()
+        self._scheduler = None
+
+    def set_conf(self, conf):
+        self.conf = conf
+        for stream in self.streams:
+            if stream.motion_gate:
+                stream.motion_gate.force()
+
+    def _status(self, text, color):
+        if self.on_status:
+            self.on_status(text, color)
+
+    def start(self):
+        self.running = True
+        for stream in self.streams:
+            stream.thread = threading.Thread(
+                target=self._capture_loop, args=(stream,),
+                name=f"capture-{stream.stream_id}", daemon=True)
+            stream.thread.start()
+
+        self._scheduler = threading.Thread(target=self._schedule_loop, name="scheduler", daemon=True)
+        self._scheduler.start()
+        self._status(f"检测中，共 {len(self.streams)} 路视频流...", "#4CAF50")  # 绿色
+
+    def wait(self):
+        if self._scheduler:
+            self._scheduler.join()
+        for stream in self.streams:
+            if stream.thread:
+                stream.thread.join()
+
+    def run(self):
+        """启动引擎并阻塞直到所有视频流结束或被停止"""
+        self.start()
+        self.wait()
+
+    def stop(self):
+        self.running = False
+        with self._new_frame:
+            self._new_frame.notify_all()
+
+    def stats(self):
+        """每路视频流及批处理的统计快照"""
+        stats = {stream.stream_id: stream.stats() for stream in self.streams}
+        stats['batch'] = self.batch_meter.snapshot()
+        return stats
+
+    def _capture_loop(self, stream):
+        cap = cv2.VideoCapture(stream.source)
+        if not cap.isOpened():
+            self._status(f"无法打开视频源: {stream.source}", "#EA4335")  # 红色
+
+        try:
+            while self.running:
+                ret, frame = cap.read() if cap.isOpened() else (False, None)
+                if not ret:
+                    if not stream.use_camera:  # 视频文件读完后该路结束
+                        break
+                    # 摄像头或网络流断开时尝试重连
+                    cap.release()
+                    time.sleep(0.5)
+                    cap = cv2.VideoCapture(stream.source)
+                    continue
+
+                stream.slot.put(frame, time.perf_counter())
+                with self._new_frame:
+                    self._new_frame.notify()
+
+                # 视频文件没有实时节奏，等待上一帧被取走再读，避免白白解码后丢弃
+                if not stream.use_camera:
+                    while self.running and stream.slot.has_new():
+                        time.sleep(0.001)
+        finally:
+            cap.release()
+            stream.finished = True
+            with self._new_frame:
+                self._new_frame.notify()
+
+    def _select_batch(self):
+        """公平调度：在有新帧的视频流中，优先选择最久未被服务的"""
+        ready = [stream for stream in self.streams if stream.slot.has_new()]
+        ready.sort(key=lambda stream: stream.last_served)
+        max_batch = self.max_batch or len(self.streams)
+        return ready[:max_batch]
+
+    def _dispatch(self, stream, frame, capture_time, results, done):
+        stream.last_served = done
+        stream.meter.record(done - capture_time)
+        if self.on_result:
+            self.on_result(stream.stream_id, frame, results)
+
+    def _schedule_loop(self):
+        last_report = time.perf_counter()
+        try:
+            while self.running:
+                batch = self._select_batch()
+                if not batch:
+                    if all(stream.finished for stream in self.streams):
+                        self._status("所有视频流已结束", "#FFA500")  # 橙色
+                        break
+                    with self._new_frame:
+                        self._new_frame.wait(0.05)
+                    continue
+
+                streams, frames, capture_times = [], [], []
+                for stream in batch:
+                    frame, capture_time = stream.slot.take()
+                    if frame is None:
+                        continue
+                    gate = stream.motion_gate
+                    if gate is not None and not gate.check(frame) and stream.last_results is not None:
+                        # 画面无变化，复用该路上次的结果，不占用批次
+                        self._dispatch(stream, frame, capture_time,
+                                       reuse_results(stream.last_results, frame), time.perf_counter())
+                        continue
+                    streams.append(stream)
+                    frames.append(frame)
+                    capture_times.append(capture_time)
+
+                if frames:
+                    # 一次批量前向推理
+                    start = time.perf_counter()
+                    results = self.model.predict(frames, conf=self.conf, verbose=False)
+                    done = time.perf_counter()
+                    self.batch_meter.record(done - start)
+
+                    # 按视频流分发结果
+                    for stream, frame, capture_time, result in zip(streams, frames, capture_times, results):
+                        stream.last_results = [result]
+                        self._dispatch(stream, frame, capture_time, [result], done)
+
+                # 整批都被运动门控复用时也要上报统计，静止画面下统计不能中断
+                now = time.perf_counter()
+                if self.on_stats and now - last_report >= 1.0:
+                    self.on_stats(self.stats())
+                    last_report = now
+        except Exception as e:
+            self._status(f"错误: {str(e)}", "#EA4335")  # 红色
+        finally:
+            self.running = False
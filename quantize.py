@@ -0,0 +1,303 @@
+"""
+INT8训练后量化
+
+将训练得到的 best.pt 导出为ONNX，用验证集图片的随机子集做静态INT8量化校准，
+再在验证集上对比FP32与INT8模型的mAP50-95：精度下降超过阈值时拒绝发布到weights目录。
+报告包含CPU上的单帧延迟和批量吞吐对比，结果写入 <project>/<name>/quantize/report.json。
+
+用法:
+    python quantize.py --name improved_exp
+    python quantize.py --weights runs/train/improved_exp/weights/best.pt --max-drop 0.005
+    python quantize.py --name improved_exp --method openvino
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import time
+
+import cv2
+import numpy as np
+import yaml
+
+import inference_backend
+from config import QuantizationConfig
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def resolve_calib_dir(calib_images, data_yaml):
+    """校准图片目录：优先使用指定目录，不存在时使用数据集配置中的val路径"""
+    if os.path.isdir(calib_images):
+        return calib_images
+    with open(data_yaml, 'r', encoding='utf-8') as f:
+        data = yaml.safe_load(f)
+    val_dir = data.get('val', '')
+    if data.get('path') and not os.path.isabs(val_dir):
+        val_dir = os.path.join(data['path'], val_dir)
+    if os.path.isdir(val_dir):
+        return val_dir
+    raise FileNotFoundError(f"找不到校准图片目录: {calib_images} 或 {val_dir}")
+
+
+def sample_images(image_dir, count, seed=0):
+    """从目录中随机抽取count张图片（固定种子，便于复现）"""
+    paths = sorted(p for p in glob.glob(os.path.join(image_dir, '*')) if p.lower().endswith(IMAGE_EXTS))
+    if not paths:
+        raise FileNotFoundError(f"目录中没有图片: {image_dir}")
+    if len(paths) > count:
+        paths = random.Random(seed).sample(paths, count)
+    return paths
+
+
+def make_calibration_reader(image_paths, imgsz, input_name):
+    """构造ONNX Runtime校准数据读取器，前处理与推理时的 preprocess_frames 保持一致"""
+    from onnxruntime.quantization import CalibrationDataReader
+
+    class ImageCalibrationReader(CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(image_paths)
+
+        def get_next(self):
+            for path in self._paths:
+                frame = cv2.imread(path)
+                if frame is None:
+                    continue
+                blob, _ = inference_backend.preprocess_frames([frame], imgsz)
+                return {input_name: blob}
+            return None
+
+    return ImageCalibrationReader()
+
+
+def head_nodes_to_exclude(onnx_path):
+    """检测头（编号最大的模块）中除卷积以外的节点：DFL、Sigmoid、Concat等对量化误差敏感，保持FP32"""
+    import onnx
+
+    model = onnx.load(onnx_path)
+    pattern = re.compile(r'^/model\.(\d+)/')
+    indices = [int(m.group(1)) for m in (pattern.match(node.name) for node in model.graph.node) if m]
+    if not indices:
+        return []
+    prefix = f"/model.{max(indices)}/"
+    return [node.name for node in model.graph.node
+            if node.name.startswith(prefix) and node.op_type != 'Conv']
+
+
+def quantize_onnx(fp32_path, int8_path, calib_paths, imgsz, per_channel=True, exclude_head=True):
+    """ONNX Runtime静态量化（QDQ格式，权重int8、激活uint8）"""
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    # 量化前先做形状推断和图优化，量化效果更稳定
+    prep_path = int8_path.replace('.onnx', '.prep.onnx')
+    quant_pre_process(fp32_path, prep_path)
+
+    input_name = ort.InferenceSession(prep_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    excluded = head_nodes_to_exclude(prep_path) if exclude_head else []
+    quantize_static(
+        prep_path,
+        int8_path,
+        make_calibration_reader(calib_paths, imgsz, input_name),
+        quant_format=QuantFormat.QDQ,
+        per_channel=per_channel,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+        nodes_to_exclude=excluded,
+    )
+    os.remove(prep_path)
+
+    # ultralytics加载ONNX时从元数据读取类别名等信息，量化后拷贝回去
+    import onnx
+    source = onnx.load(fp32_path)
+    target = onnx.load(int8_path)
+    del target.metadata_props[:]
+    target.metadata_props.extend(source.metadata_props)
+    onnx.save(target, int8_path)
+    return int8_path, len(excluded)
+
+
+def quantize_openvino(weights, out_dir, data_yaml, imgsz):
+    """ultralytics + NNCF 导出OpenVINO INT8模型，校准数据取自数据集配置的验证集"""
+    from ultralytics import YOLO
+
+    exported = YOLO(weights).export(format='openvino', int8=True, data=data_yaml, imgsz=imgsz)
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.replace(str(exported), out_dir)
+    return out_dir
+
+
+def validate(model_path, data_yaml, imgsz, save_dir):
+    """在验证集上评估，返回mAP指标"""
+    from ultralytics import YOLO
+
+    metrics = YOLO(model_path, task='detect').val(
+        data=data_yaml, imgsz=imgsz, batch=1, device='cpu', plots=False,
+        project=save_dir, name=os.path.basename(str(model_path)), exist_ok=True,
+    )
+    return {'map50_95': float(metrics.box.map), 'map50': float(metrics.box.map50)}
+
+
+def load_cpu_model(model_path, imgsz, threads):
+    if model_path.endswith('.onnx'):
+        return inference_backend.OnnxRuntimeBackend(model_path, imgsz, threads)
+    return inference_backend.OpenVinoBackend(model_path, imgsz, threads)
+
+
+def benchmark(model, frames, batch, warmup=3):
+    """单帧延迟（ms）和批量吞吐（帧/秒），均包含前处理和后处理"""
+    for frame in frames[:warmup]:
+        model.predict(frame, verbose=False)
+
+    latencies = []
+    for frame in frames:
+        start = time.perf_counter()
+        model.predict(frame, verbose=False)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch):
+        model.predict(frames[i:i + batch], verbose=False)
+    throughput = len(frames) / (time.perf_counter() - start)
+
+    latencies = np.asarray(latencies)
+    return {
+        'latency_ms': float(latencies.mean()),
+        'latency_p95_ms': float(np.percentile(latencies, 95)),
+        'throughput_fps': float(throughput),
+    }
+
+
+def model_size_mb(path):
+    """模型文件（或OpenVINO目录）大小"""
+    if os.path.isdir(path):
+        return sum(os.path.getsize(p) for p in glob.glob(os.path.join(path, '*'))) / 1024 / 1024
+    return os.path.getsize(path) / 1024 / 1024
+
+
+def publish(model_path, publish_dir, name):
+    """复制到发布目录，GUI扫描weights目录时会列出该模型"""
+    os.makedirs(publish_dir, exist_ok=True)
+    if os.path.isdir(model_path):
+        target = os.path.join(publish_dir, f"{name}_int8_openvino_model")
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        shutil.copytree(model_path, target)
+    else:
+        target = os.path.join(publish_dir, f"{name}_int8.onnx")
+        shutil.copy2(model_path, target)
+    return target
+
+
+def print_report(report):
+    fp32, int8 = report['fp32'], report['int8']
+    print("\n========== INT8量化报告 ==========")
+    print(f"模型: {report['weights']}")
+    print(f"量化方式: {report['method']}，校准图片: {report['calib_images']} 张")
+    print(f"{'':<10} {'mAP50-95':>10} {'mAP50':>8} {'延迟(ms)':>10} {'P95(ms)':>9} {'吞吐(FPS)':>10}")
+    for label, row in (('FP32', fp32), ('INT8', int8)):
+        print(f"{label:<10} {row['map50_95']:>10.4f} {row['map50']:>8.4f} {row['latency_ms']:>10.2f} "
+              f"{row['latency_p95_ms']:>9.2f} {row['throughput_fps']:>10.1f}")
+    print(f"mAP50-95下降: {report['map_drop']:.4f}（允许 {report['max_map_drop']:.4f}）")
+    print(f"延迟加速: {report['latency_speedup']:.2f}x，吞吐提升: {report['throughput_gain']:.2f}x"
+          f"（同一台CPU约可承载 {report['throughput_gain']:.1f} 倍的视频流）")
+    if not report['passed']:
+        print("精度下降超过阈值，未发布")
+    elif report['published']:
+        print(f"已发布: {report['published']}")
+
+
+def run(args):
+    weights = args.weights or os.path.join(args.project, args.name, 'weights', 'best.pt')
+    if not os.path.exists(weights):
+        raise FileNotFoundError(f"找不到模型: {weights}")
+    exp_name = args.name if not args.weights else os.path.basename(os.path.dirname(os.path.dirname(weights)))
+    out_dir = os.path.join(os.path.dirname(os.path.dirname(weights)), 'quantize')
+    os.makedirs(out_dir, exist_ok=True)
+
+    calib_dir = resolve_calib_dir(args.calib_images, args.data_yaml)
+    calib_paths = sample_images(calib_dir, args.calib_size, args.calib_seed)
+    print(f"校准图片: {len(calib_paths)} 张（{calib_dir}）")
+
+    # FP32基线使用同一后端的未量化模型，保证对比只反映量化本身的影响
+    start = time.perf_counter()
+    if args.method == inference_backend.BACKEND_OPENVINO:
+        fp32_path = inference_backend.export_model(weights, inference_backend.BACKEND_OPENVINO, args.imgsz)
+        int8_path = quantize_openvino(weights, fp32_path.replace('_openvino_model', '_int8_openvino_model'),
+                                      args.data_yaml, args.imgsz)
+        excluded = 0
+    else:
+        fp32_path = inference_backend.export_model(weights, inference_backend.BACKEND_ONNX, args.imgsz, args.opset)
+        int8_path, excluded = quantize_onnx(fp32_path, fp32_path.replace('.onnx', '.int8.onnx'), calib_paths,
+                                            args.imgsz, args.per_channel, args.exclude_head)
+    quantize_time = time.perf_counter() - start
+    print(f"量化完成: {int8_path}（{quantize_time:.1f}s，{excluded} 个检测头节点保持FP32）")
+
+    bench_frames = [cv2.imread(p) for p in calib_paths[:args.bench_frames]]
+    bench_frames = [f for f in bench_frames if f is not None]
+
+    report = {
+        'weights': weights,
+        'method': args.method,
+        'calib_images': len(calib_paths),
+        'excluded_nodes': excluded,
+        'quantize_seconds': quantize_time,
+        'max_map_drop': args.max_drop,
+    }
+    for label, path in (('fp32', fp32_path), ('int8', int8_path)):
+        print(f"验证 {label.upper()} 模型...")
+        row = validate(path, args.data_yaml, args.imgsz, out_dir)
+        row.update(benchmark(load_cpu_model(path, args.imgsz, args.threads), bench_frames, args.bench_batch))
+        row['path'] = path
+        row['size_mb'] = model_size_mb(path)
+        report[label] = row
+
+    report['map_drop'] = report['fp32']['map50_95'] - report['int8']['map50_95']
+    report['latency_speedup'] = report['fp32']['latency_ms'] / report['int8']['latency_ms']
+    report['throughput_gain'] = report['int8']['throughput_fps'] / report['fp32']['throughput_fps']
+
+    passed = report['map_drop'] <= args.max_drop
+    report['passed'] = passed
+    report['published'] = publish(int8_path, args.publish_dir, exp_name) if passed and not args.no_publish else None
+
+    with open(os.path.join(out_dir, 'report.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print_report(report)
+    return passed
+
+
+def parse_args():
+    cfg = QuantizationConfig
+    parser = argparse.ArgumentParser(description='YOLOv8 INT8训练后量化（带精度门限）')
+    parser.add_argument('--weights', default=None, help='模型路径，默认 <project>/<name>/weights/best.pt')
+    parser.add_argument('--project', default=cfg.project)
+    parser.add_argument('--name', default=cfg.name, help='实验名称')
+    parser.add_argument('--data-yaml', default=cfg.data_yaml)
+    parser.add_argument('--method', choices=[inference_backend.BACKEND_ONNX, inference_backend.BACKEND_OPENVINO],
+                        default=cfg.method)
+    parser.add_argument('--imgsz', type=int, default=cfg.imgsz)
+    parser.add_argument('--opset', type=int, default=cfg.opset)
+    parser.add_argument('--calib-images', default=cfg.calib_images, help='校准图片目录')
+    parser.add_argument('--calib-size', type=int, default=cfg.calib_size, help='校准图片数量')
+    parser.add_argument('--calib-seed', type=int, default=cfg.calib_seed)
+    parser.add_argument('--no-per-channel', dest='per_channel', action='store_false', default=cfg.per_channel)
+    parser.add_argument('--quantize-head', dest='exclude_head', action='store_false', default=cfg.exclude_head,
+                        help='同时量化检测头的解码部分')
+    parser.add_argument('--max-drop', type=float, default=cfg.max_map_drop, help='mAP50-95允许下降的最大值')
+    parser.add_argument('--publish-dir', default=cfg.publish_dir)
+    parser.add_argument('--no-publish', action='store_true', help='只生成报告，不发布')
+    parser.add_argument('--bench-frames', type=int, default=cfg.bench_frames)
+    parser.add_argument('--bench-batch', type=int, default=cfg.bench_batch)
+    parser.add_argument('--threads', type=int, default=cfg.threads, help='ONNX Runtime线程数')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    sys.exit(0 if run(parse_args()) else 1)
@@ -0,0 +1,346 @@
+"""
+推理结果缓存（可选）
+
+回归测试或反复查看同一段视频时，相同的帧会用相同的模型和参数一遍遍推理。
+结果缓存按 (推理后端与实际加载的模型文件哈希, 推理参数, 帧内容哈希) 保存检测框：
+    - 内存层：LRU，保存最近的 (N, 6) 检测数组
+    - 磁盘层：每个模型一个只追加的打包文件，记录为 [16字节键哈希, 框数, float32 的 (N, 6) 数组]，
+      首次访问时扫描一遍建立内存索引；写入由后台线程完成，不占用推理线程
+命中时直接由检测数组构造Results，不再推理；未命中的帧合并为一次批量推理后写入缓存。
+帧内容哈希优先使用xxhash（pip install xxhash），否则使用hashlib.blake2b。
+"""
+import atexit
+import hashlib
+import os
+import queue
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import inference_backend
+import utils
+from config import PredictionConfig
+
+_caches = {}  # 缓存目录 -> 进程级共享的 ResultCache
+_caches_lock = threading.Lock()
+
+# 打包文件中每条记录的头部：键哈希（16字节）+ 框数
+_RECORD_HEADER = struct.Struct('<16sI')
+
+
+def model_hash(model_path):
+    """模型权重内容的哈希（OpenVINO目录对其中所有文件求哈希），由 utils.file_hash 按修改时间缓存"""
+    if not os.path.exists(model_path):
+        # 尚未下载的官方权重等：只能按名称区分
+        return hashlib.sha1(model_path.encode('utf-8')).hexdigest()
+    if not os.path.isdir(model_path):
+        return utils.file_hash(model_path)
+    digest = hashlib.sha1()
+    for root, _, files in sorted(os.walk(model_path)):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, model_path).encode('utf-8'))
+            digest.update(utils.file_hash(path).encode('ascii'))
+    return digest.hexdigest()
+
+
+def frame_hash(frame):
+    """帧内容哈希（含形状），4K帧约几毫秒"""
+    frame = np.ascontiguousarray(frame)
+    try:
+        import xxhash
+        digest = xxhash.xxh3_128()
+    except ImportError:
+        digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(frame.shape).encode('ascii'))
+    digest.update(frame.data)
+    return digest.hexdigest()
+
+
+class PackedStore:
+    """单个模型的磁盘缓存文件：只追加的记录 + 内存索引
+
+    打开时扫描一遍文件建立 键哈希 -> (偏移, 框数) 索引，中断时残留的半条记录会被截掉。
+    每条记录用一次 write 追加，多个进程共用同一文件时各自只能命中打开时已有的和自己写入的记录。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._load()
+        self._append = open(path, 'ab')
+        self._read = open(path, 'rb')
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            offset = 0
+            while offset + _RECORD_HEADER.size <= len(data):
+                digest, count = _RECORD_HEADER.unpack_from(data, offset)
+                end = offset + _RECORD_HEADER.size + count * 24
+                if end > len(data):
+                    break
+                self.index[digest] = (offset + _RECORD_HEADER.size, count)
+                offset = end
+            if offset < len(data):
+                f.truncate(offset)
+
+    def get(self, digest):
+        with self._lock:
+            entry = self.index.get(digest)
+            if entry is None:
+                return None
+            offset, count = entry
+            self._read.seek(offset)
+            data = self._read.read(count * 24)
+        return np.frombuffer(data, dtype=np.float32).reshape(count, 6).copy()
+
+    def append(self, digest, detections):
+        payload = detections.tobytes()
+        with self._lock:
+            self._append.write(_RECORD_HEADER.pack(digest, len(detections)) + payload)
+            self._append.flush()
+            # 追加模式下写完后的位置即本条记录的末尾（其他进程的追加不会插进一次 write 的中间）
+            self.index[digest] = (self._append.tell() - len(payload), len(detections))
+
+    def close(self):
+        with self._lock:
+            self._append.close()
+            self._read.close()
+
+
+class ResultCache:
+    """内存LRU + 磁盘打包文件两级检测结果缓存，线程安全
+
+    磁盘写入在后台线程中进行，put 只做入队；进程退出时自动写完队列中剩余的条目。
+
+    参数:
+        cache_dir: 磁盘缓存目录，None表示只使用内存层
+        memory_items: 内存层保存的帧数
+    """
+
+    def __init__(self, cache_dir=None, memory_items=4096):
+        self.cache_dir = cache_dir
+        self.memory_items = memory_items
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._entries = OrderedDict()
+        self._stores = {}  # 模型标识 -> PackedStore
+        self._lock = threading.Lock()
+        self._pending = queue.Queue()
+        self._writer = None
+        if cache_dir:
+            self._writer = threading.Thread(target=self._write_loop, name="result-cache-writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
+
+    def _store(self, model_id):
+        with self._lock:
+            store = self._stores.get(model_id)
+            if store is None:
+                # 按模型标识的哈希命名：更换模型或后端后旧文件可整体删除
+                name = hashlib.sha1(model_id.encode('utf-8')).hexdigest()[:16]
+                store = self._stores[model_id] = PackedStore(os.path.join(self.cache_dir, name + '.bin'))
+            return store
+
+    @staticmethod
+    def _digest(key):
+        return hashlib.sha1(repr(key).encode('utf-8')).digest()[:16]
+
+    def get(self, key):
+        """返回缓存的 (N, 6) 检测数组，未命中返回None"""
+        with self._lock:
+            detections = self._entries.get(key)
+            if detections is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return detections
+
+        if self.cache_dir:
+            try:
+                detections = self._store(key[0]).get(self._digest(key))
+            except (OSError, ValueError):
+                detections = None
+            if detections is not None:
+                self._remember(key, detections)
+                with self._lock:
+                    self.disk_hits += 1
+                return detections
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, detections):
+        detections = np.ascontiguousarray(detections, dtype=np.float32).reshape(-1, 6)
+        self._remember(key, detections)
+        if self._writer is not None:
+            self._pending.put((key, detections))
+
+    def _write_loop(self):
+        while True:
+            item = self._pending.get()
+            try:
+                if item is None:
+                    break
+                key, detections = item
+                try:
+                    self._store(key[0]).append(self._digest(key), detections)
+                except OSError:
+                    continue
+                with self._lock:
+                    self.writes += 1
+            finally:
+                self._pending.task_done()
+
+    def flush(self):
+        """等待后台线程写完已入队的条目"""
+        if self._writer is not None and self._writer.is_alive():
+            self._pending.join()
+
+    def close(self):
+        """写完剩余条目并关闭磁盘文件"""
+        if self._writer is not None and self._writer.is_alive():
+            self._pending.put(None)
+            self._writer.join()
+        with self._lock:
+            stores, self._stores = list(self._stores.values()), {}
+        for store in stores:
+            store.close()
+
+    def _remember(self, key, detections):
+        with self._lock:
+            self._entries[key] = detections
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.memory_items:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'writes': self.writes,
+                'pending_writes': self._pending.qsize(),
+            }
+
+
+class CachedPredictor:
+    """带结果缓存的模型包装器，提供与 YOLO.predict 相同的接口
+
+    参数:
+        model: 已加载的模型（YOLO、inference_backend 中的后端或 TiledPredictor）
+        model_id: 模型标识（通常为 model_hash 的结果），包装了分块推理等时应附带其参数
+        cache: ResultCache
+    """
+
+    def __init__(self, model, model_id, cache):
+        self.model = model
+        self.model_id = model_id
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        self.hash_time = 0.0  # 计算帧哈希的累计耗时
+
+    @property
+    def names(self):
+        return self.model.names
+
+    def __getattr__(self, name):
+        # stats() 等其余属性转发给被包装的模型（如 TiledPredictor）
+        if name == 'model':
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def predict(self, source, conf=0.25, verbose=False, **kwargs):
+        frames = source if isinstance(source, (list, tuple)) else [source]
+        params = (conf, kwargs.get('imgsz'), kwargs.get('iou'),
+                  tuple(sorted((k, repr(v)) for k, v in kwargs.items() if k not in ('imgsz', 'iou'))))
+
+        start = time.perf_counter()
+        keys = [(self.model_id,) + params + (frame_hash(frame),) for frame in frames]
+        self.hash_time += time.perf_counter() - start
+
+        results = [None] * len(frames)
+        missing = []
+        for index, key in enumerate(keys):
+            detections = self.cache.get(key)
+            if detections is None:
+                missing.append(index)
+            else:
+                self.hits += 1
+                results[index] = utils.build_results(frames[index], self.names, detections)
+
+        self.misses += len(missing)
+        if missing:
+            predicted = self.model.predict([frames[i] for i in missing], conf=conf, verbose=verbose, **kwargs)
+            for index, result in zip(missing, predicted):
+                data = result.boxes.data if result.boxes is not None else np.empty((0, 6), dtype=np.float32)
+                data = data.cpu().numpy() if hasattr(data, 'cpu') else np.asarray(data)
+                self.cache.put(keys[index], data[:, [0, 1, 2, 3, -2, -1]] if len(data) else data)
+                results[index] = result
+        return results
+
+    def cache_stats(self):
+        """本包装器的命中统计，以及共享缓存的内存/磁盘层统计"""
+        lookups = self.hits + self.misses
+        stats = self.cache.stats()
+        stats.update({
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'hash_ms': self.hash_time / lookups * 1000 if lookups else 0.0,
+        })
+        return stats
+
+
+def get_result_cache(cache_dir=None):
+    """进程级共享的结果缓存，重新开始检测时内存层仍然有效"""
+    cache_dir = cache_dir or PredictionConfig.result_cache_dir
+    with _caches_lock:
+        if cache_dir not in _caches:
+            _caches[cache_dir] = ResultCache(cache_dir, PredictionConfig.result_cache_items)
+        return _caches[cache_dir]
+
+
+def loaded_model_id(model_path, backend=PredictionConfig.backend):
+    """实际加载的模型标识：后端 + 模型文件哈希（与 model_cache 相同的导出路径）+ 精度
+
+    同一份 .pt 用 torch、ONNX 或 OpenVINO 推理结果略有不同，INT8 等量化模型也是不同的文件，
+    磁盘缓存跨运行保留，必须按实际加载的文件区分。
+    """
+    backend = inference_backend.resolve_backend(model_path, backend)
+    artifact = model_path
+    if backend == inference_backend.BACKEND_ONNX and not str(model_path).endswith('.onnx'):
+        artifact = inference_backend.export_path(model_path, backend, PredictionConfig.imgsz, PredictionConfig.onnx_opset)
+    elif backend == inference_backend.BACKEND_OPENVINO and not os.path.isdir(model_path):
+        artifact = inference_backend.export_path(model_path, backend, PredictionConfig.imgsz)
+    precision = 'fp16' if backend == inference_backend.BACKEND_TORCH and PredictionConfig.half else 'fp32'
+    return f"{backend}-{precision}:{model_hash(artifact)}"
+
+
+def create_cached_predictor(model, model_path, cache_dir=None, tag='', backend=PredictionConfig.backend):
+    """按 PredictionConfig 中的结果缓存配置包装模型
+
+    backend 为加载模型时使用的推理后端；tag 用于区分同一模型的不同推理方式，会并入模型标识，
+    包装的是分块推理时自动附带其参数。
+    """
+    cache = get_result_cache(cache_dir)
+    if not tag and hasattr(model, 'tile_size'):
+        tag = (f"tiled-{model.tile_size}-{model.overlap}-{model.merge}-{model.merge_iou}"
+               f"-{model.roi_only}-{model.coarse_conf}-{model.roi_margin}-{model.full_frame}")
+    model_id = loaded_model_id(model_path, backend) + (f':{tag}' if tag else '')
+    return CachedPredictor(model, model_id, cache)
@@ -0,0 +1,174 @@
+"""
+后台检测结果写入器
+
+JPEG编码和磁盘写入在后台线程池中完成，调用方（GUI线程或后处理线程）只做入队，
+队列满时直接丢弃并计数，不会阻塞界面或反压检测线程。
+"""
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import cv2
+
+# 保存模式
+SAVE_DETECTIONS = 'detections'  # 只保存有检测目标的帧
+SAVE_ALL = 'all'                # 保存所有帧
+SAVE_VIDEO = 'video'            # 写入分段视频文件而不是逐帧JPEG
+
+_STOP = object()
+
+
+class ResultWriter:
+    """后台检测结果写入器
+
+    参数:
+        save_dir: 保存目录
+        mode: 保存模式，SAVE_DETECTIONS / SAVE_ALL / SAVE_VIDEO
+        every_n: 每隔N帧保存一帧（在模式过滤之后计数）
+        workers: 写入线程数，视频模式固定为1以保证帧顺序
+        queue_size: 待写入队列容量，满时丢弃新帧
+        jpeg_quality: JPEG质量
+        video_fps: 视频模式下写入的帧率
+        segment_seconds: 视频模式下每个分段的时长（秒）
+    """
+
+    def __init__(self, save_dir='results', mode=SAVE_ALL, every_n=1, workers=2,
+                 queue_size=32, jpeg_quality=90, video_fps=25, segment_seconds=60):
+        self.save_dir = save_dir
+        self.mode = mode
+        self.every_n = max(1, int(every_n))
+        self.jpeg_quality = jpeg_quality
+        self.video_fps = video_fps
+        self.segment_frames = max(1, int(video_fps * segment_seconds))
+
+        self.submitted = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.written = 0
+        self.errors = 0
+        self.last_error = None
+        self._sequence = 0
+        self._counter_lock = threading.Lock()
+
+        # 目录只在创建时检查一次
+        os.makedirs(save_dir, exist_ok=True)
+
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._video_writer = None
+        self._video_frames = 0
+        self._video_size = None
+
+        if mode == SAVE_VIDEO:
+            workers = 1
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"result-writer-{i}", daemon=True)
+            for i in range(max(1, int(workers)))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, image, has_detections=True):
+        """提交一帧待保存的图像，被过滤或丢弃时返回False
+
+        图像入队后由后台线程读取，调用方之后不应再修改该数组。
+        """
+        if not self.accept(has_detections):
+            return False
+        return self.put(image)
+
+    def accept(self, has_detections=True):
+        """按保存方式和间隔判断当前帧是否需要保存
+
+        调用方可以先调用本方法，确定需要保存后再绘制图像并调用 put，避免绘制会被跳过的帧。
+        """
+        if self.mode == SAVE_DETECTIONS and not has_detections:
+            self.skipped += 1
+            return False
+
+        self.submitted += 1
+        if (self.submitted - 1) % self.every_n != 0:
+            self.skipped += 1
+            return False
+        return True
+
+    def put(self, image):
+        """直接将图像放入写入队列，队列满时丢弃并返回False"""
+        try:
+            self._queue.put_nowait(image)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _next_path(self, ext):
+        """生成不会冲突的文件名：时间戳 + 递增序号"""
+        with self._counter_lock:
+            self._sequence += 1
+            sequence = self._sequence
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]
+        return os.path.join(self.save_dir, f"detection_{timestamp}_{sequence:06d}{ext}")
+
+    def _worker(self):
+        while True:
+            image = self._queue.get()
+            if image is _STOP:
+                break
+            try:
+                if self.mode == SAVE_VIDEO:
+                    self._write_video_frame(image)
+                else:
+                    # imencode + tofile：Windows上的中文路径也能写入，路径错误、磁盘已满时抛出OSError
+                    ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                    if not ok:
+                        raise ValueError("JPEG编码失败")
+                    encoded.tofile(self._next_path('.jpg'))
+                with self._counter_lock:
+                    self.written += 1
+            except Exception as e:
+                with self._counter_lock:
+                    self.errors += 1
+                    self.last_error = str(e)
+
+        if self._video_writer is not None:
+            self._video_writer.release()
+            self._video_writer = None
+
+    def _write_video_frame(self, image):
+        """追加一帧到当前视频分段，达到分段长度或分辨率变化时切换新文件"""
+        h, w = image.shape[:2]
+        if (self._video_writer is None or self._video_frames >= self.segment_frames
+                or self._video_size != (w, h)):
+            if self._video_writer is not None:
+                self._video_writer.release()
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+            path = self._next_path('.mp4')
+            self._video_writer = cv2.VideoWriter(path, fourcc, self.video_fps, (w, h))
+            if not self._video_writer.isOpened():
+                self._video_writer = None
+                raise OSError(f"无法创建视频文件: {path}")
+            self._video_frames = 0
+            self._video_size = (w, h)
+
+        self._video_writer.write(image)
+        self._video_frames += 1
+
+    def stats(self):
+        """写入统计：队列深度、已写入、丢弃、跳过与错误次数"""
+        return {
+            'queue_depth': self._queue.qsize(),
+            'queue_size': self._queue.maxsize,
+            'written': self.written,
+            'dropped': self.dropped,
+            'skipped': self.skipped,
+            'errors': self.errors,
+        }
+
+    def close(self, timeout=10.0):
+        """写完队列中剩余的图像后停止后台线程"""
+        deadline = time.perf_counter() + timeout
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.perf_counter()))
@@ -0,0 +1,447 @@
+"""
+超参数/吞吐搜索
+
+按搜索配置展开 TrainingConfig 字段的网格或随机搜索，把每个试验作为独立的 train.py 子进程
+调度到可用的GPU（每块GPU同时运行一个试验）或CPU进程池上；运行中的试验按 results.csv 中的
+逐epoch指标做中位数提前停止：到达同一epoch时，最好成绩低于其他试验同期最好成绩的中位数即终止。
+全部试验结束后依次在同一设备上测量各最佳模型的推理延迟，输出 mAP50-95 与延迟的帕累托表。
+
+搜索配置（YAML，示例见 configs/sweep_model_size.yaml）:
+    base: configs/improved_exp.yaml   # 所有试验共用的训练配置
+    method: grid                      # grid 或 random
+    trials: 12                        # 随机搜索的试验数
+    fixed: {epochs: 50}               # 所有试验共同覆盖的字段
+    space:                            # 搜索的字段，列表为候选值，{low, high, log, int} 为随机搜索的取值范围
+        model_type: [yolov8n.pt, yolov8s.pt, yolov8m.pt]
+        batch_size: [16, 32]
+        imgsz: [480, 640]
+
+输出（<out>/）:
+    <trial>/             各试验的训练目录（results.csv、train_config.yaml、weights/best.pt ...）
+    logs/<trial>.log     各试验的训练输出
+    sweep_state.json     试验状态，重新运行同一搜索时跳过已完成或已停止的试验
+    sweep_results.csv    每个试验的参数、mAP、延迟、状态和是否在帕累托前沿上
+
+用法:
+    python sweep.py configs/sweep_model_size.yaml --devices 0,1
+    python sweep.py configs/sweep_model_size.yaml --devices cpu --cpu-workers 2
+    python sweep.py configs/sweep_model_size.yaml --report-only
+"""
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+import yaml
+
+import inference_backend
+from config import SweepConfig
+from dataset_store import list_images, resolve_split_dir
+from train import default_config, load_config, normalize_device
+
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_PRUNED = 'pruned'
+STATUS_FAILED = 'failed'
+FINISHED = (STATUS_DONE, STATUS_PRUNED, STATUS_FAILED)
+
+
+def load_sweep(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        spec = yaml.safe_load(f) or {}
+    if not spec.get('space'):
+        raise ValueError(f"{path} 中没有 space（搜索的字段）")
+    fields = set(default_config())
+    unknown = sorted((set(spec['space']) | set(spec.get('fixed') or {})) - fields)
+    if unknown:
+        raise KeyError(f"{path} 中有 TrainingConfig 不存在的字段: {', '.join(unknown)}")
+    return spec
+
+
+def sample_value(space, rng):
+    """随机搜索的取值：列表随机选择，{low, high} 均匀采样（log: true 时按对数均匀，int: true 时取整）"""
+    if isinstance(space, list):
+        return space[rng.randrange(len(space))]
+    low, high = space['low'], space['high']
+    if space.get('log'):
+        value = math.exp(rng.uniform(math.log(low), math.log(high)))
+    else:
+        value = rng.uniform(low, high)
+    return int(round(value)) if space.get('int') else float(f"{value:.6g}")
+
+
+def expand_trials(spec, seed=0):
+    """展开为参数字典列表：grid 为全部组合，random 为 trials 个随机组合（去重）"""
+    space = spec['space']
+    keys = list(space)
+    if spec.get('method', 'grid') == 'grid':
+        for key in keys:
+            if not isinstance(space[key], list):
+                raise ValueError(f"网格搜索的 {key} 必须是候选值列表")
+        return [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+
+    rng = random.Random(spec.get('seed', seed))
+    trials, seen = [], set()
+    target = spec.get('trials', 10)
+    for _ in range(target * 20):
+        params = {key: sample_value(space[key], rng) for key in keys}
+        signature = json.dumps(params, sort_keys=True)
+        if signature not in seen:
+            seen.add(signature)
+            trials.append(params)
+        if len(trials) == target:
+            break
+    return trials
+
+
+def read_metric(run_dir, metric):
+    """results.csv 中某一指标的逐epoch值，文件不存在或还没有完成的epoch时返回空列表"""
+    path = os.path.join(run_dir, 'results.csv')
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        rows = list(csv.reader(f))
+    if len(rows) < 2:
+        return []
+    header = [h.strip() for h in rows[0]]
+    if metric not in header:
+        raise KeyError(f"{path} 中没有指标列 {metric}")
+    column = header.index(metric)
+    values = []
+    for row in rows[1:]:
+        try:
+            values.append(float(row[column]))
+        except (IndexError, ValueError):
+            break  # 正在写入的最后一行
+    return values
+
+
+def should_prune(curve, others, min_epochs, min_trials):
+    """中位数提前停止：当前最好成绩低于其他试验在同一epoch时最好成绩的中位数"""
+    epoch = len(curve)
+    if epoch < min_epochs:
+        return False
+    peers = [max(other[:epoch]) for other in others if len(other) >= epoch]
+    if len(peers) < min_trials:
+        return False
+    return max(curve) < float(np.median(peers))
+
+
+class Trial:
+    def __init__(self, name, params, state=None):
+        self.name = name
+        self.params = params
+        state = state or {}
+        self.status = state.get('status', STATUS_PENDING)
+        self.best_metric = state.get('best_metric')
+        self.epochs = state.get('epochs', 0)
+        self.latency_ms = state.get('latency_ms')
+        self.error = state.get('error')
+        self.curve = []
+        self.process = None
+        self.slot = None
+        self.log = None
+
+    def to_dict(self):
+        return {
+            'params': self.params,
+            'status': self.status,
+            'best_metric': self.best_metric,
+            'epochs': self.epochs,
+            'latency_ms': self.latency_ms,
+            'error': self.error,
+        }
+
+
+class SweepRunner:
+    """把试验调度到设备槽位上，轮询训练进度并提前停止落后的试验
+
+    参数:
+        spec: 搜索配置（load_sweep 的结果）
+        out_dir: 输出目录
+        devices: 设备字符串，如 '0,1' 或 'cpu'
+        cpu_workers: devices 为 cpu 时同时运行的试验数
+        metric: 提前停止和帕累托表使用的指标列
+        min_epochs: 训练满多少epoch后才参与提前停止判断
+        min_trials: 至少有多少个其他试验到达同一epoch才做判断
+        poll_seconds: 轮询间隔
+    """
+
+    def __init__(self, spec, out_dir, devices='0', cpu_workers=1, metric=SweepConfig.metric,
+                 min_epochs=SweepConfig.min_epochs, min_trials=SweepConfig.min_trials,
+                 poll_seconds=SweepConfig.poll_seconds):
+        self.spec = spec
+        self.out_dir = os.path.abspath(out_dir)
+        self.metric = metric
+        self.min_epochs = min_epochs
+        self.min_trials = min_trials
+        self.poll_seconds = poll_seconds
+        self.state_path = os.path.join(self.out_dir, 'sweep_state.json')
+
+        # 槽位: (名称, 设备)，每个槽位同时运行一个试验
+        devices = normalize_device(devices)
+        if devices in ('', 'cpu'):
+            # CPU试验平分可用核心，避免互相抢占
+            self.slots = [(f"cpu:{i}", 'cpu') for i in range(max(1, cpu_workers))]
+            self.cpu_threads = max(1, inference_backend.default_cpu_threads() // len(self.slots))
+        else:
+            self.slots = [(device, device) for device in devices.split(',')]
+            self.cpu_threads = None
+
+        state = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f).get('trials', {})
+        self.trials = []
+        for index, params in enumerate(expand_trials(spec)):
+            name = f"trial_{index:03d}"
+            saved = state.get(name)
+            # 搜索配置改变后旧状态作废
+            self.trials.append(Trial(name, params, saved if saved and saved['params'] == params else None))
+        for trial in self.trials:
+            if trial.status == STATUS_RUNNING:
+                trial.status = STATUS_PENDING  # 上次运行被中断
+
+    def trial_config(self, trial, device):
+        """试验的完整训练配置：base ← fixed ← 搜索参数 ← 输出位置和设备"""
+        overrides = dict(self.spec.get('fixed') or {})
+        overrides.update(trial.params)
+        overrides.update({'project': self.out_dir, 'name': trial.name, 'exist_ok': True, 'device': device})
+        overrides.setdefault('run_test', False)
+        cfg = load_config(self.spec.get('base'), [f"{key}={json.dumps(value)}" for key, value in overrides.items()])
+        if self.cpu_threads:
+            cfg['workers'] = min(cfg['workers'], self.cpu_threads)
+        return cfg
+
+    def launch(self, trial, slot, device):
+        cfg = self.trial_config(trial, device)
+        os.makedirs(os.path.join(self.out_dir, 'configs'), exist_ok=True)
+        os.makedirs(os.path.join(self.out_dir, 'logs'), exist_ok=True)
+        config_path = os.path.join(self.out_dir, 'configs', f"{trial.name}.yaml")
+        with open(config_path, 'w', encoding='utf-8') as f:
+            yaml.safe_dump(cfg, f, allow_unicode=True, sort_keys=False)
+
+        env = dict(os.environ)
+        if self.cpu_threads:
+            env['OMP_NUM_THREADS'] = str(self.cpu_threads)
+        trial.log = open(os.path.join(self.out_dir, 'logs', f"{trial.name}.log"), 'ab')
+        # 独立进程组：提前停止时连同数据加载子进程一起终止
+        kwargs = {'start_new_session': True} if os.name == 'posix' else {
+            'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+        trial.process = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'train.py'),
+             '--config', config_path],
+            stdout=trial.log, stderr=subprocess.STDOUT, env=env, **kwargs)
+        trial.slot = slot
+        trial.status = STATUS_RUNNING
+        trial.curve = []
+        print(f"[{trial.name}] 开始 设备={device} {trial.params}")
+
+    def terminate(self, trial):
+        if trial.process.poll() is not None:
+            return
+        if os.name == 'posix':
+            os.killpg(trial.process.pid, signal.SIGTERM)
+        else:
+            trial.process.terminate()
+        try:
+            trial.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            trial.process.kill()
+            trial.process.wait()
+
+    def finish(self, trial, status, error=None):
+        trial.status = status
+        trial.error = error
+        trial.log.close()
+        trial.process = None
+        self.record_progress(trial)
+        best = f"{trial.best_metric:.4f}" if trial.best_metric is not None else '-'
+        print(f"[{trial.name}] {status} epochs={trial.epochs} {self.metric}={best}" + (f" ({error})" if error else ''))
+        self.save_state()
+
+    def record_progress(self, trial):
+        trial.curve = read_metric(os.path.join(self.out_dir, trial.name), self.metric)
+        trial.epochs = len(trial.curve)
+        trial.best_metric = max(trial.curve) if trial.curve else None
+
+    def curves(self, exclude):
+        """其他试验（运行中和已结束）的逐epoch指标"""
+        curves = []
+        for trial in self.trials:
+            if trial is exclude or trial.status == STATUS_PENDING:
+                continue
+            if not trial.curve and trial.status in FINISHED:
+                self.record_progress(trial)
+            if trial.curve:
+                curves.append(trial.curve)
+        return curves
+
+    def poll(self):
+        for trial in [t for t in self.trials if t.status == STATUS_RUNNING]:
+            code = trial.process.poll()
+            self.record_progress(trial)
+            if code is not None:
+                ok = code == 0 and os.path.exists(os.path.join(self.out_dir, trial.name, 'weights', 'best.pt'))
+                self.finish(trial, STATUS_DONE if ok else STATUS_FAILED,
+                            None if ok else f"退出码 {code}，见 logs/{trial.name}.log")
+            elif should_prune(trial.curve, self.curves(trial), self.min_epochs, self.min_trials):
+                self.terminate(trial)
+                self.finish(trial, STATUS_PRUNED)
+
+    def run(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        pending = [t for t in self.trials if t.status == STATUS_PENDING]
+        print(f"共 {len(self.trials)} 个试验，待运行 {len(pending)} 个，设备槽位: {', '.join(s for s, _ in self.slots)}")
+        try:
+            while pending or any(t.status == STATUS_RUNNING for t in self.trials):
+                busy = {t.slot for t in self.trials if t.status == STATUS_RUNNING}
+                for slot, device in self.slots:
+                    if pending and slot not in busy:
+                        self.launch(pending.pop(0), slot, device)
+                time.sleep(self.poll_seconds)
+                self.poll()
+        except KeyboardInterrupt:
+            print("中断：终止运行中的试验，再次运行同一搜索会从未完成的试验继续")
+            for trial in self.trials:
+                if trial.status == STATUS_RUNNING:
+                    self.terminate(trial)
+                    trial.log.close()
+                    trial.status = STATUS_PENDING
+            self.save_state()
+            raise
+        self.save_state()
+
+    def save_state(self):
+        state = {'spec': self.spec, 'metric': self.metric, 'trials': {t.name: t.to_dict() for t in self.trials}}
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.state_path)
+
+    def measure_latencies(self, frames, device=SweepConfig.latency_device, backend=SweepConfig.latency_backend,
+                          warmup=SweepConfig.latency_warmup, force=False):
+        """训练全部结束后在同一设备上依次测量，避免与训练争抢资源影响结果"""
+        for trial in self.trials:
+            weights = os.path.join(self.out_dir, trial.name, 'weights', 'best.pt')
+            if trial.status != STATUS_DONE or not os.path.exists(weights):
+                continue
+            if trial.latency_ms is not None and not force:
+                continue
+            imgsz = self.trial_config(trial, 'cpu')['imgsz']
+            trial.latency_ms = measure_latency(weights, frames, imgsz, device, backend, warmup)
+            print(f"[{trial.name}] 延迟 {trial.latency_ms:.2f} ms（{backend}/{device}，imgsz={imgsz}）")
+            self.save_state()
+
+
+def measure_latency(weights, frames, imgsz, device, backend, warmup):
+    """逐帧推理的中位延迟（ms），包含前处理和后处理"""
+    model = inference_backend.load_backend(weights, backend, imgsz)
+    kwargs = {'imgsz': imgsz, 'device': device} if backend == inference_backend.BACKEND_TORCH else {}
+    for frame in frames[:warmup]:
+        model.predict(frame, verbose=False, **kwargs)
+    latencies = []
+    for frame in frames:
+        start = time.perf_counter()
+        model.predict(frame, verbose=False, **kwargs)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return float(np.median(latencies))
+
+
+def pareto_front(rows):
+    """帕累托前沿：没有其他试验同时延迟更低（或相等）且mAP更高（或相等）"""
+    front = set()
+    for row in rows:
+        dominated = any(
+            other['latency_ms'] <= row['latency_ms'] and other['metric'] >= row['metric']
+            and (other['latency_ms'] < row['latency_ms'] or other['metric'] > row['metric'])
+            for other in rows)
+        if not dominated:
+            front.add(row['trial'])
+    return front
+
+
+def report(runner, path):
+    """按延迟排序输出帕累托表，并写入 sweep_results.csv"""
+    keys = list(runner.spec['space'])
+    rows = [{'trial': t.name, **t.params, 'status': t.status, 'epochs': t.epochs,
+             'metric': t.best_metric, 'latency_ms': t.latency_ms}
+            for t in runner.trials]
+    measured = [r for r in rows if r['metric'] is not None and r['latency_ms'] is not None]
+    front = pareto_front(measured)
+    for row in rows:
+        row['pareto'] = row['trial'] in front
+    rows.sort(key=lambda r: (r['latency_ms'] is None, r['latency_ms'] or 0, -(r['metric'] or 0)))
+
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['trial'] + keys + ['status', 'epochs', 'metric', 'latency_ms',
+                                                                  'pareto'])
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"\n========== 搜索结果（{runner.metric} vs 延迟）==========")
+    header = f"{'':2}{'试验':<11}" + ''.join(f"{k:>14}" for k in keys)
+    print(header + f"{'状态':>8}{'epochs':>8}{'mAP50-95':>10}{'延迟(ms)':>10}{'mAP/ms':>9}")
+    for row in rows:
+        metric = f"{row['metric']:.4f}" if row['metric'] is not None else '-'
+        latency = f"{row['latency_ms']:.2f}" if row['latency_ms'] is not None else '-'
+        ratio = f"{row['metric'] / row['latency_ms']:.4f}" if row['metric'] and row['latency_ms'] else '-'
+        print(f"{'*' if row['pareto'] else '':2}{row['trial']:<11}" + ''.join(f"{str(row[k]):>14}" for k in keys)
+              + f"{row['status']:>8}{row['epochs']:>8}{metric:>10}{latency:>10}{ratio:>9}")
+    print(f"* 帕累托前沿（{len(front)} 个）；结果已写入 {path}")
+
+
+def load_latency_frames(data_yaml, limit):
+    image_dir = resolve_split_dir(data_yaml, 'val')
+    frames = [cv2.imread(p) for p in list_images(image_dir)[:limit]]
+    return [f for f in frames if f is not None]
+
+
+def parse_args():
+    cfg = SweepConfig
+    parser = argparse.ArgumentParser(description='超参数/吞吐搜索（并行试验 + 中位数提前停止 + 帕累托表）')
+    parser.add_argument('sweep', help='搜索配置YAML')
+    parser.add_argument('--out', default=None, help='输出目录，默认 <project>/sweep_<搜索配置名>')
+    parser.add_argument('--devices', default=cfg.devices, help='试验使用的设备，如 0,1（每块GPU一个试验）或 cpu')
+    parser.add_argument('--cpu-workers', type=int, default=cfg.cpu_workers, help='CPU上同时运行的试验数')
+    parser.add_argument('--metric', default=cfg.metric, help='results.csv 中的指标列')
+    parser.add_argument('--min-epochs', type=int, default=cfg.min_epochs, help='提前停止前至少训练的epoch数')
+    parser.add_argument('--min-trials', type=int, default=cfg.min_trials, help='提前停止判断所需的其他试验数')
+    parser.add_argument('--no-prune', action='store_true', help='不提前停止')
+    parser.add_argument('--poll', type=float, default=cfg.poll_seconds, help='轮询间隔（秒）')
+    parser.add_argument('--latency-device', default=cfg.latency_device, help='测量延迟的设备')
+    parser.add_argument('--latency-backend', choices=list(inference_backend.BACKENDS), default=cfg.latency_backend)
+    parser.add_argument('--latency-frames', type=int, default=cfg.latency_frames, help='测量延迟使用的验证集图片数')
+    parser.add_argument('--remeasure', action='store_true', help='重新测量已有的延迟')
+    parser.add_argument('--report-only', action='store_true', help='不训练，只测量缺失的延迟并输出结果')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    spec = load_sweep(args.sweep)
+    base = load_config(spec.get('base'))
+    out_dir = args.out or os.path.join(base['project'], 'sweep_' + os.path.splitext(os.path.basename(args.sweep))[0])
+
+    runner = SweepRunner(spec, out_dir, args.devices, args.cpu_workers, args.metric,
+                         math.inf if args.no_prune else args.min_epochs, args.min_trials, args.poll)
+    if not args.report_only:
+        runner.run()
+    frames = load_latency_frames(base['data_yaml'], args.latency_frames)
+    runner.measure_latencies(frames, args.latency_device, args.latency_backend, force=args.remeasure)
+    report(runner, os.path.join(runner.out_dir, 'sweep_results.csv'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
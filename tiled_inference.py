@@ -0,0 +1,172 @@
+"""
+分块（切片）推理
+
+4K广角摄像头的画面缩小到 imgsz=640 后，远处细小的烟雾只剩几个像素，很容易漏检。
+分块推理把画面切成相互重叠的 640 分块，所有分块在一次 predict 中批量推理，
+再把各分块的检测框平移回原图坐标，用向量化的NMS或WBF合并重复框。
+
+ROI模式下先对整帧做一次低阈值的粗检，只对粗检框附近的分块做精检，
+计算量随画面中的活动区域增长，而不是随分辨率增长。
+"""
+import numpy as np
+
+import utils
+from config import PredictionConfig
+
+MERGE_NMS = 'nms'
+MERGE_WBF = 'wbf'
+
+
+def tile_grid(width, height, tile_size=640, overlap=0.2):
+    """生成覆盖整幅画面的重叠分块，返回 (K, 4) 的 xyxy 数组
+
+    最后一行/列的分块与画面边缘对齐，不做填充。
+    """
+    def starts(length):
+        if length <= tile_size:
+            return np.array([0])
+        step = max(1, int(tile_size * (1 - overlap)))
+        positions = np.arange(0, length - tile_size, step)
+        return np.append(positions, length - tile_size)
+
+    xs, ys = starts(width), starts(height)
+    x1, y1 = np.meshgrid(xs, ys)
+    x1, y1 = x1.ravel(), y1.ravel()
+    return np.stack([x1, y1, np.minimum(x1 + tile_size, width), np.minimum(y1 + tile_size, height)], axis=1)
+
+
+def select_tiles(grid, rois, margin=0.5):
+    """选出与ROI（按自身尺寸的margin倍向外扩展）相交的分块"""
+    if len(rois) == 0:
+        return grid[:0]
+    wh = rois[:, 2:4] - rois[:, :2]
+    expanded = np.concatenate([rois[:, :2] - wh * margin, rois[:, 2:4] + wh * margin], axis=1)
+    overlap = ((grid[:, None, 0] < expanded[None, :, 2]) & (grid[:, None, 2] > expanded[None, :, 0]) &
+               (grid[:, None, 1] < expanded[None, :, 3]) & (grid[:, None, 3] > expanded[None, :, 1]))
+    return grid[overlap.any(axis=1)]
+
+
+def merge_detections(detections, method=MERGE_NMS, iou_threshold=0.5, max_det=300):
+    """合并来自多个分块（及整帧）的 (N, 6) 检测数组"""
+    if len(detections) == 0:
+        return detections
+    boxes, scores, classes = detections[:, :4], detections[:, 4], detections[:, 5]
+    if method == MERGE_WBF:
+        fused = utils.weighted_boxes_fusion(boxes, scores, classes, iou_threshold)
+        return fused[np.argsort(-fused[:, 4])[:max_det]]
+    keep = utils.nms_boxes(boxes, scores, iou_threshold, classes=classes, max_det=max_det)
+    return detections[keep]
+
+
+def _to_numpy(result):
+    data = result.boxes.data
+    return (data.cpu().numpy() if hasattr(data, 'cpu') else np.asarray(data))[:, [0, 1, 2, 3, -2, -1]]
+
+
+class TiledPredictor:
+    """分块推理包装器，提供与 YOLO.predict 相同的接口，可直接交给检测流水线或多路引擎
+
+    参数:
+        model: 已加载的模型（YOLO 或 inference_backend 中的后端）
+        tile_size: 分块边长，同时作为分块推理的输入尺寸
+        overlap: 相邻分块的重叠比例
+        merge: 合并方式，'nms' 或 'wbf'
+        merge_iou: 合并时的IoU阈值
+        roi_only: 只对整帧粗检框附近的分块做精检
+        coarse_conf: 整帧粗检的置信度阈值（ROI模式下应低于检测阈值，尽量不漏掉候选区域）
+        roi_margin: ROI向外扩展的比例（相对框的宽高）
+        full_frame: 非ROI模式下是否同时做整帧推理，大目标跨越多个分块时由整帧结果补全
+    """
+
+    def __init__(self, model, tile_size=640, overlap=0.2, merge=MERGE_NMS, merge_iou=0.5,
+                 roi_only=False, coarse_conf=0.1, roi_margin=0.5, full_frame=True):
+        self.model = model
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.merge = merge
+        self.merge_iou = merge_iou
+        self.roi_only = roi_only
+        self.coarse_conf = coarse_conf
+        self.roi_margin = roi_margin
+        self.full_frame = full_frame
+
+        self.frames = 0
+        self.tiles = 0  # 累计精检的分块数
+        self.full_tiles = 0  # 全部切分时应有的分块数，用于计算ROI模式节省的比例
+
+    @property
+    def names(self):
+        return self.model.names
+
+    def predict(self, source, conf=0.25, iou=0.45, imgsz=None, max_det=300, verbose=False, **kwargs):
+        """对单帧或帧列表做分块推理，返回Results列表
+
+        所有帧的整帧粗检合并为一次predict，所有分块再合并为一次predict。
+        imgsz 只作用于整帧推理，分块推理固定使用 tile_size。
+        """
+        frames = source if isinstance(source, (list, tuple)) else [source]
+        grids = [tile_grid(f.shape[1], f.shape[0], self.tile_size, self.overlap) for f in frames]
+
+        # 整帧推理：ROI模式下用于定位候选区域，否则用于补全跨分块的大目标
+        coarse = [None] * len(frames)
+        need_full = self.roi_only or self.full_frame
+        if need_full:
+            coarse_conf = min(self.coarse_conf, conf) if self.roi_only else conf
+            full_results = self.model.predict(frames, conf=coarse_conf, iou=iou, imgsz=imgsz or self.tile_size,
+                                              max_det=max_det, verbose=False, **kwargs)
+            coarse = [_to_numpy(result) for result in full_results]
+
+        crops, owners = [], []
+        for index, (frame, grid) in enumerate(zip(frames, grids)):
+            self.full_tiles += len(grid)
+            if len(grid) == 1 and need_full:
+                # 画面不大于一个分块，整帧结果已足够
+                continue
+            if self.roi_only:
+                grid = select_tiles(grid, coarse[index][:, :4], self.roi_margin)
+            for x1, y1, x2, y2 in grid:
+                crops.append(frame[y1:y2, x1:x2])
+                owners.append((index, x1, y1))
+
+        per_frame = [[] for _ in frames]
+        if crops:
+            tile_results = self.model.predict(crops, conf=conf, iou=iou, imgsz=self.tile_size,
+                                              max_det=max_det, verbose=False, **kwargs)
+            for (index, x1, y1), result in zip(owners, tile_results):
+                detections = _to_numpy(result)
+                detections[:, [0, 2]] += x1
+                detections[:, [1, 3]] += y1
+                per_frame[index].append(detections)
+        self.frames += len(frames)
+        self.tiles += len(crops)
+
+        results = []
+        for index, frame in enumerate(frames):
+            parts = per_frame[index]
+            if coarse[index] is not None:
+                parts.append(coarse[index][coarse[index][:, 4] >= conf])
+            detections = np.concatenate(parts) if parts else np.empty((0, 6), dtype=np.float32)
+            detections = merge_detections(detections, self.merge, self.merge_iou, max_det)
+            results.append(utils.build_results(frame, self.names, detections))
+        return results
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'tiles_per_frame': self.tiles / self.frames if self.frames else 0.0,
+            'tile_ratio': self.tiles / self.full_tiles if self.full_tiles else 0.0,
+        }
+
+
+def create_tiled_predictor(model):
+    """按 PredictionConfig 中的分块推理配置包装模型"""
+    return TiledPredictor(
+        model,
+        tile_size=PredictionConfig.tile_size,
+        overlap=PredictionConfig.tile_overlap,
+        merge=PredictionConfig.tile_merge,
+        merge_iou=PredictionConfig.tile_merge_iou,
+        roi_only=PredictionConfig.tile_roi_only,
+        coarse_conf=PredictionConfig.tile_coarse_conf,
+        roi_margin=PredictionConfig.tile_roi_margin,
+    )
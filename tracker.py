@@ -0,0 +1,370 @@
+"""
+目标跟踪与告警去抖
+
+逐帧统计检测框时，一闪而过的误检和持续燃烧的火焰看起来没有区别。
+本模块在 predict 之后做轻量的多目标跟踪（ByteTrack式的两阶段IoU关联，NumPy向量化），
+为检测框分配持续的ID，并由跟踪结果驱动告警状态机：
+    - N-of-M：目标在最近M帧中至少出现N帧才算有效
+    - 火焰面积增长：火焰类目标的面积相对首次出现时至少增长一定比例（过滤灯光等静止的类火物体）
+    - 冷却：告警结束后的冷却期内再次满足条件视为同一事件，不重复告警
+下游可以直接消费跟踪/告警事件，而不是逐帧的原始检测框。
+"""
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import utils
+from config import PredictionConfig
+
+# 事件类型
+EVENT_TRACK_CONFIRMED = 'track_confirmed'
+EVENT_TRACK_LOST = 'track_lost'
+EVENT_ALARM_START = 'alarm_start'
+EVENT_ALARM_END = 'alarm_end'
+
+# 告警状态
+ALARM_IDLE = 'idle'
+ALARM_ACTIVE = 'alarm'
+ALARM_COOLDOWN = 'cooldown'
+
+
+def greedy_match(iou, threshold):
+    """按IoU从大到小贪心匹配，返回 [(行, 列), ...]"""
+    if iou.size == 0:
+        return []
+    rows, cols = np.nonzero(iou >= threshold)
+    order = np.argsort(-iou[rows, cols])
+    used_rows, used_cols, matches = set(), set(), []
+    for r, c in zip(rows[order].tolist(), cols[order].tolist()):
+        if r in used_rows or c in used_cols:
+            continue
+        used_rows.add(r)
+        used_cols.add(c)
+        matches.append((r, c))
+    return matches
+
+
+class Track:
+    """单个跟踪目标"""
+    __slots__ = ('track_id', 'cls_id', 'box', 'score', 'hits', 'misses', 'confirmed',
+                 'first_area', 'areas', 'history', 'start_time')
+
+    def __init__(self, track_id, box, score, cls_id, window):
+        self.track_id = track_id
+        self.cls_id = cls_id
+        self.box = box
+        self.score = score
+        self.hits = 1
+        self.misses = 0
+        self.confirmed = False
+        self.first_area = self.area
+        self.areas = deque([self.area], maxlen=window)
+        self.history = deque([True], maxlen=window)  # 最近各帧是否匹配到检测框
+        self.start_time = time.time()
+
+    @property
+    def area(self):
+        return float((self.box[2] - self.box[0]) * (self.box[3] - self.box[1]))
+
+    def update(self, box, score):
+        self.box = box
+        self.score = score
+        self.hits += 1
+        self.misses = 0
+        self.areas.append(self.area)
+        self.history.append(True)
+
+    def mark_missed(self):
+        self.misses += 1
+        self.history.append(False)
+
+    def growth(self):
+        """面积相对首次出现时的最大增长比例"""
+        return max(self.areas) / self.first_area - 1 if self.first_area > 0 else 0.0
+
+    def to_dict(self, names):
+        return {
+            'track_id': self.track_id,
+            'class_id': int(self.cls_id),
+            'class': names.get(int(self.cls_id), f"类别{int(self.cls_id)}"),
+            'conf': round(float(self.score), 4),
+            'xyxy': [round(float(v), 1) for v in self.box],
+            'hits': self.hits,
+            'growth': round(self.growth(), 3),
+        }
+
+
+class IoUTracker:
+    """ByteTrack式IoU跟踪器
+
+    先用高置信度检测框与已有轨迹按IoU关联，剩余轨迹再与低置信度检测框关联
+    （目标被遮挡、烟雾变淡时置信度下降，仍能延续同一ID），未匹配的高置信度框创建新轨迹。
+
+    参数:
+        high_thresh: 高置信度阈值，只有高置信度框能创建新轨迹
+        low_thresh: 低置信度阈值，低于该值的框直接忽略
+        match_iou: 关联所需的最小IoU
+        max_age: 轨迹连续未匹配超过该帧数后删除
+        min_hits: 轨迹匹配次数达到该值后确认
+        window: 轨迹历史（是否出现、面积）保留的帧数
+    """
+
+    def __init__(self, high_thresh=0.5, low_thresh=0.1, match_iou=0.3, max_age=30, min_hits=3, window=10):
+        self.high_thresh = high_thresh
+        self.low_thresh = low_thresh
+        self.match_iou = match_iou
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.window = window
+        self.tracks = []
+        self._next_id = 1
+
+    def _iou(self, tracks, boxes, classes):
+        """轨迹与检测框的IoU矩阵，类别不同的配对置零"""
+        if not tracks or len(boxes) == 0:
+            return np.zeros((len(tracks), len(boxes)), dtype=np.float32)
+        track_boxes = np.array([t.box for t in tracks], dtype=np.float32)
+        track_classes = np.array([t.cls_id for t in tracks])
+        iou = utils.box_iou(track_boxes, boxes)
+        return iou * (track_classes[:, None] == classes[None, :])
+
+    def update(self, detections):
+        """输入当前帧 (N, 6) 检测数组 [x1, y1, x2, y2, conf, cls]
+
+        返回:
+            track_ids: (N,) 每个检测框对应的轨迹ID，未关联的为-1
+            events: [(事件类型, Track), ...]
+        """
+        detections = np.asarray(detections, dtype=np.float32).reshape(-1, 6)
+        boxes, scores, classes = detections[:, :4], detections[:, 4], detections[:, 5].astype(int)
+        track_ids = np.full(len(detections), -1, dtype=np.int64)
+        events = []
+
+        high = np.nonzero(scores >= self.high_thresh)[0]
+        low = np.nonzero((scores >= self.low_thresh) & (scores < self.high_thresh))[0]
+
+        # 两阶段关联：全部轨迹先匹配高置信度框，剩余轨迹再匹配低置信度框
+        unmatched = list(range(len(self.tracks)))
+        matched_high = set()
+        for stage_dets in (high, low):
+            if len(stage_dets) == 0 or not unmatched:
+                continue
+            candidates = [self.tracks[i] for i in unmatched]
+            iou = self._iou(candidates, boxes[stage_dets], classes[stage_dets])
+            matched_tracks = set()
+            for r, c in greedy_match(iou, self.match_iou):
+                track, det = candidates[r], stage_dets[c]
+                track.update(boxes[det].copy(), float(scores[det]))
+                track_ids[det] = track.track_id
+                matched_tracks.add(unmatched[r])
+                if stage_dets is high:
+                    matched_high.add(det)
+            unmatched = [i for i in unmatched if i not in matched_tracks]
+
+        for i in unmatched:
+            self.tracks[i].mark_missed()
+
+        # 未匹配的高置信度框创建新轨迹
+        for det in high:
+            if det in matched_high:
+                continue
+            track = Track(self._next_id, boxes[det].copy(), float(scores[det]), int(classes[det]), self.window)
+            self._next_id += 1
+            self.tracks.append(track)
+            track_ids[det] = track.track_id
+
+        alive = []
+        for track in self.tracks:
+            if track.misses > self.max_age:
+                if track.confirmed:
+                    events.append((EVENT_TRACK_LOST, track))
+                continue
+            if not track.confirmed and track.hits >= self.min_hits:
+                track.confirmed = True
+                events.append((EVENT_TRACK_CONFIRMED, track))
+            alive.append(track)
+        self.tracks = alive
+        return track_ids, events
+
+    def confirmed_tracks(self):
+        return [track for track in self.tracks if track.confirmed]
+
+    def reset(self):
+        self.tracks = []
+
+
+class AlarmStateMachine:
+    """由跟踪结果驱动的告警状态机：idle → alarm → cooldown → idle
+
+    参数:
+        classes: 参与告警的类别名
+        min_hits / window: N-of-M规则，轨迹在最近window帧中至少出现min_hits帧
+        fire_classes: 需要额外满足面积增长条件的类别
+        fire_min_growth: 火焰面积相对首次出现时的最小增长比例，0表示不检查
+        clear_frames: 连续多少帧没有满足条件的目标后结束告警
+        cooldown_seconds: 告警结束后的冷却时长，期间再次满足条件视为同一事件继续告警；
+            冷却期满且未再次触发才发出告警结束事件，保证每个开始事件只对应一个结束事件
+    """
+
+    def __init__(self, classes=('fire', 'smoke'), min_hits=3, window=5, fire_classes=('fire',),
+                 fire_min_growth=0.1, clear_frames=25, cooldown_seconds=30.0):
+        self.classes = set(classes)
+        self.min_hits = min_hits
+        self.window = window
+        self.fire_classes = set(fire_classes)
+        self.fire_min_growth = fire_min_growth
+        self.clear_frames = clear_frames
+        self.cooldown_seconds = cooldown_seconds
+
+        self.state = ALARM_IDLE
+        self.alarm_tracks = []  # 当前满足告警条件的轨迹ID
+        self.alarms = 0
+        self._quiet_frames = 0
+        self._cooldown_until = 0.0
+        self._alarm_start = 0.0
+        self._alarm_end = 0.0
+
+    def qualifies(self, track, names):
+        """轨迹是否满足告警条件"""
+        name = names.get(track.cls_id)
+        if name not in self.classes:
+            return False
+        if sum(list(track.history)[-self.window:]) < self.min_hits:
+            return False
+        if name in self.fire_classes and self.fire_min_growth > 0:
+            return track.growth() >= self.fire_min_growth
+        return True
+
+    def update(self, tracks, names, now=None):
+        """输入当前全部轨迹，返回告警事件列表 [(事件类型, 详情), ...]"""
+        now = time.time() if now is None else now
+        qualifying = [track for track in tracks if self.qualifies(track, names)]
+        self.alarm_tracks = [track.track_id for track in qualifying]
+        events = []
+
+        if self.state == ALARM_COOLDOWN and not qualifying and now >= self._cooldown_until:
+            # 冷却期内没有再次触发，事件才真正结束；持续时间截止到目标消失时
+            self.state = ALARM_IDLE
+            events.append((EVENT_ALARM_END, {'duration': round(self._alarm_end - self._alarm_start, 2)}))
+
+        if qualifying:
+            self._quiet_frames = 0
+            if self.state == ALARM_IDLE:
+                self.alarms += 1
+                self._alarm_start = now
+                events.append((EVENT_ALARM_START, {
+                    'tracks': [track.to_dict(names) for track in qualifying],
+                }))
+            # 冷却期内再次满足条件：视为同一事件，继续告警但不重复通知
+            self.state = ALARM_ACTIVE
+        elif self.state == ALARM_ACTIVE:
+            self._quiet_frames += 1
+            if self._quiet_frames >= self.clear_frames:
+                self.state = ALARM_COOLDOWN
+                self._cooldown_until = now + self.cooldown_seconds
+                self._alarm_end = now
+        return events
+
+    def close(self, now=None):
+        """视频结束或停止检测时调用：告警中或冷却中的事件立即结束，返回待发出的告警结束事件"""
+        if self.state == ALARM_IDLE:
+            return []
+        end = self._alarm_end if self.state == ALARM_COOLDOWN else (time.time() if now is None else now)
+        self.state = ALARM_IDLE
+        self.alarm_tracks = []
+        self._quiet_frames = 0
+        return [(EVENT_ALARM_END, {'duration': round(end - self._alarm_start, 2)})]
+
+
+class TrackingProcessor:
+    """跟踪 + 告警的组合，可作为检测流水线的后处理器（processor(packet)）使用
+
+    参数:
+        tracker: IoUTracker
+        alarm: AlarmStateMachine
+        on_event: 事件回调 on_event(event_dict)
+    """
+
+    def __init__(self, tracker, alarm, on_event=None):
+        self.tracker = tracker
+        self.alarm = alarm
+        self.on_event = on_event
+        self._lock = threading.Lock()
+        self._snapshot = {'state': ALARM_IDLE, 'confirmed': {}, 'alarm_tracks': []}
+
+    def update(self, results, frame_index=None):
+        """处理一帧的检测结果，返回 (每个检测框的轨迹ID, 事件字典列表)"""
+        result = results[0] if results else None
+        names = result.names if result is not None else {}
+        detections = np.empty((0, 6), dtype=np.float32)
+        if result is not None and result.boxes is not None and len(result.boxes):
+            data = result.boxes.data
+            data = data.cpu().numpy() if hasattr(data, 'cpu') else np.asarray(data)
+            detections = data[:, [0, 1, 2, 3, -2, -1]]
+
+        track_ids, track_events = self.tracker.update(detections)
+        alarm_events = self.alarm.update(self.tracker.tracks, names)
+
+        now = round(time.time(), 3)
+        events = [{'type': kind, 'time': now, 'frame': frame_index, **track.to_dict(names)}
+                  for kind, track in track_events]
+        events += [{'type': kind, 'time': now, 'frame': frame_index, **detail}
+                   for kind, detail in alarm_events]
+
+        confirmed = {}
+        for track in self.tracker.confirmed_tracks():
+            name = names.get(track.cls_id, f"类别{track.cls_id}")
+            confirmed[name] = confirmed.get(name, 0) + 1
+        with self._lock:
+            self._snapshot = {
+                'state': self.alarm.state,
+                'confirmed': confirmed,
+                'alarm_tracks': list(self.alarm.alarm_tracks),
+            }
+
+        if self.on_event:
+            for event in events:
+                self.on_event(event)
+        return track_ids, events
+
+    def __call__(self, packet):
+        packet.track_ids, packet.events = self.update(packet.results, packet.index)
+
+    def close(self, frame_index=None):
+        """结束时调用，补发尚未结束的告警的结束事件，保证每个告警开始都有对应的结束，返回事件字典列表"""
+        now = round(time.time(), 3)
+        events = [{'type': kind, 'time': now, 'frame': frame_index, **detail}
+                  for kind, detail in self.alarm.close()]
+        with self._lock:
+            self._snapshot = dict(self._snapshot, state=self.alarm.state, alarm_tracks=[])
+        if self.on_event:
+            for event in events:
+                self.on_event(event)
+        return events
+
+    def snapshot(self):
+        """最近一帧的告警状态和各类别已确认的目标数，供界面读取"""
+        with self._lock:
+            return dict(self._snapshot)
+
+
+def create_tracking_processor(on_event=None):
+    """按 PredictionConfig 中的跟踪与告警配置创建处理器"""
+    tracker = IoUTracker(
+        high_thresh=PredictionConfig.track_high_thresh,
+        low_thresh=PredictionConfig.track_low_thresh,
+        match_iou=PredictionConfig.track_match_iou,
+        max_age=PredictionConfig.track_max_age,
+        min_hits=PredictionConfig.alarm_min_hits,
+        window=max(PredictionConfig.alarm_window, 10),
+    )
+    alarm = AlarmStateMachine(
+        min_hits=PredictionConfig.alarm_min_hits,
+        window=PredictionConfig.alarm_window,
+        fire_min_growth=PredictionConfig.alarm_fire_min_growth,
+        clear_frames=PredictionConfig.alarm_clear_frames,
+        cooldown_seconds=PredictionConfig.alarm_cooldown_seconds,
+    )
+    return TrackingProcessor(tracker, alarm, on_event)
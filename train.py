@@ -1,104 +1,297 @@
-from ultralytics import YOLO
+"""
+YOLOv8训练入口
+
+训练参数以 config.TrainingConfig 为默认值，依次叠加YAML配置文件和命令行覆盖项，
+解析后的完整配置、运行环境和各阶段耗时写入本次训练目录（与 results.csv 同目录）：
+    train_config.yaml   解析后的完整配置，可直接作为 --config 复现本次训练
+    train_record.json   命令行、运行环境（GPU、版本、git提交）和耗时（每个epoch、训练期间的验证、最终验证和测试）
+训练期间的验证由 evaluate.EvalTrainer 执行（val_every、val_subset），结束后用 evaluate.EvalEngine
+加载一次最佳模型评估验证集和测试集。
+
+用法:
+    python train.py --config configs/improved_exp.yaml
+    python train.py --config configs/improved_exp.yaml --set batch_size=64 --set workers=12
+    python train.py --config configs/improved_exp.yaml --device 0,1      # 多GPU（DDP）
+    python train.py --config configs/improved_exp.yaml --autotune        # 按本机探测结果选择batch_size和workers
+    torchrun --nproc_per_node 2 train.py --config configs/improved_exp.yaml --device 0,1
+"""
+import argparse
+import json
 import os
-import yaml
+import platform
+import socket
+import subprocess
+import sys
+import time
 from datetime import datetime
-# from config import TrainingConfig
 
-def parse_args():
-    # 不再使用 argparse 解析命令行参数
-    class Args:
-        def __init__(self):
-            self.data_yaml = 'data.yaml'
-            self.model_type = 'yolov8s.pt'
-            self.pretrained = True
-            self.resume = False
-            self.epochs = 100
-            self.batch_size = 32
-            self.imgsz = 640
-            self.optimizer = 'SGD'
-            self.lr0 = 0.01
-            self.lrf = 0.001
-            self.momentum = 0.937
-            self.weight_decay = 0.0005
-            self.warmup_epochs = 3.0
-            self.mosaic = 1.0
-            self.mixup = 0.1
-            self.copy_paste = 0.1
-            self.project = 'runs/train'
-            self.name = 'improved_exp'
-            self.device = ''
-            self.resume = False
-
-    return Args()
-
-def train_yolo(args):
-    # 使用从 parse_args 函数获取的参数
-    model_type = args.model_type
-    epochs = args.epochs
-    batch_size = args.batch_size
-
-    # 初始化模型
-    if args.pretrained:
-        model = YOLO(model_type)
+import numpy as np
+import yaml
+
+from config import TrainingConfig
+
+# TrainingConfig 字段名与ultralytics参数名不同的映射，其余同名直接传递
+TRAIN_ARG_NAMES = {'data_yaml': 'data', 'batch_size': 'batch'}
+# 只由本脚本使用、不传给ultralytics的字段
+RUNNER_FIELDS = ('model_type', 'pretrained', 'augment', 'image_store', 'run_test', 'autotune',
+                 'val_every', 'val_subset', 'val_subset_seed')
+# augment=False 时关闭的训练数据增强
+AUGMENT_FIELDS = ('mosaic', 'mixup', 'copy_paste')
+
+
+def default_config():
+    """TrainingConfig 的全部字段"""
+    return {k: v for k, v in vars(TrainingConfig).items() if not k.startswith('_') and not callable(v)}
+
+
+def parse_override(text):
+    """解析 key=value 覆盖项，值按YAML语法解析（数字、布尔、列表等）"""
+    if '=' not in text:
+        raise ValueError(f"覆盖项格式应为 key=value: {text}")
+    key, value = text.split('=', 1)
+    return key.strip(), yaml.safe_load(value)
+
+
+def load_config(config_path=None, overrides=()):
+    """TrainingConfig 默认值 ← YAML配置文件 ← 命令行覆盖项，未知字段直接报错以免拼写错误被忽略"""
+    cfg = default_config()
+    layers = []
+    if config_path:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            layers.append((config_path, yaml.safe_load(f) or {}))
+    layers.append(('--set', dict(parse_override(o) for o in overrides)))
+
+    for source, values in layers:
+        unknown = sorted(set(values) - set(cfg))
+        if unknown:
+            raise KeyError(f"{source} 中有 TrainingConfig 不存在的字段: {', '.join(unknown)}")
+        cfg.update(values)
+
+    if not cfg.get('name'):
+        cfg['name'] = datetime.now().strftime('exp_%Y%m%d_%H%M%S')
+    cfg['device'] = normalize_device(cfg.get('device'))
+    return cfg
+
+
+def normalize_device(device):
+    """设备统一为字符串：列表 [0, 1] 与 '0,1' 等价，None 表示自动选择"""
+    if device is None:
+        return ''
+    if isinstance(device, (list, tuple)):
+        return ','.join(str(d) for d in device)
+    return str(device).replace(' ', '')
+
+
+def device_count(device):
+    """设备字符串对应的GPU数量，CPU或自动选择时为0"""
+    if not device or device in ('cpu', 'mps'):
+        return 0
+    return len([d for d in device.split(',') if d != ''])
+
+
+def check_config(cfg):
+    """多GPU训练的约束：批次必须能被GPU数整除，且不能使用自动批次（-1）"""
+    gpus = device_count(cfg['device'])
+    if gpus > 1:
+        if cfg['batch_size'] < 0:
+            raise ValueError("多GPU训练不支持自动批次（batch_size=-1），请指定总批次大小")
+        if cfg['batch_size'] % gpus:
+            raise ValueError(f"batch_size={cfg['batch_size']} 不能被GPU数 {gpus} 整除")
+
+
+def train_kwargs(cfg):
+    """把配置转换为 YOLO.train 的参数"""
+    kwargs = {}
+    for key, value in cfg.items():
+        if key in RUNNER_FIELDS:
+            continue
+        kwargs[TRAIN_ARG_NAMES.get(key, key)] = value
+    if not cfg.get('augment', True):
+        kwargs.update({key: 0.0 for key in AUGMENT_FIELDS})
+    if cfg.get('image_store'):
+        # 使用预处理图片存储时从内存映射读取，不再使用ultralytics自带的缓存
+        from dataset_store import make_store_trainer
+        make_store_trainer(cfg['image_store'])
+        kwargs['cache'] = False
+    # EvalTrainer 继承自 StoreTrainer：未设置 image_store、val_every=1 且不使用验证子集时与默认训练相同
+    from evaluate import make_eval_trainer
+    kwargs['trainer'] = make_eval_trainer(cfg.get('val_every', 1), cfg.get('val_subset', 0.0),
+                                          cfg.get('val_subset_seed', 0))
+    return kwargs
+
+
+def environment_info():
+    """运行环境：主机、Python/PyTorch/ultralytics版本、GPU型号、git提交"""
+    info = {
+        'host': socket.gethostname(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+    }
+    try:
+        import torch
+        import ultralytics
+        info['torch'] = torch.__version__
+        info['ultralytics'] = ultralytics.__version__
+        info['gpus'] = [torch.cuda.get_device_name(i) for i in range(torch.cuda.device_count())]
+    except ImportError:
+        pass
+    try:
+        info['git_commit'] = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return info
+
+
+def epoch_times(save_dir):
+    """从 results.csv 的累计 time 列计算每个epoch的耗时（秒），没有该列时返回空列表"""
+    path = os.path.join(save_dir, 'results.csv')
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        header = [h.strip() for h in f.readline().split(',')]
+        if 'time' not in header:
+            return []
+        column = header.index('time')
+        cumulative = [float(line.split(',')[column]) for line in f if line.strip()]
+    return np.diff([0.0] + cumulative).round(3).tolist()
+
+
+def write_run_record(save_dir, cfg, timings):
+    """把解析后的配置和耗时写入训练目录"""
+    from evaluate import validation_summary
+
+    os.makedirs(save_dir, exist_ok=True)
+    with open(os.path.join(save_dir, 'train_config.yaml'), 'w', encoding='utf-8') as f:
+        yaml.safe_dump(cfg, f, allow_unicode=True, sort_keys=False)
+
+    epochs = epoch_times(save_dir)
+    record = {
+        'argv': sys.argv,
+        'started': timings.get('started'),
+        'environment': environment_info(),
+        'timings': {
+            **{k: round(v, 3) for k, v in timings.items() if isinstance(v, float)},
+            'epochs': epochs,
+            'epoch_median': float(np.median(epochs)) if epochs else None,
+        },
+        'validation': validation_summary(save_dir),
+    }
+    if record['validation'] and timings.get('train'):
+        record['validation']['fraction_of_train'] = round(record['validation']['seconds'] / timings['train'], 4)
+    with open(os.path.join(save_dir, 'train_record.json'), 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+
+
+def apply_autotune(cfg):
+    """autotune 开启时用本机的调优结果替换 batch_size 和 workers（没有保存过时先探测）"""
+    if not cfg.get('autotune'):
+        return cfg
+    from autotune import tuned_training
+
+    tuned = tuned_training(cfg)
+    # 写入 train_config.yaml 的是调优后的具体值，换一台机器复现也使用相同的参数
+    cfg.update(batch_size=tuned['batch_size'], workers=tuned['workers'], autotune=False)
+    return cfg
+
+
+def is_main_process():
+    """torchrun 启动的多进程训练中只有RANK 0负责记录与验证"""
+    return int(os.environ.get('RANK', 0)) == 0
+
+
+def train_yolo(cfg):
+    """按配置训练，返回 (训练结果, 训练目录, 耗时)"""
+    from ultralytics import YOLO
+
+    check_config(cfg)
+    timings = {'started': datetime.now().isoformat(timespec='seconds')}
+
+    start = time.perf_counter()
+    if cfg['pretrained']:
+        model = YOLO(cfg['model_type'])
     else:
-        model = YOLO(model_type.replace('.pt', '.yaml'))
-
-    # 训练模型
-    results = model.train(
-        data=args.data_yaml,
-        epochs=epochs,
-        batch=batch_size,
-        imgsz=args.imgsz,
-        optimizer=args.optimizer,
-        lr0=args.lr0,
-        lrf=args.lrf,
-        momentum=args.momentum,
-        weight_decay=args.weight_decay,
-        warmup_epochs=args.warmup_epochs,
-        mosaic=args.mosaic,
-        mixup=args.mixup,
-        copy_paste=args.copy_paste,
-        project=args.project,
-        name=args.name,
-        device=args.device,
-        resume=args.resume,
-        patience=50,  # 早停策略
-        verbose=True,
-        amp=True,  # 混合精度训练
-        cos_lr=True,  # 余弦退火学习率
-    )
-
-    return results
+        model = YOLO(cfg['model_type'].replace('.pt', '.yaml'))
+    timings['model_init'] = time.perf_counter() - start
+
+    # 多GPU时ultralytics会按device列表自动以DDP方式启动子进程
+    start = time.perf_counter()
+    results = model.train(**train_kwargs(cfg))
+    timings['train'] = time.perf_counter() - start
+
+    save_dir = str(model.trainer.save_dir)
+    if is_main_process():
+        write_run_record(save_dir, cfg, timings)
+    return results, save_dir, timings
+
+
+def evaluate_yolo(model_path, cfg, splits=('val', 'test')):
+    """加载一次模型评估各划分，验证/测试图片解码后缓存在进程内，返回 {划分: DetMetrics}"""
+    from evaluate import get_eval_engine
+
+    device = normalize_device(cfg['device']).split(',')[0] or None
+    batch = cfg['batch_size'] if cfg['batch_size'] > 0 else 16
+    engine = get_eval_engine(cfg['data_yaml'], cfg['imgsz'], batch, device)
+    return engine.evaluate(model_path, splits), engine.timings
+
 
 def validate_yolo(model_path, data_yaml='data.yaml'):
-    # Load the trained model
-    model = YOLO(model_path)
-    
-    # Validate the model
-    results = model.val(data=data_yaml)
-    
-    return results
+    cfg = dict(default_config(), data_yaml=data_yaml, device='')
+    return evaluate_yolo(model_path, cfg, ('val',))[0]['val']
+
 
 def test_yolo(model_path, data_yaml='data.yaml'):
-    # Load the trained model
-    model = YOLO(model_path)
-    
-    # Test the model
-    results = model.val(data=data_yaml, split='test')
-    
-    return results
+    cfg = dict(default_config(), data_yaml=data_yaml, device='')
+    return evaluate_yolo(model_path, cfg, ('test',))[0]['test']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='YOLOv8训练（TrainingConfig ← YAML ← 命令行）')
+    parser.add_argument('--config', default=None, help='YAML配置文件，字段与 TrainingConfig 相同')
+    parser.add_argument('--set', dest='overrides', action='append', default=[], metavar='KEY=VALUE',
+                        help='覆盖单个字段，可重复，如 --set batch_size=64 --set device=[0,1]')
+    parser.add_argument('--device', default=None, help='训练设备，如 0、0,1（多GPU）或 cpu')
+    parser.add_argument('--name', default=None, help='实验名称')
+    parser.add_argument('--resume', action='store_true', help='从上次中断处继续训练')
+    parser.add_argument('--autotune', action='store_true', help='按本机探测结果选择batch_size和workers')
+    parser.add_argument('--print-config', action='store_true', help='只输出解析后的配置，不训练')
+    args = parser.parse_args()
+
+    # 常用字段的快捷参数等价于 --set，优先级最高
+    for key in ('device', 'name'):
+        if getattr(args, key) is not None:
+            args.overrides.append(f"{key}={getattr(args, key)}")
+    if args.resume:
+        args.overrides.append('resume=true')
+    if args.autotune:
+        args.overrides.append('autotune=true')
+    return args
+
 
 if __name__ == '__main__':
     args = parse_args()
-    results = train_yolo(args)
+    cfg = load_config(args.config, args.overrides)
+    if args.print_config:
+        print(yaml.safe_dump(cfg, allow_unicode=True, sort_keys=False))
+        sys.exit(0)
+
+    results, save_dir, timings = train_yolo(apply_autotune(cfg))
     print("Training completed. Results:", results)
-    
-    # Validate the best model
-    best_model_path = os.path.join(args.project, args.name, 'weights', 'best.pt')
-    if os.path.exists(best_model_path):
-        val_results = validate_yolo(best_model_path, args.data_yaml)
-        print(f"Validation results for best model: {val_results}")
-        
-        # Test the best model
-        test_results = test_yolo(best_model_path, args.data_yaml)
-        print(f"Test results for best model: {test_results}") 
\ No newline at end of file
+    if not is_main_process():
+        sys.exit(0)
+
+    # Evaluate the best model: ultralytics已在训练结束时用best.pt完整验证过，此时只需评估测试集
+    best_model_path = os.path.join(save_dir, 'weights', 'best.pt')
+    splits = ['test'] if cfg.get('run_test', True) else []
+    if results is None or not cfg['val']:
+        splits.insert(0, 'val')
+    if os.path.exists(best_model_path) and splits:
+        start = time.perf_counter()
+        metrics, eval_timings = evaluate_yolo(best_model_path, cfg, splits)
+        timings['final_eval'] = time.perf_counter() - start
+        for split, split_metrics in metrics.items():
+            timings[f'final_{split}'] = eval_timings[split]
+            print(f"{split} results for best model: mAP50={split_metrics.box.map50:.4f}, "
+                  f"mAP50-95={split_metrics.box.map:.4f}")
+    write_run_record(save_dir, cfg, timings)
@@ -1,8 +1,9 @@
 import cv2
+import hashlib
 import numpy as np
 import os
-from PyQt5.QtGui import QImage, QPixmap, QColor
-from PyQt5.QtCore import Qt
+
+# 注意：PyQt5只在需要显示的函数内部导入，保证无界面环境（命令行/服务器）也能使用本模块
 
 # 为每个类别预定义鲜艳的颜色
 # 烟雾用蓝色，火灾用红色
@@ -41,6 +42,8 @@ def get_color_for_class(class_id, class_name=None):
 
 def cv2_to_qpixmap(cv_img):
     """将OpenCV图像转换为QPixmap"""
+    from PyQt5.QtGui import QImage, QPixmap
+    
     rgb_image = cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB)
     h, w, ch = rgb_image.shape
     bytes_per_line = ch * w
@@ -66,42 +69,217 @@ def count_detections(results):
     
     return class_counts
 
+def result_to_detections(result):
+    """将单个检测结果转换为字典列表，坐标等数据一次性拷贝到主机内存"""
+    detections = []
+    xyxy, cls_ids, confs = result_to_arrays(result, xyxy_dtype=np.float32)
+    if len(cls_ids) == 0:
+        return detections
+    names = result.names if hasattr(result, 'names') else {}
+    
+    for (x1, y1, x2, y2), cls_id, conf in zip(xyxy.tolist(), cls_ids.tolist(), confs.tolist()):
+        detections.append({
+            'class_id': cls_id,
+            'class': names.get(cls_id, f"类别{cls_id}"),
+            'conf': round(conf, 4),
+            'xyxy': [round(x1, 1), round(y1, 1), round(x2, 1), round(y2, 1)],
+        })
+    
+    return detections
+
 def scale_pixmap_to_label(pixmap, label):
     """按比例缩放图像以适应标签大小"""
+    from PyQt5.QtCore import Qt
+    
     label_size = label.size()
     return pixmap.scaled(label_size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
 
-def plot_with_custom_colors(result, line_width=2):
-    """使用自定义颜色绘制检测结果"""
-    # 复制原始图像以避免修改源图像
-    annotated_frame = result.orig_img.copy()
-    
-    if hasattr(result, 'boxes') and len(result.boxes) > 0:
-        boxes = result.boxes
-        for i, box in enumerate(boxes):
-            # 获取边界框坐标
-            x1, y1, x2, y2 = map(int, box.xyxy.cpu().numpy()[0])
-            
-            # 获取类别ID和名称
-            cls_id = int(box.cls.cpu().numpy()[0])
-            cls_name = result.names[cls_id] if hasattr(result, 'names') else f"类别{cls_id}"
-            
-            # 获取置信度
-            conf = float(box.conf.cpu().numpy()[0])
-            
-            # 获取该类别的颜色
+LABEL_FONT = cv2.FONT_HERSHEY_SIMPLEX
+LABEL_FONT_SCALE = 0.6
+LABEL_TEXT_COLOR = (255, 255, 255)
+
+def result_to_arrays(result, scale=1.0, xyxy_dtype=np.int32):
+    """一次性把检测框、类别、置信度拷贝到主机内存，返回连续的NumPy数组
+
+    参数:
+        scale: 坐标缩放系数，用于在缩小后的图像上绘制
+        xyxy_dtype: 坐标的数据类型，绘制用int32，输出检测结果用float32
+
+    返回:
+        xyxy: (N, 4) xyxy_dtype
+        cls_ids: (N,) int64
+        confs: (N,) float32
+    """
+    boxes = getattr(result, 'boxes', None)
+    if boxes is None or len(boxes) == 0:
+        return (np.empty((0, 4), dtype=xyxy_dtype), np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=np.float32))
+    
+    # boxes.data 为 (N, 6)：x1, y1, x2, y2, conf, cls（带跟踪ID时为7列），只做一次设备到主机的拷贝
+    data = boxes.data.cpu().numpy()
+    xyxy = data[:, :4] * scale if scale != 1.0 else data[:, :4]
+    xyxy = np.ascontiguousarray(xyxy, dtype=xyxy_dtype)
+    confs = np.ascontiguousarray(data[:, -2], dtype=np.float32)
+    cls_ids = data[:, -1].astype(np.int64)
+    return xyxy, cls_ids, confs
+
+class DetectionRenderer:
+    """检测结果绘制器
+    
+    - 每帧只把 xyxy/cls/conf 拷贝到主机内存一次
+    - 按 (类别, 置信度档位) 缓存标签文本及其尺寸，避免重复格式化和 getTextSize
+    - 默认在可复用的缓冲区中原地绘制，返回的数组会在下一次 render 时被覆盖
+    """
+    
+    def __init__(self, line_width=2, reuse_buffer=True):
+        self.line_width = line_width
+        self.reuse_buffer = reuse_buffer
+        self._buffer = None
+        self._label_cache = {}  # (cls_id, 置信度档位) -> (文本, 文本宽度)
+        self._color_cache = {}
+        
+    def _label(self, cls_id, cls_name, conf):
+        # 标签显示两位小数，因此按0.01分档缓存
+        key = (cls_id, int(round(conf * 100)))
+        cached = self._label_cache.get(key)
+        if cached is None:
+            text = f"{cls_name} {key[1] / 100:.2f}"
+            (text_w, _), _ = cv2.getTextSize(text, LABEL_FONT, LABEL_FONT_SCALE, 1)
+            cached = (text, text_w)
+            self._label_cache[key] = cached
+        return cached
+        
+    def _color(self, cls_id, cls_name):
+        color = self._color_cache.get(cls_id)
+        if color is None:
             color = get_color_for_class(cls_id, cls_name)
+            self._color_cache[cls_id] = color
+        return color
+        
+    def _target(self, image, out):
+        """准备绘制目标：指定的out、复用缓冲区或新拷贝"""
+        if out is None and not self.reuse_buffer:
+            return image.copy()
+        if out is None:
+            if self._buffer is None or self._buffer.shape != image.shape or self._buffer.dtype != image.dtype:
+                self._buffer = np.empty_like(image)
+            out = self._buffer
+        if out is not image:
+            np.copyto(out, image)
+        return out
+        
+    def render(self, result, out=None, image=None, scale=1.0):
+        """绘制检测结果
+
+        参数:
+            result: 单个检测结果
+            out: 绘制目标数组，None时使用内部复用缓冲区（reuse_buffer=False时为新拷贝）；
+                 与 image 为同一数组时直接原地绘制
+            image: 底图，默认为 result.orig_img
+            scale: 底图相对原图的缩放系数，检测框坐标按此缩放
+        """
+        if image is None:
+            image = result.orig_img
+        canvas = self._target(image, out)
+
+        xyxy, cls_ids, confs = result_to_arrays(result, scale)
+        if len(xyxy) == 0:
+            return canvas
+        
+        names = result.names if hasattr(result, 'names') else {}
+        line_width = self.line_width
+        for (x1, y1, x2, y2), cls_id, conf in zip(xyxy.tolist(), cls_ids.tolist(), confs.tolist()):
+            cls_name = names.get(cls_id, f"类别{cls_id}")
+            color = self._color(cls_id, cls_name)
+            text, text_w = self._label(cls_id, cls_name, conf)
             
-            # 绘制边界框
-            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), color, line_width)
-            
-            # 绘制类别标签和置信度
-            label = f"{cls_name} {conf:.2f}"
-            text_size, _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 1)
-            cv2.rectangle(annotated_frame, (x1, y1 - 20), (x1 + text_size[0], y1), color, -1)
-            cv2.putText(annotated_frame, label, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
-    
-    return annotated_frame
+            # 绘制边界框和标签
+            cv2.rectangle(canvas, (x1, y1), (x2, y2), color, line_width)
+            cv2.rectangle(canvas, (x1, y1 - 20), (x1 + text_w, y1), color, -1)
+            cv2.putText(canvas, text, (x1, y1 - 5), LABEL_FONT, LABEL_FONT_SCALE, LABEL_TEXT_COLOR, 1)
+        
+        return canvas
+
+# plot_with_custom_colors 使用的绘制器（按线宽区分），共享标签缓存
+_renderers = {}
+
+def plot_with_custom_colors(result, line_width=2):
+    """使用自定义颜色绘制检测结果，返回新的图像数组（不修改原图）"""
+    renderer = _renderers.get(line_width)
+    if renderer is None:
+        renderer = DetectionRenderer(line_width, reuse_buffer=False)
+        _renderers[line_width] = renderer
+    return renderer.render(result)
+
+class DisplayConverter:
+    """将检测帧转换为适合显示区域大小的QPixmap，尽量减少整帧拷贝
+
+    处理顺序：先缩放到显示尺寸（写入复用缓冲区）→ 在缩小后的图像上原地绘制检测框 →
+    以BGR888格式直接包装为QImage（不做颜色转换）→ QPixmap.fromImage。
+    整个过程只有两次显示尺寸的拷贝，原分辨率的帧不会被复制。
+    """
+
+    def __init__(self, renderer=None):
+        self.renderer = renderer or DetectionRenderer()
+        self._buffer = None
+        # 拷贝统计
+        self.frames = 0
+        self.copies = 0
+        self.bytes_copied = 0
+
+    def _count_copy(self, nbytes):
+        self.copies += 1
+        self.bytes_copied += nbytes
+
+    def to_pixmap(self, frame, result, target_width, target_height):
+        """缩放、绘制并转换为QPixmap
+
+        参数:
+            frame: 原始BGR帧
+            result: 检测结果，None表示只显示原图
+            target_width, target_height: 显示区域大小，保持宽高比缩放到其中
+        """
+        from PyQt5.QtGui import QImage, QPixmap
+
+        h, w = frame.shape[:2]
+        scale = min(target_width / w, target_height / h)
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+
+        if self._buffer is None or self._buffer.shape[:2] != (size[1], size[0]):
+            self._buffer = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        buffer = self._buffer
+
+        # 拷贝1：缩放到显示尺寸
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        cv2.resize(frame, size, dst=buffer, interpolation=interpolation)
+        self._count_copy(buffer.nbytes)
+
+        # 在缩小后的缓冲区上原地绘制
+        if result is not None:
+            self.renderer.render(result, out=buffer, image=buffer, scale=scale)
+
+        # 直接以BGR顺序包装，Qt 5.14 以下没有BGR888时原地转换为RGB
+        if hasattr(QImage, 'Format_BGR888'):
+            fmt = QImage.Format_BGR888
+        else:
+            cv2.cvtColor(buffer, cv2.COLOR_BGR2RGB, dst=buffer)
+            fmt = QImage.Format_RGB888
+        q_img = QImage(buffer.data, size[0], size[1], buffer.strides[0], fmt)
+
+        # 拷贝2：转换为QPixmap
+        pixmap = QPixmap.fromImage(q_img)
+        self._count_copy(buffer.nbytes)
+
+        self.frames += 1
+        return pixmap
+
+    def stats(self):
+        frames = max(1, self.frames)
+        return {
+            'frames': self.frames,
+            'copies_per_frame': self.copies / frames,
+            'kb_per_frame': self.bytes_copied / frames / 1024,
+        }
 
 def check_model_path(model_path):
     """检查模型路径是否有效"""
@@ -123,4 +301,118 @@ def check_model_path(model_path):
         if os.path.exists(full_path):
             return True, full_path
     
-    return False, model_path 
\ No newline at end of file
+    return False, model_path 
+
+# 文件哈希缓存：(路径, 修改时间, 大小) -> sha1
+_file_hash_cache = {}
+
+def file_hash(path, chunk_size=1 << 20):
+    """计算文件内容的SHA1（按路径、修改时间和大小缓存，文件不变时不重复计算）"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime, stat.st_size)
+    digest = _file_hash_cache.get(key)
+    if digest is None:
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                sha1.update(chunk)
+        digest = sha1.hexdigest()
+        _file_hash_cache[key] = digest
+    return digest
+
+def letterbox(image, new_shape=640, color=(114, 114, 114)):
+    """保持宽高比缩放并填充到 new_shape，返回 (图像, 缩放比例, (左侧填充, 顶部填充))"""
+    if isinstance(new_shape, int):
+        new_shape = (new_shape, new_shape)
+    h, w = image.shape[:2]
+    ratio = min(new_shape[0] / h, new_shape[1] / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    pad_w, pad_h = (new_shape[1] - new_w) / 2, (new_shape[0] - new_h) / 2
+    
+    if (w, h) != (new_w, new_h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_h - 0.1)), int(round(pad_h + 0.1))
+    left, right = int(round(pad_w - 0.1)), int(round(pad_w + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return image, ratio, (left, top)
+
+def box_iou(boxes1, boxes2):
+    """计算两组xyxy框之间的IoU矩阵，形状 (N, M)"""
+    area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+    lt = np.maximum(boxes1[:, None, :2], boxes2[None, :, :2])
+    rb = np.minimum(boxes1[:, None, 2:], boxes2[None, :, 2:])
+    wh = np.clip(rb - lt, 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    return inter / (area1[:, None] + area2[None, :] - inter + 1e-9)
+
+def nms_boxes(boxes, scores, iou_threshold=0.45, classes=None, max_det=300):
+    """非极大值抑制，返回保留框的索引（按分数从高到低）
+    
+    参数:
+        boxes: (N, 4) xyxy
+        scores: (N,)
+        classes: (N,) 类别，提供时按类别分别抑制（通过坐标偏移实现，一次完成）
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+    
+    if classes is not None:
+        # 不同类别的框平移到互不重叠的区域，一次NMS即可实现按类别抑制
+        offset = classes.astype(boxes.dtype)[:, None] * (boxes.max() + 1)
+        boxes = boxes + offset
+    
+    order = np.argsort(-scores)
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    keep = []
+    while order.size > 0 and len(keep) < max_det:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+def build_results(orig_img, names, detections, path=''):
+    """由 (N, 6) 的 [x1, y1, x2, y2, conf, cls] 数组构造ultralytics的Results对象
+    
+    供ONNX等非PyTorch推理路径使用，使其结果与 YOLO.predict 的返回值接口一致。
+    """
+    import torch
+    from ultralytics.engine.results import Results
+    
+    detections = np.asarray(detections, dtype=np.float32).reshape(-1, 6)
+    return Results(orig_img, path=path, names=names, boxes=torch.from_numpy(detections))
+
+def weighted_boxes_fusion(boxes, scores, classes, iou_threshold=0.55):
+    """加权框融合（WBF）：同类别且IoU超过阈值的框聚为一簇，坐标按置信度加权平均
+    
+    与NMS直接丢弃重叠框不同，WBF综合各分块对同一目标的预测，分块边界处的框更准确。
+    
+    返回:
+        (M, 6) 数组 [x1, y1, x2, y2, conf, cls]，conf取簇内最大值
+    """
+    if len(boxes) == 0:
+        return np.empty((0, 6), dtype=np.float32)
+    
+    order = np.argsort(-scores)
+    boxes, scores, classes = boxes[order], scores[order], classes[order]
+    # 不同类别平移到互不重叠的区域，一次计算完整的IoU矩阵
+    offset = classes.astype(boxes.dtype)[:, None] * (boxes.max() + 1)
+    iou = box_iou(boxes + offset, boxes + offset)
+    
+    fused = []
+    unassigned = np.ones(len(boxes), dtype=bool)
+    for i in range(len(boxes)):
+        if not unassigned[i]:
+            continue
+        members = unassigned & (iou[i] >= iou_threshold)
+        unassigned &= ~members
+        weights = scores[members]
+        box = (boxes[members] * weights[:, None]).sum(axis=0) / weights.sum()
+        fused.append((*box, weights.max(), classes[i]))
+    return np.asarray(fused, dtype=np.float32)
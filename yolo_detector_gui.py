@@ -1,110 +1,172 @@
 import sys
 import os
+import time
+import hashlib
 import cv2
-import numpy as np
 from pathlib import Path
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                            QLabel, QPushButton, QComboBox, QSlider, QFileDialog, 
                            QStatusBar, QMenuBar, QAction, QTabWidget, QFrame, 
                            QSplitter, QGroupBox, QFormLayout, QMessageBox, QTextEdit,
-                           QTableWidget, QTableWidgetItem, QHeaderView, QCheckBox)
+                           QTableWidget, QTableWidgetItem, QHeaderView, QCheckBox,
+                           QSpinBox)
 from PyQt5.QtCore import Qt, QTimer, QThread, pyqtSignal, QSize
 from PyQt5.QtGui import QImage, QPixmap, QIcon, QColor, QPalette
-from ultralytics import YOLO
 
 # 导入自定义工具函数
 import utils
+import model_cache
+import inference_backend
+from result_writer import ResultWriter, SAVE_DETECTIONS, SAVE_ALL, SAVE_VIDEO
+from clip_recorder import ClipRecorder, DetectionTrigger
+from motion_gate import create_motion_gate
+from adaptive_scheduler import create_scheduler
+from tiled_inference import create_tiled_predictor
+from event_sink import create_event_sink
+from batch_predict import BatchResultWriter, collect_images, create_batch_predictor
+from frame_cache import get_frame_cache
+from result_cache import create_cached_predictor
+from tracker import create_tracking_processor, ALARM_ACTIVE, ALARM_COOLDOWN, EVENT_ALARM_START, EVENT_ALARM_END
+from config import PredictionConfig
+from detection_pipeline import DetectionPipeline, FrameMailbox
 
 class VideoThread(QThread):
-    update_frame = pyqtSignal(np.ndarray, list)
     update_fps = pyqtSignal(float)
     update_status = pyqtSignal(str, str)  # 添加状态更新信号
+    update_stage_stats = pyqtSignal(dict)  # 各流水线阶段的FPS与耗时
+    alarm_event = pyqtSignal(dict)  # 跟踪/告警事件
     
-    def __init__(self, source=0, model_path='yolov8n.pt', conf=0.25):
+    def __init__(self, source=0, model_path='yolov8n.pt', conf=0.25,
+                 queue_size=PredictionConfig.queue_size, drop_oldest=PredictionConfig.drop_oldest,
+                 recorder=None, writer=None, backend=PredictionConfig.backend, motion_gate=None,
+                 scheduler=None, tiled=False, tracking=PredictionConfig.tracking, event_sink=None,
+                 result_cache=False, batch_resume=True):
         super().__init__()
         self.source = source
         self.model_path = model_path
         self.conf = conf
+        self.queue_size = queue_size
+        self.drop_oldest = drop_oldest
+        self.recorder = recorder  # 事件片段录制器，在后处理阶段逐帧调用
+        self.writer = writer  # 检测结果写入器，可在运行中设置或清空
+        self.backend = backend  # 推理后端：torch / onnx / openvino
+        self.motion_gate = motion_gate  # 运动门控，None表示每帧推理
+        self.scheduler = scheduler  # 自适应步长调度器，None表示固定步长 PredictionConfig.vid_stride
+        self.tiled = tiled  # 是否分块推理（高分辨率画面中的小目标）
+        self.tracking = tracking  # 是否启用目标跟踪与告警去抖
+        self.tracker = None
+        self.event_sink = event_sink  # 检测事件日志，在跟踪之后逐帧记录
+        self.result_cache = result_cache  # 是否缓存推理结果（相同帧不再重复推理）
+        self.batch_resume = batch_resume  # 文件夹批量检测时是否接着上次的结果续跑（否则覆盖）
+        self.cached_model = None
         self.running = False
         self.use_camera = False
         self.fps = 0
         self.is_image = False
+        self.is_folder = False
+        self.pipeline = None
+        # 最新帧邮箱：检测线程覆盖写入，界面定时取走最新一帧
+        self.mailbox = FrameMailbox()
         
     def set_source(self, source, is_camera=False):
         self.source = source
         self.use_camera = is_camera
-        # 检查是否是图片文件
+        # 检查是否是图片文件或图片文件夹
         if isinstance(source, str) and source.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')):
             self.is_image = True
         else:
             self.is_image = False
+        self.is_folder = isinstance(source, str) and os.path.isdir(source)
         
     def set_model(self, model_path):
         self.model_path = model_path
         
     def set_conf(self, conf):
         self.conf = conf
+        if self.pipeline:
+            self.pipeline.set_conf(conf)
         
     def run(self):
+        self.running = True
         # 发送状态更新信号
         self.update_status.emit("正在加载模型...", "#FFA500")  # 橙色
         
         try:
-            model = YOLO(self.model_path)
+            # 从进程级缓存获取已预热的模型，重复开始检测时无需重新加载
+            if model_cache.get_registry().is_cached(self.model_path, backend=self.backend):
+                self.update_status.emit("使用已缓存的模型...", "#4CAF50")  # 绿色
+            model = model_cache.get_model(self.model_path, backend=self.backend)
+            if self.tiled:
+                model = create_tiled_predictor(model)
+            if self.result_cache:
+                model = self.cached_model = create_cached_predictor(model, self.model_path, backend=self.backend)
             self.update_status.emit("模型加载成功，准备视频源...", "#4CAF50")  # 绿色
             
             # 如果是图片，特殊处理
             if self.is_image:
                 self.process_image(model)
                 return
-                
-            cap = cv2.VideoCapture(self.source)
-            
-            if not cap.isOpened():
-                self.update_status.emit(f"无法打开视频源: {self.source}", "#EA4335")  # 红色
+            if self.is_folder:
+                self.process_folder(model)
                 return
                 
-            self.running = True
-            fps_counter = 0
-            fps_timer = cv2.getTickCount()
-            
-            self.update_status.emit("检测中...", "#4CAF50")  # 绿色
-            
-            while self.running:
-                ret, frame = cap.read()
-                if not ret:
-                    if not self.use_camera:  # 如果是视频文件，结束线程
-                        self.update_status.emit("视频结束", "#FFA500")  # 橙色
-                        break
-                    else:  # 如果是摄像头，尝试重新连接
-                        self.update_status.emit("尝试重新连接摄像头...", "#FFA500")  # 橙色
-                        cap = cv2.VideoCapture(self.source)
-                        continue
-                        
-                # 执行YOLO预测
-                results = model.predict(frame, conf=self.conf, verbose=False)
-                
-                # 发出更新信号
-                self.update_frame.emit(frame, results)
-                
-                # 计算FPS
-                fps_counter += 1
-                if cv2.getTickCount() - fps_timer > cv2.getTickFrequency():
-                    self.fps = fps_counter
-                    self.update_fps.emit(fps_counter)
-                    fps_counter = 0
-                    fps_timer = cv2.getTickCount()
-                    
-            cap.release()
+            # 采集、推理、后处理分别在独立线程中运行，解码与推理可以重叠
+            self.pipeline = DetectionPipeline(
+                self.source, model, self.conf,
+                use_camera=self.use_camera,
+                queue_size=self.queue_size,
+                drop_oldest=self.drop_oldest,
+                motion_gate=self.motion_gate,
+                scheduler=self.scheduler,
+                vid_stride=PredictionConfig.vid_stride,
+                on_result=self.emit_frame,
+                on_status=self.update_status.emit,
+                on_stats=self.emit_stage_stats,
+            )
+            # 跟踪在其他后处理器之前执行，为检测框分配持续ID并驱动告警状态机
+            if self.tracking:
+                self.tracker = create_tracking_processor(on_event=self.alarm_event.emit)
+                self.pipeline.add_processor(self.tracker)
+            if self.event_sink:
+                self.pipeline.add_processor(self.event_sink)
+            if self.recorder:
+                # 片段按实际送入的帧率写入（视频源帧率 / 检测步长），否则跳帧后播放速度不对
+                self.pipeline.add_processor(lambda packet: self.recorder.process(
+                    packet.frame, packet.results, self.pipeline.output_fps(PredictionConfig.clip_fps)))
+            if self.running:
+                self.pipeline.run()
+            # 视频结束或停止检测时补发未结束告警的结束事件
+            if self.tracker:
+                self.tracker.close()
             
         except Exception as e:
             self.update_status.emit(f"错误: {str(e)}", "#EA4335")  # 红色
+            
+    def emit_frame(self, frame, results):
+        """输出一帧：保存结果（每帧）并放入邮箱供界面显示（只保留最新帧）"""
+        self.save_results(results)
+        self.mailbox.post((frame, results))
+        
+    def save_results(self, results):
+        """在检测线程中绘制并提交需要保存的帧，不占用界面线程"""
+        writer = self.writer
+        if writer is None or not results:
+            return
+        result = results[0]
+        if writer.accept(len(result.boxes) > 0):
+            writer.put(utils.plot_with_custom_colors(result))
+            
+    def emit_stage_stats(self, stats):
+        """发送流水线统计，整体FPS取后处理阶段（即最终输出）的FPS"""
+        self.fps = stats['postprocess']['fps']
+        self.update_fps.emit(self.fps)
+        self.update_stage_stats.emit(stats)
         
     def process_image(self, model):
         """处理单张图片"""
         try:
-            # 读取图片
-            img = cv2.imread(self.source)
+            # 读取图片：预览时已在后台解码过的图片直接从缓存取出
+            img = get_frame_cache().get(self.source)
             if img is None:
                 self.update_status.emit(f"无法读取图片: {self.source}", "#EA4335")  # 红色
                 return
@@ -113,7 +175,7 @@ class VideoThread(QThread):
             results = model.predict(img, conf=self.conf, verbose=False)
             
             # 发出更新信号
-            self.update_frame.emit(img, results)
+            self.emit_frame(img, results)
             
             # 发送一个合理的FPS
             self.update_fps.emit(0)
@@ -124,11 +186,54 @@ class VideoThread(QThread):
         except Exception as e:
             self.update_status.emit(f"图片处理错误: {str(e)}", "#EA4335")  # 红色
         
+    def process_folder(self, model):
+        """批量检测文件夹中的所有图片：并行解码、按批推理，结果写入results目录，可断点续跑"""
+        try:
+            paths = collect_images(self.source)
+            if not paths:
+                self.update_status.emit(f"文件夹中没有图片: {self.source}", "#EA4335")  # 红色
+                return
+            output = self.folder_output(self.source)
+            writer = BatchResultWriter(output, resume=self.batch_resume)
+            predictor = create_batch_predictor(model, self.conf)
+            
+            def on_batch(items, results, done, total):
+                for (path, frame), result in zip(items, results):
+                    if frame is not None:
+                        self.emit_frame(frame, [result])
+                self.update_fps.emit(predictor.images / max(time.perf_counter() - start, 1e-6))
+                self.update_status.emit(f"批量检测: {done}/{total}", "#4CAF50")  # 绿色
+            
+            start = time.perf_counter()
+            try:
+                predictor.run(paths, writer, on_batch=on_batch, should_stop=lambda: not self.running)
+            finally:
+                writer.close()
+            self.update_status.emit(
+                f"批量检测完成: {writer.images} 张（跳过已处理 {len(writer.processed)} 张），"
+                f"{writer.detections} 个目标，结果: {output}", "#4CAF50")  # 绿色
+            
+        except Exception as e:
+            self.update_status.emit(f"批量检测错误: {str(e)}", "#EA4335")  # 红色
+        
+    @staticmethod
+    def folder_output(folder):
+        """文件夹批量检测的结果文件路径：文件夹名 + 绝对路径哈希，同名的不同文件夹不会共用结果文件"""
+        folder = os.path.abspath(folder)
+        name = os.path.basename(os.path.normpath(folder)) or "images"
+        digest = hashlib.sha1(os.path.normcase(folder).encode('utf-8')).hexdigest()[:8]
+        return os.path.join(os.getcwd(), "results", f"batch_{name}_{digest}.jsonl")
+        
     def stop(self):
         self.running = False
+        if self.pipeline:
+            self.pipeline.stop()
         self.wait()
 
 class YOLODetectorGUI(QMainWindow):
+    model_preloaded = pyqtSignal(str, str)  # 后台预加载完成（模型路径，错误信息）
+    clip_saved = pyqtSignal(str, int)  # 事件片段写入完成（文件路径，帧数）
+    
     def __init__(self):
         super().__init__()
         self.setWindowTitle("YOLO 烟雾与火灾检测器")
@@ -158,15 +263,26 @@ class YOLODetectorGUI(QMainWindow):
         
         # 初始化变量
         self.current_model = "yolov8n.pt"
+        self.current_backend = PredictionConfig.backend
         self.confidence = 0.25
         self.video_thread = None
         self.detection_running = False
         self.last_detection_counts = {}
         self.save_detection_results = False  # 是否保存检测结果
+        self.result_writer = None  # 后台结果写入器，检测开始时创建
+        self.clip_recorder = None  # 事件片段录制器，检测开始时创建
+        self.event_sink = None  # 检测事件日志，检测开始时创建
+        self.display_converter = utils.DisplayConverter()  # 显示路径（缩放+绘制+转换）
+        
+        # 显示定时器：按显示器刷新率从检测线程的邮箱中取最新帧
+        self.display_timer = QTimer(self)
+        self.display_timer.timeout.connect(self.pull_latest_frame)
         self.current_input_file = ""  # 当前输入文件路径
         
         # 创建界面
         self.init_ui()
+        self.model_preloaded.connect(self.on_model_preloaded)
+        self.clip_saved.connect(self.on_clip_saved)
         
         # 显示欢迎信息
         self.show_welcome_message()
@@ -282,7 +398,7 @@ class YOLODetectorGUI(QMainWindow):
         source_layout = QVBoxLayout(source_group)
         
         self.source_combo = QComboBox()
-        self.source_combo.addItems(["摄像头", "视频文件", "图片文件"])
+        self.source_combo.addItems(["摄像头", "视频文件", "图片文件", "图片文件夹"])
         self.source_combo.currentIndexChanged.connect(self.source_changed)
         source_layout.addWidget(self.source_combo)
         
@@ -317,6 +433,14 @@ class YOLODetectorGUI(QMainWindow):
         self.model_path_label.setWordWrap(True)
         model_layout.addRow("路径:", self.model_path_label)
         
+        # 推理后端：无GPU的设备可选择ONNX Runtime / OpenVINO，首次使用时自动导出并缓存
+        self.backend_combo = QComboBox()
+        for backend, name in inference_backend.BACKENDS.items():
+            self.backend_combo.addItem(name, backend)
+        self.backend_combo.setCurrentIndex(max(0, self.backend_combo.findData(self.current_backend)))
+        self.backend_combo.currentIndexChanged.connect(self.backend_changed)
+        model_layout.addRow("后端:", self.backend_combo)
+        
         # 置信度滑块
         self.conf_slider = QSlider(Qt.Horizontal)
         self.conf_slider.setRange(1, 100)
@@ -332,6 +456,69 @@ class YOLODetectorGUI(QMainWindow):
         self.save_results_checkbox.stateChanged.connect(self.toggle_save_results)
         model_layout.addRow("保存选项:", self.save_results_checkbox)
         
+        # 保存方式：只保存有目标的帧 / 全部帧 / 分段视频
+        self.save_mode_combo = QComboBox()
+        self.save_mode_combo.addItem("有检测目标的帧", SAVE_DETECTIONS)
+        self.save_mode_combo.addItem("全部帧", SAVE_ALL)
+        self.save_mode_combo.addItem("视频片段", SAVE_VIDEO)
+        self.save_mode_combo.setCurrentIndex(
+            max(0, self.save_mode_combo.findData(PredictionConfig.save_mode)))
+        model_layout.addRow("保存方式:", self.save_mode_combo)
+        
+        # 每隔N帧保存一次
+        self.save_every_spin = QSpinBox()
+        self.save_every_spin.setRange(1, 1000)
+        self.save_every_spin.setValue(PredictionConfig.save_every_n)
+        self.save_every_spin.setSuffix(" 帧")
+        model_layout.addRow("保存间隔:", self.save_every_spin)
+        
+        # 事件片段录制：检测到火灾/烟雾时保存前后几秒的视频
+        self.record_clips_checkbox = QCheckBox("录制事件片段")
+        self.record_clips_checkbox.setToolTip(
+            f"检测到火灾/烟雾时保存前 {PredictionConfig.clip_pre_seconds} 秒"
+            f"和后 {PredictionConfig.clip_post_seconds} 秒的视频到clips目录")
+        model_layout.addRow("录制选项:", self.record_clips_checkbox)
+        
+        # 检测事件日志：逐帧检测框按列批量写入，便于按天统计
+        self.event_log_checkbox = QCheckBox("记录检测事件日志")
+        self.event_log_checkbox.setChecked(PredictionConfig.event_log)
+        self.event_log_checkbox.setToolTip(
+            f"把每个检测框（时间、类别、置信度、坐标、跟踪ID）批量写入 {PredictionConfig.event_log_dir} 目录，"
+            "按日期分目录，按行数/时长轮转")
+        model_layout.addRow("", self.event_log_checkbox)
+        
+        # 运动门控：固定摄像头画面静止时跳过推理，复用上一帧的检测结果
+        self.motion_gate_checkbox = QCheckBox("静止画面跳过推理")
+        self.motion_gate_checkbox.setChecked(PredictionConfig.motion_gate)
+        self.motion_gate_checkbox.setToolTip(
+            f"画面变化像素比例低于 {PredictionConfig.motion_threshold:.2%} 时复用上一帧结果，"
+            f"每 {PredictionConfig.motion_keyframe_interval} 帧至少推理一次")
+        model_layout.addRow("推理选项:", self.motion_gate_checkbox)
+        
+        # 自适应步长：推理跟不上时隔帧检测，检测到火灾/烟雾后恢复逐帧
+        self.adaptive_stride_checkbox = QCheckBox("负载自适应检测步长")
+        self.adaptive_stride_checkbox.setChecked(PredictionConfig.adaptive_stride)
+        self.adaptive_stride_checkbox.setToolTip(
+            f"根据推理耗时调整检测步长和输入尺寸，使延迟保持在 {PredictionConfig.target_latency_ms} ms 左右；"
+            f"检测到火灾/烟雾后 {PredictionConfig.boost_seconds:g} 秒内逐帧检测")
+        model_layout.addRow("", self.adaptive_stride_checkbox)
+        
+        # 分块推理：高分辨率画面切成重叠分块检测，避免远处小目标在缩放后消失
+        self.tiled_checkbox = QCheckBox("高分辨率分块检测")
+        self.tiled_checkbox.setChecked(PredictionConfig.tiled)
+        self.tiled_checkbox.setToolTip(
+            f"将画面切成 {PredictionConfig.tile_size} 像素的重叠分块批量检测，适合4K广角摄像头中远处的烟雾；"
+            + ("只检测整帧粗检框附近的分块" if PredictionConfig.tile_roi_only else "计算量随分辨率增加"))
+        model_layout.addRow("", self.tiled_checkbox)
+        
+        # 结果缓存：反复检测同一视频/图片时直接返回已保存的检测框
+        self.result_cache_checkbox = QCheckBox("缓存推理结果")
+        self.result_cache_checkbox.setChecked(PredictionConfig.result_cache)
+        self.result_cache_checkbox.setToolTip(
+            f"按模型、参数和帧内容缓存检测框到 {PredictionConfig.result_cache_dir} 目录，"
+            "重复检测相同的视频或图片时不再推理")
+        model_layout.addRow("", self.result_cache_checkbox)
+        
         # 检测控制组
         control_group = QGroupBox("检测控制")
         control_layout = QVBoxLayout(control_group)
@@ -368,7 +555,7 @@ class YOLODetectorGUI(QMainWindow):
         stats_group = QGroupBox("检测统计")
         stats_layout = QVBoxLayout(stats_group)
         
-        self.stats_table = QTableWidget(0, 2)  # 0行，2列
+        self.stats_table = QTableWidget(0, 3)  # 0行，3列
         self.stats_table.setStyleSheet("""
             QTableWidget {
                 border: 1px solid #E0E0E0;
@@ -386,9 +573,11 @@ class YOLODetectorGUI(QMainWindow):
                 padding: 6px;
             }
         """)
-        self.stats_table.setHorizontalHeaderLabels(["目标类别", "检测数量"])
+        self.stats_table.setHorizontalHeaderLabels(["目标类别", "检测数量", "持续目标"])
         self.stats_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
         self.stats_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.stats_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        self.stats_table.horizontalHeaderItem(2).setToolTip("跟踪确认的目标数，一闪而过的误检不计入")
         stats_layout.addWidget(self.stats_table)
         
         # 添加所有组到左侧布局
@@ -464,6 +653,22 @@ class YOLODetectorGUI(QMainWindow):
         self.fps_label = QLabel("FPS: 0")
         self.statusbar.addPermanentWidget(self.fps_label)
         
+        # 显示渲染/丢弃帧数
+        self.display_stats_label = QLabel("")
+        self.statusbar.addPermanentWidget(self.display_stats_label)
+        
+        # 保存队列状态
+        self.save_stats_label = QLabel("")
+        self.statusbar.addPermanentWidget(self.save_stats_label)
+        
+        # 告警状态（由跟踪结果驱动，已去抖）
+        self.alarm_label = QLabel("")
+        self.statusbar.addPermanentWidget(self.alarm_label)
+        
+        # 各流水线阶段FPS显示
+        self.stage_fps_label = QLabel("")
+        self.statusbar.addPermanentWidget(self.stage_fps_label)
+        
         # 分辨率显示
         self.resolution_label = QLabel("分辨率: 0x0")
         self.statusbar.addPermanentWidget(self.resolution_label)
@@ -527,6 +732,8 @@ class YOLODetectorGUI(QMainWindow):
             self.open_video()
         elif index == 2:  # 图片文件
             self.open_image()
+        elif index == 3:  # 图片文件夹
+            self.open_folder()
             
     def model_changed(self, index):
         """模型变化处理"""
@@ -540,6 +747,44 @@ class YOLODetectorGUI(QMainWindow):
             self.model_path_label.setText(self.current_model)
             self.log_info(f"选择模型: {self.current_model}")
             self.model_status.setText("模型加载: ✗")
+            self.preload_model(model_path)
+            
+    def backend_changed(self, index):
+        """推理后端变化处理"""
+        backend = self.backend_combo.itemData(index)
+        if not backend:
+            return
+        self.current_backend = backend
+        self.log_info(f"选择推理后端: {self.backend_combo.currentText()}")
+        self.model_status.setText("模型加载: ✗")
+        self.preload_model(self.current_model)
+        
+    def preload_model(self, model_path):
+        """在后台加载并预热选中的模型，开始检测时直接命中缓存"""
+        if not os.path.exists(model_path):
+            return
+        if model_cache.get_registry().is_cached(model_path, backend=self.current_backend):
+            self.model_status.setText("模型加载: ✓")
+            return
+        self.model_status.setText("模型加载: …")
+        if self.current_backend != inference_backend.BACKEND_TORCH:
+            self.log_info("首次使用该后端时需要导出模型，请稍候...")
+        model_cache.preload_model(
+            model_path,
+            backend=self.current_backend,
+            callback=lambda path, error: self.model_preloaded.emit(path, str(error) if error else ""),
+        )
+        
+    def on_model_preloaded(self, model_path, error):
+        """后台预加载完成"""
+        if error:
+            self.log_info(f"预加载模型失败: {error}")
+            if model_path == self.current_model:
+                self.model_status.setText("模型加载: ✗")
+            return
+        self.log_info(f"模型已预加载: {model_path}")
+        if model_path == self.current_model:
+            self.model_status.setText("模型加载: ✓")
             
     def scan_available_models(self):
         """扫描weights目录下可用的模型文件"""
@@ -554,10 +799,10 @@ class YOLODetectorGUI(QMainWindow):
                 os.makedirs(weights_dir)
                 self.log_info(f"创建weights目录: {weights_dir}")
                 
-            # 搜索weights目录下的所有.pt文件
+            # 搜索weights目录下的所有.pt文件，以及quantize.py发布的INT8模型（.onnx / OpenVINO目录）
             if os.path.exists(weights_dir) and os.path.isdir(weights_dir):
                 for file in os.listdir(weights_dir):
-                    if file.endswith(".pt"):
+                    if file.endswith((".pt", ".onnx", "_openvino_model")):
                         model_path = os.path.join("weights", file)
                         model_files.append(model_path)
                         self.log_info(f"找到模型: {model_path}")
@@ -613,59 +858,56 @@ class YOLODetectorGUI(QMainWindow):
                 # 加载并显示图片预览
                 self.load_image_preview(file_path)
                 
+        elif current_source == 3:  # 图片文件夹
+            self.open_folder()
+                
+    def show_preview_frame(self, frame):
+        """把BGR帧转换为QPixmap并显示（缓存中的帧是只读的，颜色转换会生成新数组）"""
+        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        h, w, ch = frame_rgb.shape
+        bytes_per_line = ch * w
+        q_img = QImage(frame_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
+        pixmap = QPixmap.fromImage(q_img)
+        self.display_image(pixmap)
+        
     def load_video_preview(self, video_path):
-        """加载视频的第一帧作为预览"""
+        """加载视频的第一帧作为预览（同一文件只打开一次）"""
         try:
-            cap = cv2.VideoCapture(video_path)
-            if cap.isOpened():
-                ret, frame = cap.read()
-                if ret:
-                    # 获取视频信息
-                    fps = cap.get(cv2.CAP_PROP_FPS)
-                    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-                    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                    
-                    # 更新分辨率标签
-                    self.resolution_label.setText(f"分辨率: {width}x{height}")
-                    
-                    # 记录视频信息
-                    self.log_info(f"视频信息: {width}x{height}, {fps:.2f}fps, {frame_count}帧")
-                    
-                    # 转换帧为QPixmap并显示
-                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    h, w, ch = frame_rgb.shape
-                    bytes_per_line = ch * w
-                    q_img = QImage(frame_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-                    pixmap = QPixmap.fromImage(q_img)
-                    self.display_image(pixmap)
-                cap.release()
+            frame, info = get_frame_cache().video_preview(video_path)
+            if frame is None:
+                return False
+            # 更新分辨率标签
+            self.resolution_label.setText(f"分辨率: {info['width']}x{info['height']}")
+            
+            # 记录视频信息
+            self.log_info(f"视频信息: {info['width']}x{info['height']}, {info['fps']:.2f}fps, "
+                          f"{info['frame_count']}帧")
+            self.show_preview_frame(frame)
+            return True
         except Exception as e:
             self.log_info(f"无法加载视频预览: {str(e)}")
+            return False
             
     def load_image_preview(self, image_path):
-        """加载图片预览"""
+        """加载图片预览：按显示需要缩小解码，同时在后台解码全尺寸图片供检测使用"""
         try:
-            img = cv2.imread(image_path)
-            if img is not None:
-                # 获取图片尺寸
-                height, width = img.shape[:2]
-                
-                # 更新分辨率标签
-                self.resolution_label.setText(f"分辨率: {width}x{height}")
-                
-                # 记录图片信息
-                self.log_info(f"图片尺寸: {width}x{height}")
-                
-                # 转换为RGB并显示
-                img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                h, w, ch = img_rgb.shape
-                bytes_per_line = ch * w
-                q_img = QImage(img_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-                pixmap = QPixmap.fromImage(q_img)
-                self.display_image(pixmap)
+            cache = get_frame_cache()
+            img, size = cache.preview(image_path)
+            if img is None:
+                return False
+            cache.prefetch([image_path])
+            width, height = size
+            
+            # 更新分辨率标签
+            self.resolution_label.setText(f"分辨率: {width}x{height}")
+            
+            # 记录图片信息
+            self.log_info(f"图片尺寸: {width}x{height}")
+            self.show_preview_frame(img)
+            return True
         except Exception as e:
             self.log_info(f"无法加载图片预览: {str(e)}")
+            return False
             
     def conf_changed(self, value):
         """置信度变化处理"""
@@ -688,15 +930,28 @@ class YOLODetectorGUI(QMainWindow):
         
         if file_path:
             # 显示图片
-            pixmap = QPixmap(file_path)
-            if not pixmap.isNull():
-                self.display_image(pixmap)
+            if self.load_image_preview(file_path):
                 self.source_file = file_path
                 self.source_combo.setCurrentIndex(2)  # 设置为图片文件
-                self.resolution_label.setText(f"分辨率: {pixmap.width()}x{pixmap.height()}")
                 self.log_info(f"打开图片: {file_path}")
                 self.set_status("图片已加载，可以开始检测", "#4CAF50")  # 绿色
                 
+    def open_folder(self):
+        """选择要批量检测的图片文件夹"""
+        folder = QFileDialog.getExistingDirectory(self, "选择图片文件夹", "")
+        if folder:
+            paths = collect_images(folder)
+            count = len(paths)
+            if paths:
+                # 显示第一张，后台预取后续图片的预览
+                self.load_image_preview(paths[0])
+                get_frame_cache().prefetch_previews(paths[1:PredictionConfig.folder_prefetch])
+            self.input_path_label.setText(folder)
+            self.source_file = folder
+            self.source_combo.setCurrentIndex(3)  # 设置为图片文件夹
+            self.log_info(f"打开图片文件夹: {folder}（{count} 张图片）")
+            self.set_status("图片文件夹已选择，可以开始批量检测", "#4CAF50")  # 绿色
+            
     def open_video(self):
         """打开视频文件"""
         file_path, _ = QFileDialog.getOpenFileName(
@@ -705,25 +960,9 @@ class YOLODetectorGUI(QMainWindow):
         
         if file_path:
             self.log_info(f"打开视频: {file_path}")
-            # 打开视频并显示第一帧
-            cap = cv2.VideoCapture(file_path)
-            if cap.isOpened():
-                ret, frame = cap.read()
-                if ret:
-                    height, width = frame.shape[:2]
-                    self.resolution_label.setText(f"分辨率: {width}x{height}")
-                    self.log_info(f"视频分辨率: {width}x{height}")
-                    
-                    # 转换并显示第一帧
-                    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    h, w, ch = rgb_frame.shape
-                    bytes_per_line = ch * w
-                    q_img = QImage(rgb_frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
-                    pixmap = QPixmap.fromImage(q_img)
-                    self.display_image(pixmap)
-                    self.set_status("视频已加载，可以开始检测", "#4CAF50")  # 绿色
-                    
-                cap.release()
+            # 显示第一帧
+            if self.load_video_preview(file_path):
+                self.set_status("视频已加载，可以开始检测", "#4CAF50")  # 绿色
                 
             self.source_file = file_path
             self.source_combo.setCurrentIndex(1)  # 设置为视频文件
@@ -787,6 +1026,7 @@ class YOLODetectorGUI(QMainWindow):
         try:
             # 根据输入源类型设置
             is_camera = False
+            batch_resume = True
             if source_index == 0:  # 摄像头
                 source = 0
                 is_camera = True
@@ -829,12 +1069,43 @@ class YOLODetectorGUI(QMainWindow):
                     
                 source = input_path
                 self.log_info(f"使用图片文件作为输入源: {input_path}")
+            elif source_index == 3:  # 图片文件夹
+                input_path = self.input_path_label.text()
+                if not input_path:
+                    input_path = QFileDialog.getExistingDirectory(self, "选择图片文件夹", "")
+                    if not input_path:
+                        self.log_info("未选择图片文件夹")
+                        return
+                    self.input_path_label.setText(input_path)
+                
+                if not os.path.isdir(input_path):
+                    QMessageBox.warning(self, "文件错误", f"无法访问图片文件夹: {input_path}")
+                    return
+                
+                # 已有上次的结果时询问续跑还是重新检测，否则再次运行会跳过全部图片
+                output = VideoThread.folder_output(input_path)
+                if os.path.exists(output) and os.path.getsize(output) > 0:
+                    box = QMessageBox(self)
+                    box.setWindowTitle("批量检测")
+                    box.setText(f"已存在该文件夹的检测结果:\n{output}\n\n继续上次的检测，还是覆盖后重新检测？")
+                    resume_button = box.addButton("继续上次", QMessageBox.AcceptRole)
+                    overwrite_button = box.addButton("重新检测", QMessageBox.DestructiveRole)
+                    box.addButton("取消", QMessageBox.RejectRole)
+                    box.exec_()
+                    if box.clickedButton() not in (resume_button, overwrite_button):
+                        self.log_info("已取消批量检测")
+                        return
+                    batch_resume = box.clickedButton() is resume_button
+                    
+                source = input_path
+                self.log_info(f"批量检测图片文件夹: {input_path}")
             else:
                 self.log_info("未知输入源类型")
                 return
                 
             # 创建并启动视频线程
             self.clear_detection_stats()
+            self.display_converter = utils.DisplayConverter()
             self.detection_running = True
             
             # 禁用控制按钮
@@ -843,15 +1114,59 @@ class YOLODetectorGUI(QMainWindow):
             self.set_status("正在检测中...", "#4CAF50")  # 绿色
             self.model_status.setText("模型加载: ✓")
             
+            # 创建事件片段录制器（仅视频和摄像头）
+            self.clip_recorder = None
+            if self.record_clips_checkbox.isChecked() and source_index in (0, 1):
+                self.clip_recorder = ClipRecorder(
+                    save_dir=os.path.join(os.getcwd(), "clips"),
+                    fps=PredictionConfig.clip_fps,
+                    pre_seconds=PredictionConfig.clip_pre_seconds,
+                    post_seconds=PredictionConfig.clip_post_seconds,
+                    max_width=PredictionConfig.clip_max_width,
+                    trigger=DetectionTrigger(
+                        min_conf=PredictionConfig.clip_min_conf,
+                        min_hits=PredictionConfig.clip_min_hits,
+                        window=PredictionConfig.clip_window,
+                    ),
+                    on_saved=self.clip_saved.emit,
+                )
+                self.log_info(f"事件片段录制已开启，保存到: {self.clip_recorder.save_dir}")
+            
+            # 创建结果写入器
+            if self.save_detection_results:
+                self.start_result_writer()
+            
+            # 创建检测事件日志（仅视频和摄像头）
+            self.event_sink = None
+            if self.event_log_checkbox.isChecked() and source_index in (0, 1):
+                self.event_sink = create_event_sink(metadata={'model': model_path, 'source': str(source)})
+                self.log_info(f"检测事件日志将写入: {self.event_sink.out_dir}")
+            
+            # 运动门控与自适应调度（仅视频和摄像头）
+            motion_gate = None
+            if self.motion_gate_checkbox.isChecked() and source_index in (0, 1):
+                motion_gate = create_motion_gate()
+            scheduler = None
+            if self.adaptive_stride_checkbox.isChecked() and source_index in (0, 1):
+                scheduler = create_scheduler(
+                    fixed_imgsz=self.current_backend == inference_backend.BACKEND_OPENVINO)
+            
             # 创建视频处理线程
-            self.video_thread = VideoThread(source, model_path, self.confidence)
+            self.video_thread = VideoThread(source, model_path, self.confidence,
+                                            recorder=self.clip_recorder, writer=self.result_writer,
+                                            backend=self.current_backend, motion_gate=motion_gate,
+                                            scheduler=scheduler, tiled=self.tiled_checkbox.isChecked(),
+                                            event_sink=self.event_sink,
+                                            result_cache=self.result_cache_checkbox.isChecked(),
+                                            batch_resume=batch_resume)
             self.video_thread.set_source(source, is_camera)
             
             # 设置信号连接
             self.setup_video_thread_connections()
             
-            # 启动线程
+            # 启动线程和显示定时器
             self.video_thread.start()
+            self.start_display_timer()
             
         except Exception as e:
             self.detection_running = False
@@ -860,9 +1175,10 @@ class YOLODetectorGUI(QMainWindow):
             
     def setup_video_thread_connections(self):
         """设置视频线程的信号连接"""
-        self.video_thread.update_frame.connect(self.update_display)
         self.video_thread.update_fps.connect(self.update_fps)
+        self.video_thread.update_stage_stats.connect(self.update_stage_stats)
         self.video_thread.update_status.connect(self.set_status)  # 连接状态更新信号
+        self.video_thread.alarm_event.connect(self.on_alarm_event)
                     
     def stop_detection(self):
         """停止检测"""
@@ -870,62 +1186,143 @@ class YOLODetectorGUI(QMainWindow):
             self.log_info("停止检测")
             self.video_thread.stop()
             
+        self.display_timer.stop()
+        self.stop_result_writer()
+        self.stop_clip_recorder()
+        self.stop_event_sink()
+        self.log_display_stats()
+        self.log_result_cache_stats()
         self.start_button.setEnabled(True)
         self.stop_button.setEnabled(False)
         self.detection_running = False
         self.set_status("就绪", "#CCCCCC")  # 灰色
         
+    def start_display_timer(self):
+        """按显示器刷新率（不超过配置上限）启动显示定时器"""
+        refresh_rate = PredictionConfig.display_fps
+        screen = QApplication.primaryScreen()
+        if screen is not None and screen.refreshRate() > 0:
+            refresh_rate = min(refresh_rate, screen.refreshRate())
+        self.display_timer.start(max(1, int(1000 / refresh_rate)))
+        
+    def pull_latest_frame(self):
+        """从检测线程的邮箱中取最新一帧显示，没有新帧时不重绘"""
+        if not self.video_thread:
+            return
+        item = self.video_thread.mailbox.take()
+        if item is not None:
+            self.update_display(*item)
+            
     def update_display(self, frame, results):
         """更新显示画面和检测结果"""
         if not self.detection_running:
             return
             
-        # 使用YOLO结果绘制框
-        processed_img = None
-        if results and len(results) > 0:
-            # 获取第一个结果（通常只有一个）
-            result = results[0]
-            # 在图像上绘制检测框
-            processed_img = result.plot()
-            
-            # 更新检测统计
+        # 获取第一个结果（通常只有一个）
+        result = results[0] if results else None
+        
+        # 更新检测统计
+        if result is not None:
             self.update_detection_stats(results)
             
-            # 如果启用了保存功能，保存处理后的图像
-            if self.save_detection_results:
-                self.save_detection_image(processed_img)
-        else:
-            processed_img = frame
-            
-        # 转换为RGB并显示
-        img_rgb = cv2.cvtColor(processed_img, cv2.COLOR_BGR2RGB)
-        h, w, ch = img_rgb.shape
-        bytes_per_line = ch * w
-        q_img = QImage(img_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(q_img)
-        
-        # 显示图像
-        self.display_image(pixmap)
+        # 先缩放到显示区域大小，再在小图上绘制检测框并转换，避免整帧拷贝
+        size = self.display_label.contentsRect().size()
+        pixmap = self.display_converter.to_pixmap(frame, result, size.width(), size.height())
+        self.display_label.setPixmap(pixmap)
+        
+    def start_result_writer(self):
+        """按当前保存选项创建后台结果写入器"""
+        self.result_writer = ResultWriter(
+            save_dir=os.path.join(os.getcwd(), "results"),
+            mode=self.save_mode_combo.currentData(),
+            every_n=self.save_every_spin.value(),
+            workers=PredictionConfig.save_workers,
+            queue_size=PredictionConfig.save_queue_size,
+        )
+        self.log_info(f"检测结果将保存到: {self.result_writer.save_dir}")
+        if self.video_thread and self.video_thread.isRunning():
+            self.video_thread.writer = self.result_writer
         
-    def save_detection_image(self, image):
-        """保存处理后的检测图像"""
-        try:
-            # 创建results目录（如果不存在）
-            save_dir = os.path.join(os.getcwd(), "results")
-            if not os.path.exists(save_dir):
-                os.makedirs(save_dir)
-                
-            # 生成文件名（使用时间戳）
-            timestamp = int(cv2.getTickCount() / cv2.getTickFrequency() * 1000)
-            filename = f"detection_{timestamp}.jpg"
-            save_path = os.path.join(save_dir, filename)
+    def stop_result_writer(self):
+        """写完剩余结果并关闭写入器"""
+        if self.result_writer is None:
+            return
+        if self.video_thread:
+            self.video_thread.writer = None
+        self.result_writer.close()
+        stats = self.result_writer.stats()
+        self.log_info(
+            f"检测结果保存完成: 已写入 {stats['written']}，丢弃 {stats['dropped']}，"
+            f"跳过 {stats['skipped']}，错误 {stats['errors']}"
+        )
+        if self.result_writer.last_error:
+            self.log_info(f"保存检测结果出错: {self.result_writer.last_error}")
+        self.result_writer = None
+        self.save_stats_label.setText("")
             
-            # 保存图像
-            cv2.imwrite(save_path, image)
-            self.log_info(f"已保存检测结果: {save_path}")
+    def stop_clip_recorder(self):
+        """结束正在录制的片段并关闭录制器"""
+        if self.clip_recorder is None:
+            return
+        self.clip_recorder.close()
+        stats = self.clip_recorder.stats()
+        if stats['dropped_clips'] or stats['dropped_frames']:
+            self.log_info(f"事件片段录制: 丢弃片段 {stats['dropped_clips']}，丢弃帧 {stats['dropped_frames']}")
+        self.clip_recorder = None
+        
+    def stop_event_sink(self):
+        """写入剩余的检测事件并关闭日志"""
+        if self.event_sink is None:
+            return
+        self.event_sink.close()
+        stats = self.event_sink.stats()
+        self.log_info(f"检测事件日志: 写入 {stats['rows']} 行，{stats['segments']} 个分段")
+        if self.event_sink.last_error:
+            self.log_info(f"写入检测事件日志出错: {self.event_sink.last_error}")
+        self.event_sink = None
+        
+    def log_display_stats(self):
+        """记录显示路径的拷贝和丢帧统计"""
+        stats = self.display_converter.stats()
+        if stats['frames'] == 0 or not self.video_thread:
+            return
+        mailbox = self.video_thread.mailbox.stats()
+        self.log_info(
+            f"显示统计: 渲染 {mailbox['rendered']} 帧，丢弃 {mailbox['dropped']} 帧，"
+            f"每帧拷贝 {stats['copies_per_frame']:.1f} 次（{stats['kb_per_frame']:.0f} KB）"
+        )
+        
+    def log_result_cache_stats(self):
+        """记录结果缓存的命中率"""
+        cached_model = self.video_thread.cached_model if self.video_thread else None
+        if cached_model is None:
+            return
+        stats = cached_model.cache_stats()
+        self.log_info(f"结果缓存: 命中 {stats['hits']}，未命中 {stats['misses']}（命中率 {stats['hit_rate']:.1%}）")
+        
+    def on_clip_saved(self, path, frame_count):
+        """事件片段写入完成"""
+        self.log_info(f"已保存事件片段: {path}（{frame_count} 帧）")
+        
+    def on_alarm_event(self, event):
+        """跟踪/告警事件：告警开始和结束写入日志"""
+        if event['type'] == EVENT_ALARM_START:
+            classes = sorted({track['class'] for track in event['tracks']})
+            ids = ", ".join(f"#{track['track_id']}" for track in event['tracks'])
+            self.log_info(f"⚠ 告警: 检测到持续的{'/'.join(classes)}（目标 {ids}）")
+        elif event['type'] == EVENT_ALARM_END:
+            self.log_info(f"告警解除，持续 {event['duration']:.1f} 秒")
             
-        except Exception as e:
-            self.log_info(f"保存检测结果出错: {str(e)}")
+    def update_alarm_label(self, snapshot):
+        """按告警状态更新状态栏"""
+        if snapshot['state'] == ALARM_ACTIVE:
+            self.alarm_label.setText(f"告警中（{len(snapshot['alarm_tracks'])} 个目标）")
+            self.alarm_label.setStyleSheet("color: #EA4335; font-weight: bold;")
+        elif snapshot['state'] == ALARM_COOLDOWN:
+            self.alarm_label.setText("告警冷却")
+            self.alarm_label.setStyleSheet("color: #FFA500;")
+        else:
+            self.alarm_label.setText("")
             
     def update_detection_stats(self, results):
         """更新检测统计信息"""
@@ -948,6 +1345,15 @@ class YOLODetectorGUI(QMainWindow):
                     else:
                         current_counts[cls_name] = 1
             
+            # 跟踪确认的持续目标数
+            tracker = self.video_thread.tracker if self.video_thread else None
+            snapshot = tracker.snapshot() if tracker else None
+            confirmed = snapshot['confirmed'] if snapshot else {}
+            for cls_name in confirmed:
+                current_counts.setdefault(cls_name, 0)
+            if snapshot:
+                self.update_alarm_label(snapshot)
+            
             # 更新统计表格
             self.stats_table.setRowCount(len(current_counts))
             
@@ -961,6 +1367,11 @@ class YOLODetectorGUI(QMainWindow):
                 count_item.setTextAlignment(Qt.AlignCenter)
                 self.stats_table.setItem(row, 1, count_item)
                 
+                # 持续目标数（未启用跟踪时显示为 -）
+                tracked_item = QTableWidgetItem(str(confirmed.get(cls_name, 0)) if snapshot else "-")
+                tracked_item.setTextAlignment(Qt.AlignCenter)
+                self.stats_table.setItem(row, 2, tracked_item)
+                
             # 保存当前统计结果
             self.last_detection_counts = current_counts
             
@@ -971,22 +1382,73 @@ class YOLODetectorGUI(QMainWindow):
         """清空检测统计"""
         self.last_detection_counts = {}
         self.stats_table.setRowCount(0)
+        self.alarm_label.setText("")
             
     def update_fps(self, fps):
         """更新FPS显示"""
         self.fps_label.setText(f"FPS: {int(fps)}")
         
+        # 显示落后程度：检测输出但未被显示（被新帧覆盖）的帧数
+        if self.video_thread:
+            mailbox = self.video_thread.mailbox.stats()
+            self.display_stats_label.setText(f"显示: {mailbox['rendered']} 丢弃: {mailbox['dropped']}")
+            self.display_stats_label.setToolTip(
+                f"检测输出 {mailbox['posted']} 帧，界面渲染 {mailbox['rendered']} 帧，"
+                f"未显示即被覆盖 {mailbox['dropped']} 帧")
+        
+        # 顺便刷新保存队列状态（每秒一次）
+        if self.result_writer is not None:
+            stats = self.result_writer.stats()
+            self.save_stats_label.setText(
+                f"保存队列: {stats['queue_depth']}/{stats['queue_size']} "
+                f"已写入: {stats['written']} 丢弃: {stats['dropped']}"
+            )
+        
+    def update_stage_stats(self, stats):
+        """更新各流水线阶段的FPS显示"""
+        text = (
+            f"采集 {stats['capture']['fps']:.0f} / "
+            f"推理 {stats['inference']['fps']:.0f} / "
+            f"后处理 {stats['postprocess']['fps']:.0f} FPS"
+        )
+        tooltip = (
+            f"采集耗时: {stats['capture']['latency_ms']:.1f} ms\n"
+            f"推理耗时: {stats['inference']['latency_ms']:.1f} ms\n"
+            f"后处理耗时: {stats['postprocess']['latency_ms']:.1f} ms\n"
+            f"丢弃帧数: {stats['dropped']}"
+        )
+        scheduler = stats.get('scheduler')
+        if scheduler:
+            text += f" | 步长 {scheduler['stride']} @ {scheduler['imgsz']}"
+            tooltip += (f"\n自适应调度: 推理 {scheduler['inference_ms']:.1f} ms，"
+                        f"端到端延迟 {scheduler['latency_ms']:.0f} ms，源 {scheduler['source_fps']:.0f} FPS，"
+                        f"跳过 {scheduler['skipped']} 帧" + ("（检测到目标，逐帧检测中）" if scheduler['boosting'] else ""))
+        motion = stats.get('motion')
+        if motion:
+            text += f" | 跳过 {motion['skip_rate']:.0%}"
+            tooltip += (f"\n运动门控: 已检查 {motion['checked']} 帧，跳过 {motion['skipped']} 帧，"
+                        f"强制关键帧 {motion['keyframes']} 次")
+        self.stage_fps_label.setText(text)
+        self.stage_fps_label.setToolTip(tooltip)
+        
     def closeEvent(self, event):
         """窗口关闭事件处理"""
         # 关闭窗口时停止线程
         if self.video_thread and self.video_thread.isRunning():
             self.video_thread.stop()
+        self.stop_result_writer()
+        self.stop_clip_recorder()
+        self.stop_event_sink()
         event.accept()
 
     def toggle_save_results(self, state):
         """切换是否保存检测结果"""
         self.save_detection_results = bool(state)
         self.log_info(f"{'启用' if self.save_detection_results else '禁用'}检测结果保存")
+        if not self.save_detection_results:
+            self.stop_result_writer()
+        elif self.detection_running and self.result_writer is None:
+            self.start_result_writer()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)